@@ -0,0 +1,233 @@
+"""Замеры скорости по фазам шага logic() и отрисовки draw_scene().
+
+Для каждой комбинации топологии, матрицы взаимодействий и числа частиц
+мир масштабируется так, чтобы плотность частиц оставалась как в окне
+1920x1040 с NODE_COUNT частицами. Каждая фаза из physics.PHASES
+замеряется отдельно, draw_scene() - на скрытой поверхности (драйвер SDL
+dummy), если мир не больше --draw-max-pixels.
+
+Пример:
+    python bench.py --counts 500,2000,10000,50000 --out bench.json
+    python bench.py --out new.json --compare bench.json
+"""
+import argparse
+import json
+import math as meth
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+import physics
+
+# Матрицы взаимодействий для замеров (3x3; при --types K повторяются на K x K,
+# "default" - таблица random_types())
+COUPLINGS = {
+    "default": [row[:] for row in physics.COUPLING],
+    "attract": [[1, 1, 1], [1, 1, 1], [1, 1, 1]],
+    "repel": [[-1, -1, -1], [-1, -1, -1], [-1, -1, -1]],
+    "mixed": [[1, -1, 0.5], [-0.5, 1, -1], [1, 0.5, -1]],
+}
+TOPOLOGIES = ("bounded", "torus")
+BASE_WIDTH = 1920
+BASE_HEIGHT = 1040
+
+
+def coupling_matrix(name, k):
+    """Матрица name для k типов: повторение матрицы из COUPLINGS"""
+    base = np.array(COUPLINGS[name], dtype=np.float64)
+    reps = -(-k // len(base))
+    return np.tile(base, (reps, reps))[:k, :k].tolist()
+
+
+def world_size(count):
+    """Размер мира с плотностью как у NODE_COUNT частиц в BASE_WIDTH x BASE_HEIGHT"""
+    scale = meth.sqrt(count / physics.NODE_COUNT)
+    return int(BASE_WIDTH * scale), int(BASE_HEIGHT * scale)
+
+
+def summary(samples):
+    """Статистика замеров в миллисекундах"""
+    ms = [s * 1000 for s in samples]
+    return {
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "median_ms": round(statistics.median(ms), 4),
+        "min_ms": round(min(ms), 4),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def open_display(size):
+    """Окно sim.py на скрытой поверхности; None, если pygame недоступен"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    try:
+        import sim
+    except ImportError:
+        return None
+    sim.open_window((size[0], size[1] + sim.STATUS_HEIGHT))
+    return sim
+
+
+def run_case(topology, coupling, count, args):
+    """Один замер: прогрев, затем steps шагов с замером каждой фазы"""
+    w, h = world_size(count)
+    sim = None
+    if args.draw and w * h <= args.draw_max_pixels:
+        sim = open_display((w, h))
+    if sim is None:
+        physics.setup(w, h)
+    physics.seed(args.seed)
+    physics.set_coupling(coupling_matrix(coupling, len(physics.LINKS)))
+    physics.boundaries_enabled = topology == "bounded"
+    physics.NODE_COUNT = count
+    physics.init_simulation()
+
+    for _ in range(args.warmup):
+        physics.logic()
+
+    times = {name: [] for name, _ in physics.PHASES}
+    steps = []
+    draws = []
+    for _ in range(args.steps):
+        step_start = time.perf_counter()
+        for name, phase in physics.PHASES:
+            start = time.perf_counter()
+            phase()
+            times[name].append(time.perf_counter() - start)
+        steps.append(time.perf_counter() - step_start)
+        if sim is not None:
+            start = time.perf_counter()
+            sim.draw_scene()
+            draws.append(time.perf_counter() - start)
+
+    return {
+        "topology": topology,
+        "coupling": coupling,
+        "count": count,
+        "engine": physics.ENGINE,
+        "skin": physics.SKIN,
+        "precision": physics.PRECISION,
+        "types": len(physics.LINKS),
+        "world": [w, h],
+        "phases": {name: summary(samples) for name, samples in times.items()},
+        "step": summary(steps),
+        "draw": summary(draws) if draws else None,
+        "bonds": len(physics.bonds),
+    }
+
+
+def case_key(row):
+    return row["topology"], row["coupling"], row["count"], row["engine"], row.get("skin", 0), row.get("types", 3)
+
+
+def compare(old, new):
+    """Отношение новое/старое по медианам; > 1 - стало медленнее"""
+    before = {case_key(row): row for row in old["results"]}
+    for row in new["results"]:
+        prev = before.get(case_key(row))
+        if prev is None:
+            continue
+        parts = []
+        for name, value in row["phases"].items():
+            if name in prev["phases"] and prev["phases"][name]["median_ms"] > 0:
+                parts.append(f"{name} {value['median_ms'] / prev['phases'][name]['median_ms']:.2f}x")
+        parts.append(f"step {row['step']['median_ms'] / prev['step']['median_ms']:.2f}x")
+        if row["draw"] and prev["draw"]:
+            parts.append(f"draw {row['draw']['median_ms'] / prev['draw']['median_ms']:.2f}x")
+        print(" ".join(map(str, case_key(row))) + ": " + ", ".join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости шага и отрисовки")
+    parser.add_argument("--counts", default="500,2000,10000,50000",
+                        help="числа частиц через запятую")
+    parser.add_argument("--topology", choices=TOPOLOGIES + ("both",), default="both")
+    parser.add_argument("--couplings", default=",".join(COUPLINGS),
+                        help="матрицы через запятую: " + ", ".join(COUPLINGS))
+    parser.add_argument("--steps", type=int, default=10, help="шагов с замером")
+    parser.add_argument("--warmup", type=int, default=20, help="шагов прогрева (образование связей)")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора")
+    parser.add_argument("--engine", choices=("python", "numpy", "parallel"), default="numpy")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов для --engine parallel (по умолчанию - ядра)")
+    parser.add_argument("--types", type=int, default=None,
+                        help="число типов частиц со случайными таблицами (по умолчанию - 3 заданных)")
+    parser.add_argument("--skin", type=float, default=0,
+                        help="запас списка соседей в пикселях (0 - пары по сетке каждый шаг)")
+    parser.add_argument("--precision", choices=("f8", "f4"), default="f8",
+                        help="точность позиций и скоростей (f4 - вдвое меньше памяти)")
+    parser.add_argument("--no-draw", dest="draw", action="store_false",
+                        help="не замерять draw_scene()")
+    parser.add_argument("--draw-max-pixels", type=int, default=4096 * 4096,
+                        help="наибольшая площадь мира для замера отрисовки")
+    parser.add_argument("--out", metavar="PATH", help="записать результаты в JSON-файл")
+    parser.add_argument("--compare", metavar="PATH", help="сравнить с прошлыми результатами")
+    args = parser.parse_args(argv)
+
+    counts = [int(v) for v in args.counts.split(",")]
+    couplings = args.couplings.split(",")
+    for name in couplings:
+        if name not in COUPLINGS:
+            parser.error(f"неизвестная матрица: {name}")
+    topologies = TOPOLOGIES if args.topology == "both" else (args.topology,)
+    physics.ENGINE = args.engine
+    physics.WORKERS = args.workers
+    physics.SKIN = args.skin
+    physics.PRECISION = args.precision
+    if args.types is not None:
+        physics.seed(args.seed)
+        physics.set_types(*physics.random_types(args.types))
+        COUPLINGS["default"] = [row[:] for row in physics.COUPLING]
+
+    results = []
+    for topology in topologies:
+        for coupling in couplings:
+            for count in counts:
+                row = run_case(topology, coupling, count, args)
+                results.append(row)
+                draw = f"{row['draw']['median_ms']:.2f}" if row["draw"] else "-"
+                print(f"{topology} {coupling} {count}: "
+                      + ", ".join(f"{k} {v['median_ms']:.2f}" for k, v in row["phases"].items())
+                      + f", step {row['step']['median_ms']:.2f}, draw {draw} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "engine": args.engine,
+            "workers": args.workers,
+            "skin": args.skin,
+            "types": len(physics.LINKS),
+            "steps": args.steps,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from array import array
+import numpy as np
+from structures import Structures
+
+# Соседи частицы без связей. Соседи хранятся кортежами: степень ограничена
+# LINKS, а кортеж из 1-3 индексов в несколько раз меньше множества
+NO_BONDS = ()
+
+
+def _replace(nodes, old, new=()):
+    """Кортеж соседей nodes, где old заменен на new (по умолчанию - удален)"""
+    k = nodes.index(old)
+    return nodes[:k] + new + nodes[k + 1:]
+
+
+def _key(i, j):
+    """Ключ связи в slot: одно целое (min << 32 | max) вместо кортежа"""
+    return i << 32 | j if i < j else j << 32 | i
+
+
+class BondGraph:
+    """Граф связей между частицами хранилища.
+
+    Связи лежат в плоских массивах концов (a, b) для пакетных проходов,
+    словарь slot дает O(1) проверку и удаление связи, adj - кортежи
+    соседей каждой частицы (NO_BONDS у частиц без связей), type_count -
+    число связей частицы с каждым типом. Степень вершины пишется прямо
+    в столбец links хранилища, связные структуры ведет structures.
+    """
+
+    def __init__(self, store, ntypes):
+        self.store = store
+        self.ntypes = ntypes
+        self.a = array('q')
+        self.b = array('q')
+        self.slot = {}   # _key(i, j) -> позиция связи в a/b
+        self.adj = []
+        self.type_count = array('i')
+        self.structures = Structures(self.adj)
+
+    def __len__(self):
+        return len(self.a)
+
+    def __iter__(self):
+        """Связи как пары ссылок на частицы"""
+        store = self.store
+        return ((store[i], store[j]) for i, j in zip(self.a, self.b))
+
+    def linked(self, i, j):
+        return j in self.adj[i]
+
+    def count(self, i, t):
+        """Число связей частицы i с частицами типа t"""
+        return self.type_count[i * self.ntypes + t]
+
+    def views(self):
+        """NumPy-представления концов связей для пакетных проходов"""
+        return np.frombuffer(self.a, dtype=np.int64), np.frombuffer(self.b, dtype=np.int64)
+
+    def type_counts(self):
+        """Копия счетчиков связей по типам, форма (n, ntypes)"""
+        counts = np.frombuffer(self.type_count, dtype=np.int32)
+        return counts.reshape(-1, self.ntypes).astype(np.int64)
+
+    def add(self, i, j):
+        types = self.store.type
+        links = self.store.links
+        adj = self.adj
+        self.slot[_key(i, j)] = len(self.a)
+        self.a.append(i)
+        self.b.append(j)
+        adj[i] += (j,)
+        adj[j] += (i,)
+        self.type_count[i * self.ntypes + types[j]] += 1
+        self.type_count[j * self.ntypes + types[i]] += 1
+        links[i] += 1
+        links[j] += 1
+        self.structures.link(i, j)
+
+    def remove(self, i, j):
+        self.remove_slot(self.slot[_key(i, j)])
+
+    def remove_slot(self, s):
+        """Удаление связи по позиции: последняя связь переезжает на ее место"""
+        types = self.store.type
+        links = self.store.links
+        i = self.a[s]
+        j = self.b[s]
+        del self.slot[_key(i, j)]
+        last = len(self.a) - 1
+        if s != last:
+            li = self.a[last]
+            lj = self.b[last]
+            self.a[s] = li
+            self.b[s] = lj
+            self.slot[_key(li, lj)] = s
+        self.a.pop()
+        self.b.pop()
+        adj = self.adj
+        adj[i] = _replace(adj[i], j)
+        adj[j] = _replace(adj[j], i)
+        self.type_count[i * self.ntypes + types[j]] -= 1
+        self.type_count[j * self.ntypes + types[i]] -= 1
+        links[i] -= 1
+        links[j] -= 1
+        self.structures.unlink(i, j)
+
+    def remove_slots(self, slots):
+        """Удаление набора связей; позиции обрабатываются с конца"""
+        for s in sorted(slots, reverse=True):
+            self.remove_slot(s)
+
+    def add_node(self):
+        self.adj.append(NO_BONDS)
+        self.type_count.extend([0] * self.ntypes)
+        self.structures.add_nodes(1)
+
+    def add_nodes(self, k):
+        self.adj.extend([NO_BONDS] * k)
+        self.type_count.extend(array('i', bytes(4 * k * self.ntypes)))
+        self.structures.add_nodes(k)
+
+    def remove_node(self, i):
+        """Разрывает все связи частицы i (по возрастанию индекса партнера)"""
+        for j in sorted(self.adj[i]):
+            self.remove(i, j)
+
+    def move_node(self, src, dst):
+        """Частица src переехала на место dst (у dst связей уже нет)"""
+        k = self.ntypes
+        for j in self.adj[src]:
+            s = self.slot.pop(_key(src, j))
+            if self.a[s] == src:
+                self.a[s] = dst
+            else:
+                self.b[s] = dst
+            self.slot[_key(dst, j)] = s
+            self.adj[j] = _replace(self.adj[j], src, (dst,))
+        self.adj[dst] = self.adj[src]
+        self.type_count[dst * k:dst * k + k] = self.type_count[src * k:src * k + k]
+        self.structures.move(src, dst)
+
+    def pop_node(self):
+        self.adj.pop()
+        del self.type_count[-self.ntypes:]
+        self.structures.pop()
@@ -0,0 +1,254 @@
+"""Оценка памяти мира до запуска.
+
+estimate() складывает байты по частям состояния для числа частиц, числа
+связей на частицу и размера мира: столбцы частиц, граф связей, связные
+структуры, сетка, список соседей (SKIN > 0), снимки для отрисовки и
+временные массивы прохода сил, которые задают пик. Размеры объектов
+Python (кортежи соседей, словарь slot, множества структур) берутся из
+sys.getsizeof на этом интерпретаторе. Оценка рассчитана на движки
+"numpy" и "python" в одном процессе и не включает сам интерпретатор
+с NumPy (несколько десятков МБ).
+
+Число связей по умолчанию - насыщение: каждая частица держит LINKS своего
+типа. Реальный мир обычно связан меньше, так что оценка с запасом.
+
+Пример:
+    python capacity.py --count 2000000 --precision f4
+    python capacity.py --budget 4096 --precision f4 --skin 20
+    python capacity.py --count 100000 --measure --steps 20
+"""
+import argparse
+import json
+import math as meth
+import sys
+import time
+import tracemalloc
+import numpy as np
+import physics
+from bench import world_size
+from grid import PAIR_CHUNK
+
+# Запас array.array и list на рост при добавлении
+ARRAY_GROWTH = 1 + 1 / 16
+LIST_GROWTH = 1 + 1 / 8
+# Временных байт прохода сил на пару пакета (геометрия, силы, суммы по частицам)
+CHUNK_PAIR_BYTES = 240
+# Временных байт на связь, образованную за шаг (список formed и ключи пакета)
+FORMED_BOND_BYTES = 160
+
+PARTS = ("particles", "bonds", "structures", "grid", "neighbours", "snapshots")
+
+
+def _sizes():
+    """Размеры объектов Python на этом интерпретаторе"""
+    k = 1 << 12
+    return {
+        "int": sys.getsizeof(1 << 20),               # Индекс частицы
+        "key": sys.getsizeof(1 << 40),               # Ключ связи в slot
+        "tuple": sys.getsizeof(()),
+        "set": sys.getsizeof(set()),
+        "dict_entry": (sys.getsizeof(dict.fromkeys(range(k))) - sys.getsizeof({})) / k,
+        "set_entry": (sys.getsizeof(set(range(k))) - sys.getsizeof(set())) / k,
+    }
+
+
+def cells(width, height, cell_size, toroidal):
+    """Число клеток сетки SpatialHash"""
+    if toroidal:
+        return max(1, int(width // cell_size)) * max(1, int(height // cell_size))
+    return (int(width // cell_size) + 1) * (int(height // cell_size) + 1)
+
+
+def neighbour_pairs(count, width, height, reach):
+    """Пар ближе reach при равномерной плотности"""
+    return count * count * meth.pi * reach * reach / (2 * width * height)
+
+
+def estimate(count, width, height, bonds_per_particle=None, ntypes=None, dtype="f8",
+             skin=0, toroidal=False, snapshots=0, formed=None):
+    """Байты по частям мира и итоги.
+
+    bonds_per_particle по умолчанию - насыщение по LINKS, ntypes - число
+    типов physics. snapshots - сколько снимков Snapshot держится
+    одновременно (0 без окна, 2-3 у sim.py и stream.py). formed - связей,
+    образованных за один шаг (по умолчанию все: первый шаг после
+    случайной расстановки). Возвращает словарь с байтами частей из PARTS,
+    временных пиков (forces, migrate) и итогов steady и peak.
+    """
+    ntypes = ntypes or len(physics.LINKS)
+    if bonds_per_particle is None:
+        bonds_per_particle = sum(physics.LINKS) / len(physics.LINKS) / 2
+    item = np.dtype(dtype).itemsize
+    size = _sizes()
+    n = count
+    m = int(n * bonds_per_particle)
+    bonded = min(n, 2 * m)          # Частиц со связями - не больше двух на связь
+    formed = m if formed is None else formed
+
+    out = {}
+    # Столбцы x, y, sx, sy, type, links, счетчики по типам, номера структур, список adj
+    out["particles"] = (n * (4 * item + 1 + 4 + 4 * ntypes + 8) * ARRAY_GROWTH
+                        + n * 8 * LIST_GROWTH)
+    # Концы связей, slot (ключ, позиция), кортежи соседей и индексы в них
+    out["bonds"] = (m * 16 * ARRAY_GROWTH
+                    + m * (size["dict_entry"] + size["key"] + size["int"])
+                    + bonded * size["tuple"] + 2 * m * (8 + size["int"]))
+    # Множества частиц структур: в худшем случае все структуры - пары
+    out["structures"] = bonded * size["set_entry"] + bonded / 2 * size["set"]
+
+    ncell = cells(width, height, physics.MAX_DIST, toroidal)
+    if skin > 0:
+        # Свой индекс списка соседей с клетками MAX_DIST + SKIN, пары и опорные позиции
+        reach = physics.MAX_DIST + skin
+        pairs = neighbour_pairs(n, width, height, reach)
+        ncell = cells(width, height, reach, toroidal)
+        out["neighbours"] = pairs * 16 + n * 2 * item
+    else:
+        # Пары-кандидаты из окрестностей 3x3 клеток
+        pairs = n * n * 4.5 * physics.MAX_DIST ** 2 / (width * height)
+        out["neighbours"] = 0
+    # order и cell по частицам, границы клеток и пары соседних клеток
+    out["grid"] = n * 16 + ncell * 8 + ncell * 64
+    # Позиции и типы, концы связей, копия разбиения по клеткам
+    out["snapshots"] = snapshots * (n * (2 * item + 1 + 8) + m * 16 + ncell * 8)
+
+    chunk = min(PAIR_CHUNK, pairs)
+    # Типы, связи, счетчики по типам в int64, приращения скоростей, ключи связей,
+    # временные массивы пакета и новые связи шага
+    out["forces"] = (n * (16 + 8 * ntypes + 16) + m * 32 + chunk * CHUNK_PAIR_BYTES
+                     + formed * FORMED_BOND_BYTES)
+    # Номера клеток и сортировка при перестройке сетки
+    out["migrate"] = n * 32
+    if skin > 0:
+        # Сборка списка: отобранные пары пакетами и их склейка
+        out["migrate"] += pairs * 32
+
+    out["steady"] = sum(out[name] for name in PARTS)
+    out["peak"] = out["steady"] + max(out["forces"], out["migrate"])
+    return {name: int(value) for name, value in out.items()}
+
+
+def max_count(budget, width_for, **kwargs):
+    """Наибольшее число частиц, у которого пик не больше budget байт.
+
+    width_for(count) -> (width, height) - размер мира для числа частиц.
+    """
+    lo, hi = 0, 1
+    while estimate(hi, *width_for(hi), **kwargs)["peak"] <= budget:
+        lo, hi = hi, hi * 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if estimate(mid, *width_for(mid), **kwargs)["peak"] <= budget:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def measure(count, width, height, steps, dtype, skin, toroidal, seed, types=None):
+    """Память настоящего мира через tracemalloc: после шагов и пик.
+
+    types - число типов со случайными таблицами. Шаги под tracemalloc идут
+    в несколько раз медленнее обычного.
+    """
+    physics.seed(seed)
+    if types is not None:
+        physics.set_types(*physics.random_types(types))
+    physics.PRECISION = dtype
+    physics.SKIN = skin
+    physics.ENGINE = "numpy"
+    physics.NODE_COUNT = count
+    physics.boundaries_enabled = not toroidal
+    physics.setup(width, height)
+    tracemalloc.start()
+    start = time.perf_counter()
+    physics.init_simulation()
+    for _ in range(steps):
+        physics.logic()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "steady": current,
+        "peak": peak,
+        "bonds_per_particle": len(physics.bonds) / max(count, 1),
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+
+
+def mb(value):
+    return f"{value / 2 ** 20:10.1f} MB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Оценка памяти мира")
+    parser.add_argument("--count", type=int, default=physics.NODE_COUNT, help="число частиц")
+    parser.add_argument("--width", type=float, default=None,
+                        help="ширина мира (по умолчанию - с плотностью окна 1920x1040)")
+    parser.add_argument("--height", type=float, default=None, help="высота мира")
+    parser.add_argument("--bonds", type=float, default=None,
+                        help="связей на частицу (по умолчанию - насыщение по LINKS)")
+    parser.add_argument("--types", type=int, default=None, help="число типов частиц")
+    parser.add_argument("--precision", choices=("f8", "f4"), default="f8",
+                        help="точность позиций и скоростей")
+    parser.add_argument("--skin", type=float, default=0, help="запас списка соседей в пикселях")
+    parser.add_argument("--torus", action="store_true", help="торовая топология вместо границ")
+    parser.add_argument("--snapshots", type=int, default=0,
+                        help="снимков для отрисовки одновременно (sim.py, stream.py - 3)")
+    parser.add_argument("--budget", type=float, default=None, metavar="MB",
+                        help="вместо оценки - наибольшее число частиц в пределах бюджета")
+    parser.add_argument("--measure", action="store_true",
+                        help="построить мир и сверить оценку с tracemalloc")
+    parser.add_argument("--steps", type=int, default=20, help="шагов для --measure")
+    parser.add_argument("--seed", type=int, default=1, help="зерно для --measure")
+    parser.add_argument("--json", action="store_true", help="вывод одной JSON-строкой")
+    args = parser.parse_args(argv)
+
+    if (args.width is None) != (args.height is None):
+        parser.error("--width и --height задаются вместе")
+
+    def size_for(count):
+        if args.width is not None:
+            return args.width, args.height
+        return world_size(count)
+
+    options = {"bonds_per_particle": args.bonds, "ntypes": args.types, "dtype": args.precision,
+               "skin": args.skin, "toroidal": args.torus, "snapshots": args.snapshots}
+    if args.budget is not None:
+        count = max_count(args.budget * 2 ** 20, size_for, **options)
+        result = {"budget_mb": args.budget, "count": count, "world": list(size_for(count))}
+        print(json.dumps(result) if args.json else
+              f"{count} particles fit in {args.budget:g} MB "
+              f"(world {result['world'][0]:g}x{result['world'][1]:g})")
+        return
+
+    width, height = size_for(args.count)
+    result = {"count": args.count, "world": [width, height]}
+    if args.measure:
+        measured = measure(args.count, width, height, args.steps, args.precision,
+                           args.skin, args.torus, args.seed, args.types)
+        # Оценка с той связностью, что получилась на самом деле
+        options["bonds_per_particle"] = measured["bonds_per_particle"]
+        result["estimate"] = estimate(args.count, width, height, **options)
+        result["measured"] = measured
+    else:
+        result["estimate"] = estimate(args.count, width, height, **options)
+
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"{args.count} particles, world {width:g}x{height:g}, {args.precision}")
+    est = result["estimate"]
+    for name in PARTS + ("forces", "migrate"):
+        print(f"  {name:<12}{mb(est[name])}")
+    print(f"  {'steady':<12}{mb(est['steady'])}")
+    print(f"  {'peak':<12}{mb(est['peak'])}")
+    if args.measure:
+        got = result["measured"]
+        print(f"measured after {args.steps} steps ({got['bonds_per_particle']:.3f} bonds/particle, "
+              f"{got['seconds']} s):")
+        print(f"  {'steady':<12}{mb(got['steady'])}  ({got['steady'] / est['steady']:.2f} of estimate)")
+        print(f"  {'peak':<12}{mb(got['peak'])}  ({got['peak'] / est['peak']:.2f} of estimate)")
+
+
+if __name__ == "__main__":
+    main()
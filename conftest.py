@@ -0,0 +1,25 @@
+"""Общее для тестов: каждый тест получает physics в исходном состоянии"""
+import pytest
+import physics
+
+# Глобальные переменные physics, которые тесты подменяют
+STATE = ("particles", "bonds", "grid", "width", "height", "boundaries_enabled", "neighbours",
+         "parallel_forces", "step_count", "profiler", "ENGINE", "WORKERS", "SKIN",
+         "NODE_COUNT", "PRECISION")
+
+
+@pytest.fixture(autouse=True)
+def isolated_physics(monkeypatch):
+    """Глобальное состояние physics, таблицы типов и генератор возвращаются после теста"""
+    for name in STATE:
+        monkeypatch.setattr(physics, name, getattr(physics, name))
+    monkeypatch.setattr(physics, "counters", dict(physics.counters))
+    tables = ([row[:] for row in physics.COUPLING], physics.LINKS[:],
+              [row[:] for row in physics.LINKS_POSSIBLE])
+    rng = physics.rng.getstate()
+    pool = physics.parallel_forces
+    yield
+    if physics.parallel_forces is not pool:
+        physics.parallel_forces.close()
+    physics.rng.setstate(rng)
+    physics.set_types(*tables)
@@ -0,0 +1,101 @@
+"""Запись кадров без окна: последовательность картинок или видео.
+
+Кадр рисуется draw_scene() на поверхности в памяти размером с кадр
+(sim.open_window с offscreen=True, мир вписывается камерой), а
+FrameExporter.put() только копирует его пиксели и кладет в ограниченную
+очередь. Сжатие в PNG/JPEG и запись на диск делают рабочие потоки, так что физика идет дальше, пока
+предыдущие кадры кодируются. Если очередь полна, put() ждет: кадры не
+теряются, а память не растет.
+
+Куда писать определяется путем:
+    frames/%05d.png    картинки (номер кадра подставляется в шаблон)
+    run.rgb            сырое видео rgb24 без заголовка
+    run.mp4, run.webm  видео через ffmpeg (должен быть в PATH)
+"""
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import pygame
+
+# Расширения сырого видео: кадры подряд, по 3 байта на пиксель
+RAW_FORMATS = (".rgb", ".raw")
+
+
+class FrameExporter:
+    """Очередь кадров на запись; size - размер кадра на выходе"""
+
+    def __init__(self, path, size, fps=60, workers=2, depth=8):
+        self.path = path
+        self.size = tuple(size)
+        self.frames = 0
+        self.error = None
+        self.queue = queue.Queue(depth)
+        self.sink = None
+        self.process = None
+        if "%" in path:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        elif path.lower().endswith(RAW_FORMATS):
+            self.sink = open(path, "wb")
+        else:
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError("для записи видео нужен ffmpeg; без него - .rgb или шаблон картинок")
+            self.process = subprocess.Popen(
+                ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                 "-s", f"{self.size[0]}x{self.size[1]}", "-r", str(fps), "-i", "-",
+                 "-pix_fmt", "yuv420p", path],
+                stdin=subprocess.PIPE)
+            self.sink = self.process.stdin
+        # Поток байтов пишется по порядку одним потоком, картинки - независимо
+        count = 1 if self.sink is not None else max(1, workers)
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(count)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, surface):
+        """Поставить кадр в очередь (ждет, если очередь полна)"""
+        if self.error is not None:
+            raise self.error
+        if surface.get_size() != self.size:
+            raise ValueError(f"кадр {surface.get_size()} вместо {self.size}")
+        self.queue.put((self.frames, pygame.image.tobytes(surface, "RGB")))
+        self.frames += 1
+
+    def _encode(self, pixels):
+        """Кадр на выходе: байты rgb24 для потока или поверхность для картинки"""
+        if self.sink is not None:
+            return pixels
+        return pygame.image.frombytes(pixels, self.size, "RGB")
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            number, pixels = item
+            if self.error is not None:
+                continue    # После ошибки очередь только разбирается
+            try:
+                frame = self._encode(pixels)
+                if self.sink is not None:
+                    self.sink.write(frame)
+                else:
+                    pygame.image.save(frame, self.path % number)
+            except Exception as error:
+                self.error = error
+
+    def close(self):
+        """Дождаться записи всех кадров и закрыть вывод"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.sink is not None:
+            self.sink.close()
+        if self.process is not None:
+            self.process.wait()
+        if self.error is not None:
+            raise self.error
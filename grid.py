@@ -0,0 +1,183 @@
+import numpy as np
+
+# Половина окрестности 3x3: каждая пара соседних клеток встречается один раз
+HALF_STENCIL = ((1, 0), (-1, 1), (0, 1), (1, 1))
+# Пар в пакете: временные массивы пакета (около 100 байт на пару) остаются
+# в кэше процессора, а пиковая память прохода сил не растет с размером мира
+PAIR_CHUNK = 1 << 16
+
+
+class SpatialHash:
+    """Пространственный индекс, перестраиваемый на каждом шаге.
+
+    Частицы сортируются по номеру клетки подсчетом, границы клеток хранятся
+    в плоских массивах cell_start/cell_end, а пары-кандидаты перечисляются
+    по списку соседних клеток. Клетка не меньше cell_size, поэтому все пары
+    ближе cell_size гарантированно попадают в перечисление.
+    """
+
+    def __init__(self, width, height, cell_size):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.toroidal = False
+        self.nx = self.ny = 0
+        self.order = np.zeros(0, dtype=np.int64)
+        self.cell = np.zeros(0, dtype=np.int64)
+        self.cell_start = np.zeros(1, dtype=np.int64)
+        self.cell_end = np.zeros(0, dtype=np.int64)
+        self.cw = self.ch = cell_size
+        self.version = None  # ParticleStore.version, для которого построено разбиение
+        self._layouts = {}
+
+    def _layout(self, toroidal):
+        """Размер сетки и список пар соседних клеток для топологии"""
+        if toroidal not in self._layouts:
+            if toroidal:
+                # Клетки должны целиком укладываться в мир, чтобы сшивать края
+                nx = max(1, int(self.width // self.cell_size))
+                ny = max(1, int(self.height // self.cell_size))
+            else:
+                nx = int(self.width // self.cell_size) + 1
+                ny = int(self.height // self.cell_size) + 1
+            cx, cy = np.divmod(np.arange(nx * ny), ny)
+            pairs = []
+            for ox, oy in HALF_STENCIL:
+                tx = cx + ox
+                ty = cy + oy
+                if toroidal:
+                    tx %= nx
+                    ty %= ny
+                    ok = np.ones(nx * ny, dtype=bool)
+                else:
+                    ok = (tx >= 0) & (tx < nx) & (ty >= 0) & (ty < ny)
+                pairs.append(np.stack((cx[ok] * ny + cy[ok], tx[ok] * ny + ty[ok]), axis=1))
+            pairs = np.concatenate(pairs)
+            # На маленьких торовых сетках соседи повторяются - оставляем по одному
+            pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+            pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+            self._layouts[toroidal] = (nx, ny, pairs[:, 0].copy(), pairs[:, 1].copy())
+        return self._layouts[toroidal]
+
+    def build(self, x, y, toroidal):
+        """Сортировка частиц по клеткам"""
+        nx, ny, _, _ = self._layout(toroidal)
+        self.toroidal = toroidal
+        self.nx = nx
+        self.ny = ny
+        ncell = nx * ny
+        cw = self.width / nx if toroidal else self.cell_size
+        ch = self.height / ny if toroidal else self.cell_size
+        self.cw = cw
+        self.ch = ch
+        cx = np.clip((x // cw).astype(np.int64), 0, nx - 1)
+        cy = np.clip((y // ch).astype(np.int64), 0, ny - 1)
+        cell = cx * ny + cy
+
+        # Сортировка подсчетом: для 16-битных ключей NumPy использует поразрядную
+        if ncell <= 1 << 16:
+            self.order = np.argsort(cell.astype(np.uint16), kind='stable')
+        else:
+            self.order = np.argsort(cell, kind='stable')
+        self.cell = cell[self.order]
+        counts = np.bincount(cell, minlength=ncell)
+        self.cell_start = np.zeros(ncell + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_start[1:])
+        self.cell_end = self.cell_start[1:]
+
+    def pairs(self, chunk=PAIR_CHUNK):
+        """Пары-кандидаты (i, j) - индексы частиц - пакетами около chunk штук"""
+        _, _, ca, cb = self._layout(self.toroidal)
+        return cell_pairs(self.order, self.cell, self.cell_start, ca, cb,
+                          0, len(self.cell_start) - 1, chunk)
+
+    def pair_count(self):
+        """Сколько пар-кандидатов перечислит pairs()"""
+        _, _, ca, cb = self._layout(self.toroidal)
+        size = self.cell_start[1:] - self.cell_start[:-1]
+        return int((size * (size - 1) // 2).sum() + (size[ca] * size[cb]).sum())
+
+    def cells(self):
+        """Копия разбиения для выборки по прямоугольнику через query_cells()"""
+        return (self.order.copy(), self.cell_start.copy(), self.nx, self.ny,
+                self.cw, self.ch, self.toroidal)
+
+    def query(self, x0, y0, x1, y1):
+        """query_cells() по текущему разбиению без копирования"""
+        return query_cells((self.order, self.cell_start, self.nx, self.ny,
+                            self.cw, self.ch, self.toroidal), x0, y0, x1, y1)
+
+    def neighbour_pairs(self):
+        """Пары соседних клеток (ca, cb) текущей топологии, ca < cb, по возрастанию ca"""
+        _, _, ca, cb = self._layout(self.toroidal)
+        return ca, cb
+
+
+def cell_pairs(order, cell, cell_start, ca, cb, lo, hi, chunk=PAIR_CHUNK):
+    """Пары частиц для клеток [lo, hi): внутри клетки и с соседями, где клетка первая.
+
+    order, cell, cell_start - результат SpatialHash.build(), ca/cb - пары
+    соседних клеток. Функция не зависит от объекта индекса, чтобы ее можно
+    было вызывать в рабочих процессах над массивами из общей памяти.
+    """
+    # Внутри клетки: каждая частица с последующими в своей клетке
+    pos = np.arange(cell_start[lo], cell_start[hi])
+    inner = cell_start[cell[pos] + 1] - pos - 1
+    for p, k in _batches(pos, inner, chunk):
+        yield order[p], order[p + 1 + k]
+
+    # Между соседними клетками: полное произведение
+    first = np.searchsorted(ca, lo)
+    last = np.searchsorted(ca, hi)
+    ca = ca[first:last]
+    cb = cb[first:last]
+    size = cell_start[1:] - cell_start[:-1]
+    cross = size[ca] * size[cb]
+    for u, k in _batches(np.arange(len(ca)), cross, chunk):
+        sb = size[cb[u]]
+        yield order[cell_start[ca[u]] + k // sb], order[cell_start[cb[u]] + k % sb]
+
+
+def query_cells(cells, x0, y0, x1, y1):
+    """Индексы частиц из клеток, пересекающих прямоугольник [x0, x1] x [y0, y1].
+
+    cells - результат SpatialHash.cells(). На торе прямоугольник может
+    выходить за край мира и продолжается с другой стороны.
+    """
+    order, cell_start, nx, ny, cw, ch, toroidal = cells
+    cx = _cell_range(x0, x1, cw, nx, toroidal)
+    cy = _cell_range(y0, y1, ch, ny, toroidal)
+    cell = (cx[:, None] * ny + cy[None, :]).ravel()
+    start = cell_start[cell]
+    count = cell_start[cell + 1] - start
+    pos = np.arange(count.sum()) + np.repeat(start - (np.cumsum(count) - count), count)
+    return order[pos]
+
+
+def _cell_range(lo, hi, size, n, toroidal):
+    """Номера клеток по одной оси, которые задевает отрезок [lo, hi]"""
+    first = int(lo // size)
+    last = int(hi // size)
+    if toroidal:
+        if last - first + 1 >= n:
+            return np.arange(n)
+        return np.arange(first, last + 1) % n
+    return np.arange(max(first, 0), min(last, n - 1) + 1)
+
+
+def _batches(units, counts, chunk):
+    """Разворачивает units в (unit, номер пары) пакетами около chunk пар"""
+    keep = counts > 0
+    units, counts = units[keep], counts[keep]
+    total = np.cumsum(counts)
+    lo = 0
+    while lo < len(units):
+        base = total[lo - 1] if lo > 0 else 0
+        hi = int(np.searchsorted(total, base + chunk, side='right'))
+        hi = min(max(hi, lo + 1), len(units))
+        c = counts[lo:hi]
+        n = int(c.sum())
+        rep = np.repeat(np.arange(hi - lo), c)
+        k = np.arange(n) - np.repeat(np.cumsum(c) - c, c)
+        yield units[lo:hi][rep], k
+        lo = hi
@@ -0,0 +1,245 @@
+"""Пакетный запуск симуляции без окна.
+
+Пример:
+    python headless.py --width 1920 --height 1040 --count 3000 --steps 500 --seed 1
+
+Список соседей (Верле) с запасом 20 px вместо обхода сетки каждый шаг:
+    python headless.py --count 10000 --width 6000 --height 3000 --skin 20
+
+Большой мир во float32 (память заранее - capacity.py):
+    python headless.py --count 2000000 --width 93000 --height 50000 --precision f4
+
+Экосистема из 16 типов со случайными таблицами:
+    python headless.py --seed 1 --types 16 --count 5000 --width 4000 --height 2200
+
+Эталонная траектория для проверки оптимизаций logic():
+    python headless.py --seed 1 --hash-every 50 --record-hashes golden.jsonl
+    python headless.py --seed 1 --hash-every 50 --check-hashes golden.jsonl
+
+Время фаз и счетчики по шагам:
+    python headless.py --steps 500 --metrics metrics.csv
+
+Сохранение и продолжение с того же места, запись траектории для sim.py --replay:
+    python headless.py --seed 1 --steps 500 --save-state run.pstate
+    python headless.py --load-state run.pstate --steps 500 --record run.ptraj
+
+Кадры без окна (draw_scene() на поверхности в памяти):
+    python headless.py --seed 1 --steps 600 --video frames/%05d.png --video-size 1280x720
+    python headless.py --seed 1 --steps 600 --video run.mp4 --video-every 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import physics
+import statefile
+from profiler import Profiler
+from scheduler import Snapshot
+
+
+# Наибольшая область мира в кадре без --video-size
+VIDEO_LIMIT = (1920, 1040)
+
+
+def parse_matrix(text):
+    """Матрица из строки вида "1,1,-1;1,1,1;1,1,1" (размер проверяется по числу типов)"""
+    try:
+        return [[float(v) for v in row.split(",")] for row in text.split(";")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("нужна матрица вида 1,1,-1;1,1,1;1,1,1")
+
+
+def parse_size(text):
+    """Размер кадра из строки вида 1280x720"""
+    try:
+        w, h = text.lower().split("x")
+        return int(w), int(h)
+    except ValueError:
+        raise argparse.ArgumentTypeError("нужен размер вида 1280x720")
+
+
+def open_renderer(size, world):
+    """sim.py с поверхностью size в памяти; мир world показывается через камеру.
+
+    size None - мир целиком, уменьшенный до VIDEO_LIMIT, и строка состояния.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import sim
+    if size is None:
+        scale = min(1, VIDEO_LIMIT[0] / world[0], VIDEO_LIMIT[1] / world[1])
+        size = (max(1, round(world[0] * scale)),
+                max(1, round(world[1] * scale)) + sim.STATUS_HEIGHT)
+    sim.open_window(size, offscreen=True, world=world)
+    return sim
+
+
+def load_hashes(path):
+    """Эталонные отпечатки: шаг -> отпечаток"""
+    with open(path) as f:
+        return {row["step"]: row["hash"] for row in map(json.loads, f) if row}
+
+
+# Величины physics.stats() о связных структурах в журнале --metrics
+STRUCTURE_METRICS = ("structures", "largest_structure")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Симуляция частиц без окна")
+    parser.add_argument("--width", type=float, default=1920, help="ширина мира")
+    parser.add_argument("--height", type=float, default=1040, help="высота мира")
+    parser.add_argument("--count", type=int, default=physics.NODE_COUNT, help="число частиц")
+    parser.add_argument("--steps", type=int, default=1000, help="число шагов")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора")
+    parser.add_argument("--coupling", type=parse_matrix, default=None,
+                        help='матрица взаимодействий, например "1,1,-1;1,1,1;1,1,1"')
+    parser.add_argument("--types", type=int, default=None,
+                        help="число типов частиц со случайными таблицами (по умолчанию - 3 заданных)")
+    parser.add_argument("--engine", choices=("python", "numpy", "parallel"), default="numpy")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="число процессов для --engine parallel (по умолчанию - ядра)")
+    parser.add_argument("--skin", type=float, default=0,
+                        help="запас списка соседей в пикселях (0 - пары по сетке каждый шаг)")
+    parser.add_argument("--torus", action="store_true", help="торовая топология вместо границ")
+    parser.add_argument("--precision", choices=("f8", "f4"), default="f8",
+                        help="точность позиций и скоростей (f4 - вдвое меньше памяти)")
+    parser.add_argument("--json", action="store_true", help="вывод одной JSON-строкой")
+    parser.add_argument("--hash-every", type=int, default=0,
+                        help="считать отпечаток состояния каждые N шагов")
+    parser.add_argument("--record-hashes", metavar="PATH", help="записать отпечатки в файл")
+    parser.add_argument("--check-hashes", metavar="PATH",
+                        help="сверить отпечатки с файлом на его шагах (все должны быть пройдены)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="время фаз и счетчики каждого шага в CSV (.csv) или JSONL")
+    parser.add_argument("--load-state", metavar="PATH",
+                        help="начать с сохраненного состояния (размер мира и матрицы - из файла)")
+    parser.add_argument("--save-state", metavar="PATH", help="сохранить состояние в конце")
+    parser.add_argument("--record", metavar="PATH", help="записать траекторию для sim.py --replay")
+    parser.add_argument("--record-every", type=int, default=1, metavar="K",
+                        help="кадр траектории каждые K шагов")
+    parser.add_argument("--video", metavar="PATH",
+                        help="кадры без окна: шаблон картинок (frames/%%05d.png), .rgb или видео через ffmpeg")
+    parser.add_argument("--video-size", type=parse_size, default=None, metavar="WxH",
+                        help="размер кадра; мир вписывается камерой "
+                             "(по умолчанию - мир не больше 1920x1040 и строка состояния)")
+    parser.add_argument("--video-every", type=int, default=1, metavar="K",
+                        help="кадр каждые K шагов")
+    parser.add_argument("--video-fps", type=int, default=60, help="частота кадров видео")
+    parser.add_argument("--video-workers", type=int, default=2,
+                        help="потоков кодирования картинок")
+    args = parser.parse_args(argv)
+    if args.record_hashes and not args.hash_every:
+        parser.error("--record-hashes: нужен --hash-every")
+
+    if args.seed is not None:
+        physics.seed(args.seed)
+    physics.PRECISION = args.precision
+    if args.types is not None:
+        physics.set_types(*physics.random_types(args.types))
+    physics.ENGINE = args.engine
+    physics.WORKERS = args.workers
+    physics.SKIN = args.skin
+    physics.NODE_COUNT = args.count
+    renderer = exporter = None
+    if args.video:
+        # pygame нужен только для записи кадров
+        header = statefile.read_header(args.load_state) if args.load_state else None
+        world = (header["width"], header["height"]) if header else (args.width, args.height)
+        renderer = open_renderer(args.video_size, world)
+        from export import FrameExporter
+        size = renderer.screen.get_size()
+        try:
+            exporter = FrameExporter(args.video, size, args.video_fps, args.video_workers)
+        except RuntimeError as error:
+            parser.error(str(error))
+
+    if args.load_state:
+        statefile.load(args.load_state)
+    else:
+        physics.boundaries_enabled = not args.torus
+        physics.setup(args.width, args.height)
+        physics.init_simulation()
+    if args.coupling is not None:
+        k = len(physics.LINKS)
+        if len(args.coupling) != k or any(len(row) != k for row in args.coupling):
+            parser.error(f"--coupling: нужна матрица {k}x{k}")
+        physics.set_coupling(args.coupling)
+    if renderer is not None:
+        # Цвета по числу типов мира, из файла состояния - если там есть палитра
+        renderer.set_palette((header or {}).get("palette") or renderer.COLORS)
+        renderer.fit_camera(Snapshot.capture())
+
+    if args.metrics:
+        physics.profiler = Profiler([name for name, _ in physics.PHASES],
+                                    ("steps",) + physics.COUNTERS + STRUCTURE_METRICS)
+        physics.profiler.open_log(args.metrics)
+
+    recorder = None
+    if args.record:
+        recorder = statefile.TrajectoryWriter(args.record, every=args.record_every)
+        recorder.append(Snapshot.capture())
+
+    golden = load_hashes(args.check_hashes) if args.check_hashes else None
+    if golden is not None and not golden:
+        parser.error(f"--check-hashes: в {args.check_hashes} нет отпечатков")
+    hashes = []
+    mismatch = None
+    elapsed = 0.0
+    for step in range(1, args.steps + 1):
+        start = time.perf_counter()
+        physics.logic()
+        elapsed += time.perf_counter() - start
+        if physics.profiler is not None:
+            stats = physics.stats()
+            for name in STRUCTURE_METRICS:
+                physics.profiler.count(name, stats[name])
+            physics.profiler.end_frame()
+        # Отпечатки - каждые --hash-every шагов и на всех шагах эталона
+        if (args.hash_every and step % args.hash_every == 0) or (golden and step in golden):
+            h = physics.state_hash()
+            hashes.append({"step": step, "hash": h})
+            # Шаг, которого нет в эталоне, - тоже расхождение
+            if golden is not None and mismatch is None and golden.get(step) != h:
+                mismatch = step
+        if recorder is not None and step % args.record_every == 0:
+            recorder.append(Snapshot.capture())
+        if exporter is not None and step % args.video_every == 0:
+            renderer.draw_scene()
+            exporter.put(renderer.screen)
+
+    if golden is not None and mismatch is None and max(golden) > args.steps:
+        mismatch = min(step for step in golden if step > args.steps)   # Шаг эталона не достигнут
+    if physics.profiler is not None:
+        physics.profiler.close()
+    if recorder is not None:
+        recorder.close()
+    if exporter is not None:
+        exporter.close()
+    if args.save_state:
+        statefile.save(args.save_state)
+    if args.record_hashes:
+        with open(args.record_hashes, "w") as f:
+            for row in hashes:
+                f.write(json.dumps(row) + "\n")
+
+    result = {
+        "steps": args.steps,
+        "seconds": round(elapsed, 4),
+        "steps_per_sec": round(args.steps / elapsed, 2) if elapsed > 0 else None,
+    }
+    result.update(physics.stats())
+    result["hash"] = physics.state_hash()
+    if golden is not None:
+        result["first_mismatch"] = mismatch
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    if mismatch is not None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import numpy as np
+
+
+def min_image(d, size):
+    """Кратчайшее смещение для торовой топологии"""
+    far = np.abs(d) > size / 2
+    return np.where(far, np.where(d > 0, d - size, d + size), d)
+
+
+def bond_keys(bond_a, bond_b, n):
+    """Отсортированные ключи связей min * n + max для проверки через bonded_mask()"""
+    bond_a = np.asarray(bond_a, dtype=np.int64)
+    bond_b = np.asarray(bond_b, dtype=np.int64)
+    return np.sort(np.minimum(bond_a, bond_b) * n + np.maximum(bond_a, bond_b))
+
+
+def bonded_mask(key, bonded_keys):
+    """Есть ли ключи key среди отсортированных bonded_keys.
+
+    Двоичный поиск вместо np.isin: isin сортирует пакет вместе со всеми
+    ключами связей и держит копии обоих массивов.
+    """
+    if len(bonded_keys) == 0:
+        return np.zeros(len(key), dtype=bool)
+    idx = np.minimum(np.searchsorted(bonded_keys, key), len(bonded_keys) - 1)
+    return bonded_keys[idx] == key
+
+
+def events_before(ev_particle, ev_pos, particle, pos):
+    """Сколько событий частицы particle произошло раньше позиции pos"""
+    if len(ev_particle) == 0:
+        return np.zeros(len(particle), dtype=np.int64)
+    stride = int(max(pos.max(initial=0), ev_pos.max()) + 1)
+    keys = np.sort(ev_particle * stride + ev_pos)
+    base = particle * stride
+    return np.searchsorted(keys, base + pos) - np.searchsorted(keys, base)
+
+
+class ForceKernel:
+    """Пакетный расчет парных сил на NumPy.
+
+    Повторяет правила apply_force(): притяжение/отталкивание по COUPLING,
+    образование связей с учетом LINKS и LINKS_POSSIBLE, отталкивание
+    насыщенных частиц и ближнее отталкивание на расстоянии NODE_RADIUS.
+    Связи образуются в порядке перечисления пар, как в скалярном обходе.
+    """
+
+    def __init__(self, coupling, links, links_possible,
+                 max_dist, node_radius, speed):
+        self.coupling = np.asarray(coupling, dtype=np.float64)
+        self.links = np.asarray(links, dtype=np.int64)
+        self.links_possible = np.asarray(links_possible, dtype=np.int64)
+        self.max_dist = max_dist
+        self.node_radius = node_radius
+        self.speed = speed
+        self.pairs_in_range = 0  # Счетчик пар ближе MAX_DIST, обнуляет вызывающий
+
+    def set_coupling(self, coupling):
+        self.coupling = np.asarray(coupling, dtype=np.float64)
+
+    def run(self, x, y, ptype, links, type_count, bond_a, bond_b, pairs, wrap=None):
+        """Один проход сил.
+
+        x, y, ptype, links - массивы частиц;
+        type_count[i, t] - число связей частицы i с частицами типа t;
+        bond_a, bond_b - существующие связи; pairs - пакеты пар-кандидатов
+        (SpatialHash.pairs()); wrap - (w, h) для тора.
+        Возвращает приращения скоростей и список новых связей (a, b).
+        Массивы links и type_count обновляются на месте.
+        """
+        n = len(x)
+        dsx = np.zeros(n)
+        dsy = np.zeros(n)
+        formed = []
+        if n == 0:
+            return dsx, dsy, formed
+
+        bonded_keys = bond_keys(bond_a, bond_b, n)
+        # Связи из прошлых пакетов уже существуют для следующих; они копятся
+        # отдельно, чтобы не пересобирать ключи всех связей после каждого пакета
+        formed_keys = np.zeros(0, dtype=np.int64)
+        for pa, pb in pairs:
+            made = self._chunk(x, y, ptype, links, type_count, bonded_keys, formed_keys,
+                               pa, pb, wrap, dsx, dsy, formed)
+            if made:
+                # Новых ключей среди прежних нет - вставка без пересортировки
+                made = np.sort(np.asarray(made, dtype=np.int64))
+                formed_keys = np.insert(formed_keys, np.searchsorted(formed_keys, made), made)
+        return dsx, dsy, formed
+
+    def in_range(self, x, y, pa, pb, wrap=None):
+        """Только пары ближе MAX_DIST - для поштучного прохода"""
+        pa, pb, _, _, _ = self._geometry(x, y, pa, pb, wrap)
+        return pa, pb
+
+    def run_static(self, x, y, ptype, links, bonded_keys, pairs, wrap=None):
+        """Проход сил при состоянии связей на начало шага.
+
+        В отличие от run() связи здесь не образуются: насыщенность и наличие
+        связи берутся на начало шага, а пары, которые могли бы связаться,
+        возвращаются кандидатами для resolve_bonds(). Результат не зависит
+        от порядка пар, поэтому проход можно делить между процессами.
+        Возвращает (индексы частиц, dsx, dsy) по затронутым частицам
+        и кандидатов (a, b, d2).
+        """
+        n = len(x)
+        max_d2 = self.max_dist ** 2
+        parts = []
+        cand = []
+        for pa, pb in pairs:
+            pa, pb, dx, dy, d2 = self._geometry(x, y, pa, pb, wrap)
+            if len(pa) == 0:
+                continue
+            ta = ptype[pa]
+            tb = ptype[pb]
+            bonded = bonded_mask(np.minimum(pa, pb) * n + np.maximum(pa, pb), bonded_keys)
+            free = (links[pa] < self.links[ta]) & (links[pb] < self.links[tb])
+            c = free & (d2 < max_d2 / 4) & ~bonded
+            cand.append((pa[c], pb[c], d2[c]))
+            parts.append((pa, pb) + self._terms(dx, dy, d2, ta, tb, free, bonded))
+
+        if not parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return (empty, np.zeros(0), np.zeros(0)), (empty, empty, np.zeros(0))
+        pa = np.concatenate([p[0] for p in parts])
+        pb = np.concatenate([p[1] for p in parts])
+        touched, local = np.unique(np.concatenate((pa, pb)), return_inverse=True)
+        la, lb = local[:len(pa)], local[len(pa):]
+        m = len(touched)
+        fxa, fya, fxb, fyb = (np.concatenate([p[k] for p in parts]) for k in range(2, 6))
+        dsx = np.bincount(la, fxa, minlength=m) - np.bincount(lb, fxb, minlength=m)
+        dsy = np.bincount(la, fya, minlength=m) - np.bincount(lb, fyb, minlength=m)
+        cand = tuple(np.concatenate([c[k] for c in cand]) for k in range(3))
+        return (touched, dsx, dsy), cand
+
+    def resolve_bonds(self, cand_a, cand_b, cand_d2, ptype, links, type_count):
+        """Образование связей из кандидатов в каноническом порядке.
+
+        Ближние пары связываются первыми, равные расстояния упорядочены по
+        индексам, поэтому итог не зависит от того, как пары делились между
+        процессами. Ограничения LINKS и LINKS_POSSIBLE соблюдаются так же,
+        как в apply_force(). links и type_count обновляются на месте.
+        """
+        lo = np.minimum(cand_a, cand_b)
+        hi = np.maximum(cand_a, cand_b)
+        order = np.lexsort((hi, lo, cand_d2))
+        lmax = self.links
+        lpos = self.links_possible
+        formed = []
+        seen = set()
+        for a, b in zip(lo[order].tolist(), hi[order].tolist()):
+            if (a, b) in seen:
+                continue
+            ta = int(ptype[a])
+            tb = int(ptype[b])
+            if links[a] >= lmax[ta] or links[b] >= lmax[tb]:
+                continue
+            if type_count[a, tb] < lpos[ta, tb] and type_count[b, ta] < lpos[tb, ta]:
+                links[a] += 1
+                links[b] += 1
+                type_count[a, tb] += 1
+                type_count[b, ta] += 1
+                seen.add((a, b))
+                formed.append((a, b))
+        return formed
+
+    def _geometry(self, x, y, pa, pb, wrap):
+        """Смещения пар и отбор пар в пределах MAX_DIST"""
+        dx = x[pa] - x[pb]
+        dy = y[pa] - y[pb]
+        if wrap is not None:
+            dx = min_image(dx, wrap[0])
+            dy = min_image(dy, wrap[1])
+        d2 = dx * dx + dy * dy
+        inside = (d2 <= self.max_dist ** 2) & (pa != pb)
+        pa = pa[inside]
+        self.pairs_in_range += len(pa)
+        return pa, pb[inside], dx[inside], dy[inside], d2[inside]
+
+    def _terms(self, dx, dy, d2, ta, tb, free, bonded):
+        """Приращения скоростей пары: (a.sx, a.sy) прибавляются, (b.sx, b.sy) вычитаются"""
+        nonzero = d2 != 0
+        inv = np.divide(1.0, d2, out=np.zeros_like(d2), where=nonzero)
+        # Единичный вектор смещения; для совпавших частиц - вдоль x, как у atan2(0, 0)
+        d = np.sqrt(d2)
+        ux = np.divide(dx, d, out=np.ones_like(d), where=nonzero)
+        uy = np.divide(dy, d, out=np.zeros_like(d), where=nonzero)
+        dA = self.coupling[ta, tb] * inv
+        dB = self.coupling[tb, ta] * inv
+        repel = ~free & ~bonded
+        dA[repel] = inv[repel]
+        dB[repel] = inv[repel]
+
+        d2 = np.maximum(d2, 1)
+        near = d2 < self.node_radius * self.node_radius * 4
+        dA[near] = 1 / d2[near]
+        dB[near] = 1 / d2[near]
+
+        s = self.speed
+        return ux * dA * s, uy * dA * s, ux * dB * s, uy * dB * s
+
+    def _chunk(self, x, y, ptype, links, type_count, bonded_keys, formed_keys,
+               pa, pb, wrap, dsx, dsy, formed):
+        max_d2 = self.max_dist ** 2
+        n = len(x)
+        pa, pb, dx, dy, d2 = self._geometry(x, y, pa, pb, wrap)
+        if len(pa) == 0:
+            return []
+        ta = ptype[pa]
+        tb = ptype[pb]
+        key = np.minimum(pa, pb) * n + np.maximum(pa, pb)
+        bonded = bonded_mask(key, bonded_keys) | bonded_mask(key, formed_keys)
+
+        # Связи концов на начало пакета (только для пар пакета, а не копия всех links)
+        la = links[pa]
+        lb = links[pb]
+        free = (la < self.links[ta]) & (lb < self.links[tb])
+
+        # Образование связей - последовательно, как в скалярном проходе
+        candidates = np.nonzero(free & (d2 < max_d2 / 4) & ~bonded)[0]
+        made = []
+        made_keys = {}
+        lmax = self.links
+        lpos = self.links_possible
+        for p in candidates.tolist():
+            a = int(pa[p])
+            b = int(pb[p])
+            ta_p = int(ta[p])
+            tb_p = int(tb[p])
+            if links[a] >= lmax[ta_p] or links[b] >= lmax[tb_p]:
+                continue
+            k = int(key[p])
+            if k in made_keys:
+                continue
+            if type_count[a, tb_p] < lpos[ta_p, tb_p] and type_count[b, ta_p] < lpos[tb_p, ta_p]:
+                links[a] += 1
+                links[b] += 1
+                type_count[a, tb_p] += 1
+                type_count[b, ta_p] += 1
+                made_keys[k] = p
+                made.append(p)
+                formed.append((a, b))
+
+        # Состояние связей на момент обработки каждой пары
+        pos = np.arange(len(pa))
+        if made:
+            made = np.asarray(made, dtype=np.int64)
+            ev_particle = np.concatenate((pa[made], pb[made]))
+            ev_pos = np.concatenate((made, made))
+            la = la + events_before(ev_particle, ev_pos, pa, pos)
+            lb = lb + events_before(ev_particle, ev_pos, pb, pos)
+            free = (la < self.links[ta]) & (lb < self.links[tb])
+            mk = np.fromiter(made_keys.keys(), dtype=np.int64, count=len(made_keys))
+            mp = np.fromiter(made_keys.values(), dtype=np.int64, count=len(made_keys))
+            order = np.argsort(mk)
+            mk, mp = mk[order], mp[order]
+            idx = np.minimum(np.searchsorted(mk, key), len(mk) - 1)
+            bonded |= (mk[idx] == key) & (mp[idx] < pos)
+
+        fxa, fya, fxb, fyb = self._terms(dx, dy, d2, ta, tb, free, bonded)
+        # Суммы только по частицам пакета: проход по всем n на каждый пакет
+        # сделал бы мелкие пакеты дорогими
+        touched, local = np.unique(np.concatenate((pa, pb)), return_inverse=True)
+        ia, ib = local[:len(pa)], local[len(pa):]
+        m = len(touched)
+        dsx[touched] += np.bincount(ia, fxa, minlength=m) - np.bincount(ib, fxb, minlength=m)
+        dsy[touched] += np.bincount(ia, fya, minlength=m) - np.bincount(ib, fyb, minlength=m)
+        return list(made_keys)
@@ -0,0 +1,72 @@
+import numpy as np
+from grid import PAIR_CHUNK, SpatialHash
+from kernel import min_image
+
+
+class NeighbourList:
+    """Список пар соседей с запасом skin (список Верле).
+
+    Пары ближе cutoff + skin собираются по сетке с клетками того же размера
+    и хранятся плоскими массивами в порядке перечисления сетки. Пока ни одна
+    частица не сместилась от положения на момент сборки больше чем на
+    skin / 2, все пары ближе cutoff остаются в списке, и шаг проверяет только
+    их вместо обхода соседних клеток. Список собирается заново при смещении
+    больше skin / 2, добавлении или удалении частиц и смене размера мира
+    или топологии.
+    """
+
+    def __init__(self, cutoff, skin):
+        self.cutoff = cutoff
+        self.skin = skin
+        self.grid = None
+        self.key = None
+        self.x0 = self.y0 = None
+        self.pa = np.zeros(0, dtype=np.int64)
+        self.pb = np.zeros(0, dtype=np.int64)
+        self.rebuilds = 0
+
+    def __len__(self):
+        return len(self.pa)
+
+    def update(self, x, y, version, width, height, toroidal):
+        """Собрать список заново, если он устарел; True - список собран"""
+        key = (version, width, height, toroidal)
+        if key == self.key and not self._moved(x, y, (width, height) if toroidal else None):
+            return False
+        if self.grid is None or (self.grid.width, self.grid.height) != (width, height):
+            self.grid = SpatialHash(width, height, self.cutoff + self.skin)
+        self.grid.build(x, y, toroidal)
+        reach = (self.cutoff + self.skin) ** 2
+        pa = []
+        pb = []
+        for a, b in self.grid.pairs():
+            dx = x[a] - x[b]
+            dy = y[a] - y[b]
+            if toroidal:
+                dx = min_image(dx, width)
+                dy = min_image(dy, height)
+            near = dx * dx + dy * dy <= reach
+            pa.append(a[near])
+            pb.append(b[near])
+        empty = np.zeros(0, dtype=np.int64)
+        self.pa = np.concatenate(pa) if pa else empty
+        self.pb = np.concatenate(pb) if pb else empty
+        self.x0 = x.copy()
+        self.y0 = y.copy()
+        self.key = key
+        self.rebuilds += 1
+        return True
+
+    def _moved(self, x, y, wrap):
+        """Сместилась ли какая-нибудь частица больше чем на skin / 2"""
+        dx = x - self.x0
+        dy = y - self.y0
+        if wrap is not None:
+            dx = min_image(dx, wrap[0])
+            dy = min_image(dy, wrap[1])
+        return bool(np.any(dx * dx + dy * dy > (self.skin / 2) ** 2))
+
+    def pairs(self, chunk=PAIR_CHUNK):
+        """Пары-кандидаты (i, j) пакетами по chunk штук, как SpatialHash.pairs()"""
+        for lo in range(0, len(self.pa), chunk):
+            yield self.pa[lo:lo + chunk], self.pb[lo:lo + chunk]
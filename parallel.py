@@ -0,0 +1,140 @@
+"""Параллельный проход сил: сетка делится на участки между процессами.
+
+Главный процесс кладет массивы частиц и разметку SpatialHash в общую память,
+рабочие процессы считают силы для своих участков клеток (соседние клетки
+других участков читаются из той же памяти), а затем главный процесс
+складывает приращения скоростей по участкам в фиксированном порядке
+и образует связи через ForceKernel.resolve_bonds().
+
+Разбиение на участки зависит только от сетки, а не от числа процессов,
+поэтому результат шага одинаков при любом числе рабочих.
+"""
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from grid import cell_pairs
+from kernel import ForceKernel, bond_keys
+
+# Наибольшее число участков сетки за шаг
+MAX_TILES = 64
+
+
+class SharedArrays:
+    """Именованные массивы в общей памяти; блоки растут с запасом"""
+
+    def __init__(self):
+        self.blocks = {}
+
+    def put(self, key, array):
+        """Скопировать массив в общую память, вернуть описание для рабочих"""
+        array = np.ascontiguousarray(array)
+        block = self.blocks.get(key)
+        if block is None or block.size < array.nbytes:
+            if block is not None:
+                block.close()
+                block.unlink()
+            block = shared_memory.SharedMemory(create=True, size=max(2 * array.nbytes, 4096))
+            self.blocks[key] = block
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        return key, block.name, array.dtype.str, array.shape
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+
+# Подключенные блоки общей памяти в рабочем процессе: ключ -> блок
+_attached = {}
+
+
+def _get(spec):
+    key, name, dtype, shape = spec
+    block = _attached.get(key)
+    if block is None or block.name != name:
+        if block is not None:
+            block.close()
+        block = shared_memory.SharedMemory(name=name)
+        _attached[key] = block
+    return np.ndarray(shape, dtype, buffer=block.buf)
+
+
+def _tile(specs, tables, wrap, lo, hi):
+    """Силы для клеток [lo, hi): выполняется в рабочем процессе"""
+    arrays = {key: _get(spec) for key, spec in specs.items()}
+    kernel = ForceKernel(**tables)
+    return _tile_forces(arrays, kernel, wrap, lo, hi), kernel.pairs_in_range
+
+
+def _tile_forces(a, kernel, wrap, lo, hi):
+    pairs = cell_pairs(a['order'], a['cell'], a['cell_start'], a['ca'], a['cb'], lo, hi)
+    return kernel.run_static(a['x'], a['y'], a['type'], a['links'], a['bonded'], pairs, wrap)
+
+
+class ParallelForces:
+    """Пул процессов для прохода сил над общей памятью"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.shared = SharedArrays()
+        self.pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        atexit.register(self.close)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        self.shared.close()
+
+    @staticmethod
+    def tiles(ncell):
+        """Границы участков: равные диапазоны номеров клеток"""
+        count = max(1, min(ncell, MAX_TILES))
+        return np.linspace(0, ncell, count + 1).astype(np.int64).tolist()
+
+    def run(self, kernel, x, y, ptype, links, type_count, bond_a, bond_b, grid, wrap=None):
+        """Один проход сил; интерфейс как у ForceKernel.run(), но с сеткой вместо пар"""
+        n = len(x)
+        dsx = np.zeros(n)
+        dsy = np.zeros(n)
+        if n == 0:
+            return dsx, dsy, []
+
+        ca, cb = grid.neighbour_pairs()
+        arrays = {
+            'x': x, 'y': y, 'type': ptype, 'links': links,
+            'bonded': bond_keys(bond_a, bond_b, n),
+            'order': grid.order, 'cell': grid.cell, 'cell_start': grid.cell_start,
+            'ca': ca, 'cb': cb,
+        }
+        bounds = self.tiles(len(grid.cell_start) - 1)
+        jobs = list(zip(bounds[:-1], bounds[1:]))
+        if self.pool is None:
+            # Один процесс: те же участки, но без общей памяти
+            results = [_tile_forces(arrays, kernel, wrap, lo, hi) for lo, hi in jobs]
+        else:
+            specs = {key: self.shared.put(key, value) for key, value in arrays.items()}
+            tables = {
+                'coupling': kernel.coupling, 'links': kernel.links,
+                'links_possible': kernel.links_possible, 'max_dist': kernel.max_dist,
+                'node_radius': kernel.node_radius, 'speed': kernel.speed,
+            }
+            futures = [self.pool.submit(_tile, specs, tables, wrap, lo, hi) for lo, hi in jobs]
+            results = []
+            for f in futures:
+                result, inside = f.result()
+                kernel.pairs_in_range += inside
+                results.append(result)
+
+        # Сложение по участкам в фиксированном порядке
+        cand = []
+        for (touched, tx, ty), c in results:
+            dsx[touched] += tx
+            dsy[touched] += ty
+            cand.append(c)
+        cand_a, cand_b, cand_d2 = (np.concatenate([c[k] for c in cand]) for k in range(3))
+        formed = kernel.resolve_bonds(cand_a, cand_b, cand_d2, ptype, links, type_count)
+        return dsx, dsy, formed
@@ -0,0 +1,509 @@
+"""Физика частиц без окна и pygame: состояние мира и шаг logic()"""
+import hashlib
+import random
+import math as meth
+import numpy as np
+from kernel import ForceKernel, min_image
+from grid import SpatialHash
+from neighbours import NeighbourList
+from store import ParticleStore
+
+# Константы
+MAX_DIST = 100
+NODE_RADIUS = 5
+NODE_COUNT = 850
+SPEED = 4
+BORDER = 30
+LINK_FORCE = -0.015
+# Движок расчета сил: "python" - поштучно, "numpy" - пакетно,
+# "parallel" - пакетно в WORKERS процессах
+ENGINE = "python"
+WORKERS = None  # None - по числу ядер
+# Запас списка соседей (список Верле) в пикселях: пары ближе MAX_DIST + SKIN
+# собираются раз в несколько шагов; 0 - пары по сетке на каждом шаге.
+# Движок "parallel" делит сетку между процессами и список не использует
+SKIN = 0
+# Точность x, y, sx, sy в хранилище: "f8" или "f4" (вдвое меньше памяти и
+# трафика в проходе сил; действует на хранилища, созданные после изменения)
+PRECISION = "f8"
+
+# Таблицы взаимодействий типов (по умолчанию три типа); число типов
+# меняется через set_types(), ForceKernel держит их копии в массивах NumPy
+COUPLING = [
+    [1, 1, -1],
+    [1, 1, 1],
+    [1, 1, 1]
+]
+LINKS = [1, 3, 2]
+LINKS_POSSIBLE = [
+    [0, 1, 1],
+    [1, 2, 1],
+    [1, 1, 2]
+]
+
+boundaries_enabled = True  # Включены ли границы мира
+
+# Размер мира задается через setup()
+width = 0
+height = 0
+grid = None
+particles = ParticleStore(len(LINKS), PRECISION)
+bonds = particles.bonds
+rng = random.Random()  # Собственный генератор: запуск с одним зерном повторяется
+kernel = ForceKernel(COUPLING, LINKS, LINKS_POSSIBLE, MAX_DIST, NODE_RADIUS, SPEED)
+parallel_forces = None  # Пул процессов создается при первом шаге в режиме "parallel"
+neighbours = None  # NeighbourList при SKIN > 0
+step_count = 0  # Шагов logic() в этом процессе: номер шага снимков и траекторий
+
+# Счетчики последнего шага; profiler (profiler.Profiler) получает их и время фаз
+COUNTERS = ("pairs_tested", "pairs_in_range", "bonds_formed", "bonds_broken", "neighbour_rebuilds")
+counters = dict.fromkeys(COUNTERS, 0)
+profiler = None
+
+def setup(w, h):
+    """Задать размер мира"""
+    global width, height, grid
+    width = w
+    height = h
+    grid = SpatialHash(width, height, MAX_DIST)
+
+def set_coupling(coupling):
+    """Заменить матрицу взаимодействий (на месте, чтобы ссылки оставались живыми)"""
+    for row, values in zip(COUPLING, coupling):
+        row[:] = values
+    kernel.set_coupling(COUPLING)
+
+def set_types(coupling, links, links_possible):
+    """Задать число типов и их таблицы (списки меняются на месте).
+
+    Хранилище частиц рассчитано на число типов, поэтому при смене числа
+    мир очищается.
+    """
+    resized = len(links) != len(LINKS)
+    COUPLING[:] = [list(row) for row in coupling]
+    LINKS[:] = links
+    LINKS_POSSIBLE[:] = [list(row) for row in links_possible]
+    kernel.set_coupling(COUPLING)
+    kernel.links = np.asarray(LINKS, dtype=np.int64)
+    kernel.links_possible = np.asarray(LINKS_POSSIBLE, dtype=np.int64)
+    if resized:
+        clear_screen()
+
+def random_types(k):
+    """Случайные таблицы для k типов: (COUPLING, LINKS, LINKS_POSSIBLE)"""
+    coupling = [[round(rng.uniform(-1, 1), 1) for _ in range(k)] for _ in range(k)]
+    links = [rng.randint(1, 3) for _ in range(k)]
+    links_possible = [[rng.randint(0, 2) for _ in range(k)] for _ in range(k)]
+    return coupling, links, links_possible
+
+def set_boundaries(enabled):
+    """Включить/выключить границы мира (выключенные - тор)"""
+    global boundaries_enabled
+    boundaries_enabled = enabled
+
+def set_particles(store):
+    """Подменить хранилище частиц целиком"""
+    global particles, bonds
+    particles = store
+    bonds = store.bonds
+
+def seed(value):
+    """Задать зерно генератора симуляции"""
+    rng.seed(value)
+
+def init_simulation():
+    """Инициализация/перезапуск симуляции"""
+    global particles, bonds
+    
+    particles = ParticleStore(len(LINKS), PRECISION)
+    bonds = particles.bonds
+    
+    # Создаем новые частицы (одной пачкой, значения - в прежнем порядке генератора)
+    ptypes = []
+    xs = []
+    ys = []
+    for _ in range(NODE_COUNT):
+        ptypes.append(rng.randint(0, len(LINKS) - 1))
+        xs.append(rng.uniform(0, width))
+        ys.append(rng.uniform(0, height))
+    particles.add_many(ptypes, xs, ys)
+
+def clear_screen():
+    """Удаление всех частиц"""
+    global particles, bonds
+    
+    particles = ParticleStore(len(LINKS), PRECISION)
+    bonds = particles.bonds
+
+def find_particle_at_position(x, y):
+    """Найти частицу в указанной позиции"""
+    hit = particles_in(("circle", x, y, NODE_RADIUS * 2))  # Увеличиваем область клика
+    if len(hit):
+        return particles[int(hit.min())]
+    return None
+
+def particles_in(region):
+    """Индексы частиц в области ("circle", x, y, r) или ("rect", x0, y0, x1, y1).
+
+    Кандидаты берутся из клеток сетки, если она построена для текущего
+    состава частиц, иначе проверяются все частицы. На торе область
+    продолжается через край мира.
+    """
+    if region[0] == "circle":
+        _, cx, cy, r = region
+        x0, y0, x1, y1 = cx - r, cy - r, cx + r, cy + r
+    else:
+        _, x0, y0, x1, y1 = region
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+    if grid.version == particles.version and grid.toroidal != boundaries_enabled:
+        index = grid.query(x0, y0, x1, y1)
+    else:
+        index = np.arange(len(particles))
+    # Смещения от центра области (на торе - кратчайшие)
+    dx = particles.view('x')[index] - (x0 + x1) / 2
+    dy = particles.view('y')[index] - (y0 + y1) / 2
+    if not boundaries_enabled:
+        dx = min_image(dx, width)
+        dy = min_image(dy, height)
+    if region[0] == "circle":
+        keep = dx * dx + dy * dy <= r * r
+    else:
+        keep = (np.abs(dx) <= (x1 - x0) / 2) & (np.abs(dy) <= (y1 - y0) / 2)
+    return index[keep]
+
+def spawn_particles(region, count, ptype):
+    """Создать count частиц типа ptype, равномерно по области (см. particles_in)"""
+    gen = np.random.default_rng(rng.getrandbits(64))
+    if region[0] == "circle":
+        _, cx, cy, r = region
+        radius = r * np.sqrt(gen.random(count))
+        angle = gen.uniform(-meth.pi, meth.pi, count)
+        x = cx + radius * np.cos(angle)
+        y = cy + radius * np.sin(angle)
+    else:
+        _, x0, y0, x1, y1 = region
+        x = gen.uniform(min(x0, x1), max(x0, x1), count)
+        y = gen.uniform(min(y0, y1), max(y0, y1), count)
+    if boundaries_enabled:
+        x = np.clip(x, 0, width)
+        y = np.clip(y, 0, height)
+    else:
+        x %= width
+        y %= height
+    particles.add_many(np.full(count, ptype), x, y)
+
+def erase_particles(region):
+    """Удалить все частицы в области вместе с их связями"""
+    particles.remove_many(particles_in(region).tolist())
+
+def remove_particle(particle):
+    """Удалить частицу и все её связи"""
+    if particle.alive:
+        particles.remove(particle)
+
+def create_particle(x, y, ptype):
+    """Создать новую частицу"""
+    # Ограничиваем область создания границами мира
+    if y > height:
+        y = height
+    
+    return particles.add(ptype, x, y)
+
+def toggle_particle(x, y, ptype):
+    """Клик по миру: удалить частицу в точке или создать новую типа ptype"""
+    particle = find_particle_at_position(x, y)
+    if particle:
+        remove_particle(particle)
+    else:
+        create_particle(x, y, ptype)
+
+def apply_force(a, b):
+    if a is not b:
+        pair_force(a.index, b.index)
+
+def pair_force(i, j):
+    """Сила между частицами с индексами i и j (apply_force() по индексам)"""
+    # Вычисляем расстояние с учетом границ (если они отключены)
+    xs = particles.x
+    ys = particles.y
+    dx = xs[i] - xs[j]
+    dy = ys[i] - ys[j]
+    
+    if not boundaries_enabled:
+        # Для торовой топологии находим кратчайшее расстояние
+        # Учитываем переход через границы
+        if abs(dx) > width / 2:
+            dx = dx - width if dx > 0 else dx + width
+        if abs(dy) > height / 2:
+            dy = dy - height if dy > 0 else dy + height
+    
+    d2 = dx * dx + dy * dy
+    if d2 > MAX_DIST ** 2:
+        return
+    ta = particles.type[i]
+    tb = particles.type[j]
+    links = particles.links
+    dA = COUPLING[ta][tb] / d2 if d2 != 0 else 0
+    dB = COUPLING[tb][ta] / d2 if d2 != 0 else 0
+    if links[i] < LINKS[ta] and links[j] < LINKS[tb]:
+        if d2 < MAX_DIST ** 2 / 4:
+            if not bonds.linked(i, j):
+                typeCountA = bonds.count(i, tb)
+                typeCountB = bonds.count(j, ta)
+                if typeCountA < LINKS_POSSIBLE[ta][tb] and typeCountB < LINKS_POSSIBLE[tb][ta]:
+                    bonds.add(i, j)
+    else:
+        if not bonds.linked(i, j):
+            dA = 1 / d2 if d2 != 0 else 0
+            dB = 1 / d2 if d2 != 0 else 0
+
+    # Направление силы - единичный вектор смещения (для совпавших частиц - вдоль x)
+    if d2 > 0:
+        d = meth.sqrt(d2)
+        ux = dx / d
+        uy = dy / d
+    else:
+        ux = 1.0
+        uy = 0.0
+    if d2 < 1:
+        d2 = 1
+    if d2 < NODE_RADIUS * NODE_RADIUS * 4:
+        dA = 1 / d2
+        dB = 1 / d2
+    sx = particles.sx
+    sy = particles.sy
+    sx[i] += ux * dA * SPEED
+    sy[i] += uy * dA * SPEED
+    sx[j] -= ux * dB * SPEED
+    sy[j] -= uy * dB * SPEED
+
+def logic():
+    """Один шаг симуляции"""
+    global step_count
+    step_count += 1
+    if profiler is None:
+        for _, phase in PHASES:
+            phase()
+        return
+    profiler.lap()
+    for name, phase in PHASES:
+        phase()
+        profiler.lap(name)
+    profiler.count("steps", 1)
+    for name in COUNTERS:
+        profiler.count(name, counters[name])
+
+def integrate():
+    """Движение частиц и обработка границ мира"""
+    xs, ys = particles.x, particles.y
+    vxs, vys = particles.sx, particles.sy
+    
+    # Движение и границы
+    for i in range(len(particles)):
+        x = xs[i] + vxs[i]
+        y = ys[i] + vys[i]
+        sx = vxs[i] * 0.98
+        sy = vys[i] * 0.98
+        mag = meth.hypot(sx, sy)
+        if mag > 1:
+            sx /= mag
+            sy /= mag
+        
+        # Обработка границ
+        if boundaries_enabled:
+            # Обычные границы с отражением
+            if x < BORDER:
+                sx += SPEED * 0.05
+                if x < 0:
+                    x = -x
+                    sx *= -0.5
+            elif x > width - BORDER:
+                sx -= SPEED * 0.05
+                if x > width:
+                    x = width * 2 - x
+                    sx *= -0.5
+            if y < BORDER:
+                sy += SPEED * 0.05
+                if y < 0:
+                    y = -y
+                    sy *= -0.5
+            elif y > height - BORDER:
+                sy -= SPEED * 0.05
+                if y > height:
+                    y = height * 2 - y
+                    sy *= -0.5
+        else:
+            # Торовые границы - переход через границы
+            if x < 0:
+                x = width + x
+            elif x > width:
+                x = x - width
+            if y < 0:
+                y = height + y
+            elif y > height:
+                y = y - height
+        xs[i] = x
+        ys[i] = y
+        vxs[i] = sx
+        vys[i] = sy
+
+def update_bonds():
+    """Пружины связей и разрыв растянутых связей (все связи разом)"""
+    ea, eb = bonds.views()
+    x = particles.view('x')
+    y = particles.view('y')
+    dx = x[ea] - x[eb]
+    dy = y[ea] - y[eb]
+    if not boundaries_enabled:
+        # Для торовой топологии находим кратчайшее расстояние
+        dx = min_image(dx, width)
+        dy = min_image(dy, height)
+    d2 = dx * dx + dy * dy
+    broken = d2 > MAX_DIST ** 2 / 4
+    spring = ~broken & (d2 > NODE_RADIUS ** 2 * 4)
+    d = np.sqrt(d2[spring])  # Пружина действует только на расстоянии больше 2*NODE_RADIUS
+    fx = dx[spring] / d * LINK_FORCE * SPEED
+    fy = dy[spring] / d * LINK_FORCE * SPEED
+    n = len(particles)
+    sa, sb = ea[spring], eb[spring]
+    particles.view('sx')[:] += np.bincount(sa, fx, minlength=n) - np.bincount(sb, fx, minlength=n)
+    particles.view('sy')[:] += np.bincount(sa, fy, minlength=n) - np.bincount(sb, fy, minlength=n)
+    broken = np.flatnonzero(broken).tolist()
+    del ea, eb  # Отпускаем массивы связей перед удалением
+    bonds.remove_slots(broken)
+    counters["bonds_broken"] = len(broken)
+
+def migrate():
+    """Раскладывает частицы по клеткам сетки или обновляет список соседей"""
+    global neighbours
+    x = particles.view('x')
+    y = particles.view('y')
+    if SKIN > 0 and ENGINE != "parallel":
+        if neighbours is None or (neighbours.cutoff, neighbours.skin) != (MAX_DIST, SKIN):
+            neighbours = NeighbourList(MAX_DIST, SKIN)
+        rebuilt = neighbours.update(x, y, particles.version, width, height, not boundaries_enabled)
+        counters["neighbour_rebuilds"] = int(rebuilt)
+    else:
+        neighbours = None
+        grid.build(x, y, not boundaries_enabled)
+        grid.version = particles.version
+        counters["neighbour_rebuilds"] = 0
+
+def candidate_pairs():
+    """Пары-кандидаты шага: из списка соседей или по сетке"""
+    return grid.pairs() if neighbours is None else neighbours.pairs()
+
+def apply_forces():
+    """Силы между частицами (только в соседних клетках) выбранным движком"""
+    kernel.pairs_in_range = 0
+    before = len(bonds)
+    if ENGINE == "numpy":
+        apply_forces_numpy()
+    elif ENGINE == "parallel":
+        apply_forces_parallel()
+    else:
+        apply_forces_python()
+    counters["pairs_tested"] = grid.pair_count() if neighbours is None else len(neighbours)
+    counters["pairs_in_range"] = kernel.pairs_in_range
+    counters["bonds_formed"] = len(bonds) - before
+
+def apply_forces_python():
+    """Силы между частицами поштучно через apply_force()"""
+    x = particles.view('x')
+    y = particles.view('y')
+    wrap = None if boundaries_enabled else (width, height)
+    for pa, pb in candidate_pairs():
+        # Дальние пары отсекаются пакетно, pair_force() их все равно пропускает
+        pa, pb = kernel.in_range(x, y, pa, pb, wrap)
+        for i, j in zip(pa.tolist(), pb.tolist()):
+            pair_force(i, j)
+
+def apply_forces_numpy():
+    """Силы между частицами на NumPy-ядре"""
+    if len(particles) == 0:
+        return
+    x = particles.view('x')
+    y = particles.view('y')
+    ptype = particles.view('type').astype(np.int64)
+    links = particles.view('links').astype(np.int64)
+
+    wrap = None if boundaries_enabled else (width, height)
+    dsx, dsy, formed = kernel.run(x, y, ptype, links, bonds.type_counts(), *bonds.views(),
+                                  candidate_pairs(), wrap)
+
+    particles.view('sx')[:] += dsx
+    particles.view('sy')[:] += dsy
+    for i, j in formed:
+        bonds.add(i, j)
+
+def apply_forces_parallel():
+    """Силы между частицами в нескольких процессах"""
+    global parallel_forces
+    if len(particles) == 0:
+        return
+    if parallel_forces is None:
+        from parallel import ParallelForces
+        parallel_forces = ParallelForces(WORKERS)
+    x = particles.view('x')
+    y = particles.view('y')
+    ptype = particles.view('type').astype(np.int64)
+    links = particles.view('links').astype(np.int64)
+
+    wrap = None if boundaries_enabled else (width, height)
+    dsx, dsy, formed = parallel_forces.run(kernel, x, y, ptype, links, bonds.type_counts(),
+                                           *bonds.views(), grid, wrap)
+
+    particles.view('sx')[:] += dsx
+    particles.view('sy')[:] += dsy
+    for i, j in formed:
+        bonds.add(i, j)
+
+# Фазы шага по порядку: (имя, функция) - для logic() и замеров по фазам
+PHASES = (
+    ("integrate", integrate),
+    ("bonds", update_bonds),
+    ("migrate", migrate),
+    ("forces", apply_forces),
+)
+
+def stats():
+    """Сводка состояния: частицы и связи, средние связи по типам, энергия, структуры"""
+    n = len(particles)
+    ptype = particles.view('type')
+    links = particles.view('links')
+    sx = particles.view('sx')
+    sy = particles.view('sy')
+    counts = np.bincount(ptype, minlength=len(LINKS))
+    link_sums = np.bincount(ptype, weights=links, minlength=len(LINKS))
+    mean_links = np.divide(link_sums, counts, out=np.zeros(len(LINKS)), where=counts > 0)
+    sizes = structure_summary()[0]
+    return {
+        "particles": n,
+        "bonds": len(bonds),
+        "types": counts.tolist(),
+        "mean_links": [round(v, 4) for v in mean_links.tolist()],
+        "kinetic_energy": float(0.5 * np.sum(sx * sx + sy * sy)),
+        "structures": len(sizes),
+        "largest_structure": int(sizes[0]) if len(sizes) else 0,
+    }
+
+def structure_summary(min_size=2):
+    """Связные структуры: (sizes, cx, cy) по убыванию размера (см. Structures.summary)"""
+    wrap = None if boundaries_enabled else (width, height)
+    return bonds.structures.summary(particles.view('x'), particles.view('y'), wrap, min_size)
+
+def state_hash():
+    """Отпечаток состояния для сверки с эталонной траекторией.
+
+    Учитываются точные значения всех столбцов частиц и набор связей без
+    учета их порядка в массивах, поэтому совпадение отпечатков означает
+    побитово одинаковое состояние.
+    """
+    h = hashlib.sha256()
+    for column in (particles.x, particles.y, particles.sx, particles.sy,
+                   particles.type, particles.links):
+        h.update(column.tobytes())
+    ea, eb = bonds.views()
+    h.update(np.sort(np.minimum(ea, eb) * len(particles) + np.maximum(ea, eb)).tobytes())
+    return h.hexdigest()
@@ -0,0 +1,79 @@
+"""Замеры по фазам кадра и счетчики шага с историей и записью в файл.
+
+Время фаз (в миллисекундах) набирается отсечками lap(): каждая отсечка
+добавляет время с предыдущей к своей фазе текущего кадра, счетчики
+складываются через count(). end_frame() закрывает кадр, кладет его
+в историю последних кадров и, если открыт журнал, дописывает строку
+в CSV или JSONL.
+"""
+import csv
+import json
+from collections import deque
+from time import perf_counter
+
+
+class Profiler:
+    """Профиль кадров: timings и counters - имена фаз и счетчиков по порядку"""
+
+    def __init__(self, timings=(), counters=(), history=120):
+        self.timings = list(timings)
+        self.counters = list(counters)
+        self.history = deque(maxlen=history)
+        self.frame = 0
+        self.current = {}
+        self.log = None
+        self.writer = None
+        self._last = perf_counter()
+
+    def lap(self, name=None):
+        """Отсечка: время с прошлой отсечки идет фазе name (None - только сброс)"""
+        now = perf_counter()
+        if name is not None:
+            self.current[name] = self.current.get(name, 0.0) + (now - self._last) * 1000
+        self._last = now
+
+    def count(self, name, value):
+        self.current[name] = self.current.get(name, 0) + value
+
+    def end_frame(self):
+        """Закрыть кадр: в историю и в журнал"""
+        record = {"frame": self.frame}
+        for name in self.timings + self.counters:
+            record[name] = self.current.get(name, 0)
+        for name, value in self.current.items():
+            record.setdefault(name, value)
+        self.history.append(record)
+        self.frame += 1
+        self.current = {}
+        if self.log is not None:
+            self._write(record)
+
+    def series(self, name):
+        """Значения name за кадры истории, от старых к новым"""
+        return [record.get(name, 0) for record in self.history]
+
+    def mean(self, name):
+        values = self.series(name)
+        return sum(values) / len(values) if values else 0
+
+    def open_log(self, path):
+        """Писать кадры в файл: .csv - таблица, иначе JSONL"""
+        self.close()
+        self.log = open(path, "w", newline="")
+        if path.endswith(".csv"):
+            fields = ["frame"] + self.timings + self.counters
+            self.writer = csv.DictWriter(self.log, fields, restval=0, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+        self.log = None
+        self.writer = None
+
+    def _write(self, record):
+        record = {k: round(v, 4) if isinstance(v, float) else v for k, v in record.items()}
+        if self.writer is not None:
+            self.writer.writerow(record)
+        else:
+            self.log.write(json.dumps(record) + "\n")
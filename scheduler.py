@@ -0,0 +1,362 @@
+"""Фиксированный шаг физики, отделенный от отрисовки.
+
+FixedStep копит прошедшее время в аккумуляторе и решает, сколько шагов
+logic() выполнить за кадр, не выходя за бюджет кадра по измеренной
+стоимости шага. Отрисовка работает со снимками Snapshot, а не с живым
+состоянием, поэтому физику можно вынести в фоновый поток (ThreadRunner)
+или процесс (ProcessRunner), а кадр рисовать с интерполяцией между двумя
+последними снимками. Все изменения мира идут через runner.call(), чтобы
+они выполнялись там, где живет физика. ReplayRunner вместо расчета
+проигрывает записанную траекторию (statefile.Trajectory).
+"""
+import multiprocessing
+import threading
+import time
+import numpy as np
+import physics
+from kernel import min_image
+
+
+class FixedStep:
+    """Аккумулятор времени для шагов длиной 1 / rate секунд"""
+
+    def __init__(self, rate, budget, max_substeps=16):
+        self.dt = 1.0 / rate
+        self.budget = budget            # Секунд на физику за кадр
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0
+        self.step_cost = 0.0            # Сглаженное время одного шага
+
+    def substeps(self, elapsed):
+        """Сколько шагов выполнить за кадр, если с прошлого прошло elapsed секунд"""
+        self.accumulator += elapsed
+        n = int(self.accumulator // self.dt)
+        limit = self.max_substeps
+        if self.step_cost > 0:
+            limit = min(limit, max(1, int(self.budget // self.step_cost)))
+        if n > limit:
+            # Физика не успевает за временем: мир замедляется, а долг не копится
+            n = limit
+            self.accumulator = n * self.dt
+        self.accumulator -= n * self.dt
+        return n
+
+    def record(self, seconds):
+        """Учесть время выполненного шага"""
+        if self.step_cost == 0:
+            self.step_cost = seconds
+        else:
+            self.step_cost = 0.9 * self.step_cost + 0.1 * seconds
+
+    @property
+    def alpha(self):
+        """Доля шага, накопленная сверх выполненных шагов"""
+        return min(self.accumulator / self.dt, 1.0)
+
+
+class Snapshot:
+    """Копия состояния для отрисовки"""
+    __slots__ = ('x', 'y', 'type', 'bond_a', 'bond_b', 'version', 'step',
+                 'boundaries', 'width', 'height', 'time', 'cells', 'structures')
+
+    @classmethod
+    def capture(cls):
+        """Снимок текущего состояния physics"""
+        snap = cls()
+        particles = physics.particles
+        ea, eb = physics.bonds.views()
+        snap.x = particles.view('x').copy()
+        snap.y = particles.view('y').copy()
+        snap.type = particles.view('type').copy()
+        snap.bond_a = ea.copy()
+        snap.bond_b = eb.copy()
+        snap.version = particles.version
+        snap.step = physics.step_count
+        snap.boundaries = physics.boundaries_enabled
+        snap.width = physics.width
+        snap.height = physics.height
+        snap.time = time.monotonic()
+        # Разбиение по клеткам для отсечения невидимого (None - сетка устарела)
+        grid = physics.grid
+        fresh = grid.version == particles.version and grid.toroidal != physics.boundaries_enabled
+        snap.cells = grid.cells() if fresh else None
+        snap.structures = physics.structure_summary()   # (sizes, cx, cy)
+        return snap
+
+    def __len__(self):
+        return len(self.x)
+
+    def blend(self, prev, alpha):
+        """Снимок с позициями между prev и self; alpha = 0 - prev, 1 - self"""
+        if prev is None or prev.version != self.version or alpha >= 1:
+            return self
+        dx = self.x - prev.x
+        dy = self.y - prev.y
+        snap = Snapshot()
+        for name in self.__slots__:
+            setattr(snap, name, getattr(self, name))
+        if self.boundaries:
+            snap.x = prev.x + dx * alpha
+            snap.y = prev.y + dy * alpha
+        else:
+            # На торе частица могла перейти через край - идем коротким путем
+            snap.x = (prev.x + min_image(dx, self.width) * alpha) % self.width
+            snap.y = (prev.y + min_image(dy, self.height) * alpha) % self.height
+        return snap
+
+
+def _command(fn):
+    """Функция physics по имени или сама функция (например, statefile.load)"""
+    return getattr(physics, fn) if isinstance(fn, str) else fn
+
+
+def _between(prev, cur, now):
+    """Доля для blend() по времени: кадр отстает от физики на один интервал снимков"""
+    if prev is None or cur.time <= prev.time:
+        return 1.0
+    return min(max((now - cur.time) / (cur.time - prev.time), 0.0), 1.0)
+
+
+class InlineRunner:
+    """Физика в потоке отрисовки: несколько шагов за кадр по FixedStep"""
+
+    def __init__(self, rate, budget):
+        self.clock = FixedStep(rate, budget)
+        self.paused = False
+        self.prev = None
+        self.cur = Snapshot.capture()
+
+    def call(self, fn, *args):
+        result = _command(fn)(*args)
+        self.prev = None
+        self.cur = Snapshot.capture()
+        return result
+
+    def set_paused(self, paused):
+        self.paused = paused
+        self.clock.accumulator = 0.0
+        self.prev = None
+
+    def frame(self, elapsed):
+        """Выполнить положенные шаги; возвращает снимок для отрисовки"""
+        n = 0 if self.paused else self.clock.substeps(elapsed)
+        for k in range(n):
+            if k == n - 1:
+                self.prev = self.cur if k == 0 else Snapshot.capture()
+            start = time.perf_counter()
+            physics.logic()
+            self.clock.record(time.perf_counter() - start)
+        if n:
+            self.cur = Snapshot.capture()
+        return self.cur.blend(self.prev, self.clock.alpha)
+
+    def latest(self):
+        """Последний снимок после шага физики (без интерполяции)"""
+        return self.cur
+
+    def close(self):
+        pass
+
+
+class ThreadRunner:
+    """Физика в фоновом потоке с частотой rate шагов в секунду.
+
+    Снимок снимается не после каждого шага, а после первого шага с тех
+    пор, как отрисовка (frame() или latest()) попросила новый, - как
+    у ProcessRunner.
+    """
+
+    def __init__(self, rate, max_lag=8):
+        self.dt = 1.0 / rate
+        self.max_lag = max_lag          # Наибольшее отставание в шагах, дальше - пропуск
+        self.lock = threading.Lock()
+        self.paused = False
+        self.running = True
+        self.wanted = True              # Отрисовка ждет снимок
+        self.pair = (None, Snapshot.capture())
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        next_time = time.perf_counter()
+        while self.running:
+            now = time.perf_counter()
+            if self.paused:
+                next_time = now
+                time.sleep(self.dt)
+                continue
+            if now < next_time:
+                time.sleep(next_time - now)
+                continue
+            with self.lock:
+                physics.logic()
+                if self.wanted:
+                    self.wanted = False
+                    self.pair = (self.pair[1], Snapshot.capture())
+            next_time += self.dt
+            if now - next_time > self.max_lag * self.dt:
+                next_time = now
+
+    def call(self, fn, *args):
+        with self.lock:
+            result = _command(fn)(*args)
+            self.pair = (None, Snapshot.capture())
+        return result
+
+    def set_paused(self, paused):
+        self.paused = paused
+
+    def frame(self, elapsed):
+        self.wanted = True
+        prev, cur = self.pair
+        return cur.blend(prev, _between(prev, cur, time.monotonic()))
+
+    def latest(self):
+        self.wanted = True
+        return self.pair[1]
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+
+def _process_main(conn, config, store, rate, max_lag):
+    """Цикл физики в дочернем процессе: команды и запросы снимков через conn"""
+    tables = config.pop('tables')
+    for name, value in config.items():
+        setattr(physics, name, value)
+    physics.setup(config['width'], config['height'])
+    physics.set_types(*tables)
+    physics.set_particles(store)
+    dt = 1.0 / rate
+    paused = False
+    wanted = True      # Родитель ждет снимок
+    fresh = True       # Есть снимок, который родитель еще не видел
+    next_time = time.perf_counter()
+    while True:
+        while conn.poll():
+            try:
+                message = conn.recv()
+            except EOFError:
+                return  # Родительский процесс завершился
+            if message[0] == "stop":
+                return
+            if message[0] == "want":
+                wanted = True
+            elif message[0] == "pause":
+                paused = message[1]
+            elif message[0] == "call":
+                _command(message[1])(*message[2])
+                fresh = True
+        if wanted and fresh:
+            conn.send(Snapshot.capture())
+            wanted = fresh = False
+        now = time.perf_counter()
+        if paused:
+            next_time = now
+            conn.poll(dt)
+            continue
+        if now < next_time:
+            conn.poll(next_time - now)
+            continue
+        physics.logic()
+        fresh = True
+        next_time += dt
+        if now - next_time > max_lag * dt:
+            next_time = now
+
+
+class ProcessRunner:
+    """Физика в отдельном процессе; родитель получает не больше одного снимка за раз"""
+
+    def __init__(self, rate, max_lag=8):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        config = {
+            'ENGINE': physics.ENGINE, 'WORKERS': physics.WORKERS, 'SKIN': physics.SKIN,
+            'PRECISION': physics.PRECISION,
+            'tables': ([row[:] for row in physics.COUPLING], physics.LINKS[:],
+                       [row[:] for row in physics.LINKS_POSSIBLE]),
+            'boundaries_enabled': physics.boundaries_enabled,
+            'width': physics.width, 'height': physics.height,
+            'rng': physics.rng,
+        }
+        self.process = context.Process(target=_process_main,
+                                       args=(child, config, physics.particles, rate, max_lag))
+        self.process.start()
+        self.pair = (None, Snapshot.capture())
+
+    def call(self, fn, *args):
+        """Команда выполняется в дочернем процессе; результат не возвращается"""
+        self.conn.send(("call", fn, args))
+
+    def set_paused(self, paused):
+        self.conn.send(("pause", paused))
+
+    def frame(self, elapsed):
+        received = False
+        while self.conn.poll():
+            self.pair = (self.pair[1], self.conn.recv())
+            received = True
+        if received:
+            self.conn.send(("want",))
+        prev, cur = self.pair
+        return cur.blend(prev, _between(prev, cur, time.monotonic()))
+
+    def latest(self):
+        return self.pair[1]
+
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(("stop",))
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ReplayRunner:
+    """Проигрывание траектории: rate шагов физики в секунду, команды мира не действуют.
+
+    Темп задают номера шагов кадров, поэтому запись с пропусками шагов
+    (по кадрам окна или --record-every) идет с той же скоростью, что и расчет.
+    """
+
+    def __init__(self, trajectory, rate):
+        if len(trajectory) == 0:
+            raise ValueError("в траектории нет кадров (запись остановлена до первого кадра?)")
+        self.trajectory = trajectory
+        self.rate = rate
+        self.steps = trajectory.steps()
+        self.position = float(self.steps[0])    # Текущий шаг физики
+        self.paused = False
+
+    def call(self, fn, *args):
+        pass
+
+    def set_paused(self, paused):
+        self.paused = paused
+
+    def index(self):
+        """Номер кадра, на котором стоит проигрывание"""
+        return max(int(np.searchsorted(self.steps, self.position, "right")) - 1, 0)
+
+    def seek(self, frames):
+        """Сдвиг на frames кадров"""
+        k = min(max(self.index() + frames, 0), len(self.steps) - 1)
+        self.position = float(self.steps[k])
+
+    def frame(self, elapsed):
+        if not self.paused:
+            self.position = min(self.position + elapsed * self.rate, float(self.steps[-1]))
+        k = self.index()
+        cur = self.trajectory[k]
+        if k + 1 < len(self.steps):
+            alpha = (self.position - self.steps[k]) / (self.steps[k + 1] - self.steps[k])
+            return self.trajectory[k + 1].blend(cur, alpha)
+        return cur
+
+    def latest(self):
+        return self.trajectory[self.index()]
+
+    def close(self):
+        pass
@@ -1,31 +1,53 @@
 import pygame
+import os
 import random
 import math as meth
 import numpy as np
 import sys
 from pygame.locals import *
 import time
+import physics
+from profiler import Profiler
+import statefile
+from scheduler import InlineRunner, ThreadRunner, ProcessRunner, ReplayRunner, Snapshot
+from stream import StreamRunner
+from grid import query_cells
+from kernel import min_image
+from physics import NODE_RADIUS, MAX_DIST, COUPLING, init_simulation
 
 # Константы
-MAX_DIST = 100
-NODE_RADIUS = 5
-NODE_COUNT = 850
-SPEED = 4
 PLAYBACK_SPEED = 3
-BORDER = 30
-LINK_FORCE = -0.015
+STEP_RATE = PLAYBACK_SPEED * 60  # Шагов физики в секунду
+PHYSICS_BUDGET = 0.010  # Секунд на физику за кадр при расчете в потоке отрисовки
+FPS_LIMIT = 60
+SNAPSHOT_PATH = "snapshot.pstate"  # Файл состояния для F5 (сохранить) / F9 (загрузить)
+# Перемотка записи (--replay): клавиша -> сдвиг в кадрах
+REPLAY_SEEK = {pygame.K_COMMA: -1, pygame.K_PERIOD: 1, pygame.K_PAGEUP: -100, pygame.K_PAGEDOWN: 100}
+STATUS_HEIGHT = 40  # Высота строки состояния
+INLINE_MATRIX_TYPES = 3  # До стольких типов матрица видна в строке состояния, дальше - панелью
+MATRIX_CELL = 36  # Клетка панели матрицы
+# Клавиши выбора типа: 1-9 и 0 - типы 0-9, дальше - Tab / Shift+Tab
+TYPE_KEYS = {pygame.K_1 + i: i for i in range(9)}
+TYPE_KEYS[pygame.K_0] = 9
+# Камера: колесо - масштаб, правая кнопка - сдвиг, стрелки - сдвиг на долю окна, Home - весь мир
+ZOOM_STEP = 1.1
+MAX_ZOOM = 8.0
+PAN_STEP = 0.1
+# Уровень детализации: при плотности больше LOD_DENSITY видимых частиц на пиксель
+# вместо частиц рисуется тепловая карта из клеток LOD_CELL пикселей (L - вкл/выкл)
+LOD_DENSITY = 1 / 256
+LOD_CELL = 4
+LOD_GAIN = 0.7
+# Кисть: Shift + перетаскивание левой кнопкой - создать частицы, Ctrl - стереть;
+# G - круг или прямоугольник. Частиц на пиксель мира и наибольшее число за раз
+BRUSH_DENSITY = 1 / 400
+BRUSH_MAX = 20000
+ERASE_COLOR = (255, 60, 60)
+# Обводка связных структур (O): не меньше STRUCTURE_MIN частиц
+STRUCTURE_MIN = 3
+STRUCTURE_COLOR = (255, 255, 255)
+PAN_KEYS = {pygame.K_LEFT: (-1, 0), pygame.K_RIGHT: (1, 0), pygame.K_UP: (0, -1), pygame.K_DOWN: (0, 1)}
 
-COUPLING = [
-    [1, 1, -1],
-    [1, 1, 1],
-    [1, 1, 1]
-]
-LINKS = [1, 3, 2]
-LINKS_POSSIBLE = [
-    [0, 1, 1],
-    [1, 2, 1],
-    [1, 1, 2]
-]
 COLORS = [
     (255, 0, 255),    # Красный
     (255, 255, 255),   # Зеленый
@@ -61,45 +83,104 @@ COLOR_PROFILES = [
 ]
 
 def get_random_profile():
-    global COLORS, BG
     profile = random.choice(COLOR_PROFILES)
     # Преобразуем hex-коды в RGB tuple
     rgb = [tuple(int(profile[i][j:j+2], 16) for j in (1, 3, 5)) for i in range(len(profile))]
     print(profile)
-    COLORS = rgb
+    set_palette(rgb[:-1])  # Последний цвет профиля - черный фон
+
+def set_palette(colors):
+    """Цвета типов; если цветов меньше, чем типов, остальные - по кругу оттенков"""
+    global COLORS
+    COLORS = [tuple(color) for color in colors[:len(physics.LINKS)]]
+    for t in range(len(COLORS), len(physics.LINKS)):
+        color = pygame.Color(0)
+        color.hsva = (t * 137.5 % 360, 70, 100, 100)
+        COLORS.append(tuple(color)[:3])
+    make_bond_colors()
+    make_lights()
+
+def make_bond_colors():
+    """Цвета связей по парам типов: BOND_COLORS[a * K + b] - смешанный цвет двух частиц"""
+    global BOND_COLORS
+    BOND_COLORS = [tuple((ca + cb) // 2 for ca, cb in zip(color_a, color_b))
+                   for color_a in COLORS for color_b in COLORS]
+
+def show_world(header):
+    """Таблицы типов и палитра из заголовка файла состояния или траектории"""
+    global selected_particle_type, selected_matrix_i, selected_matrix_j
+    physics.set_types(header["coupling"], header["links"], header["links_possible"])
+    k = len(physics.LINKS)
+    selected_particle_type %= k
+    selected_matrix_i %= k
+    selected_matrix_j %= k
+    set_palette(header.get("palette") or COLORS)
 
 # Переменные управления
 paused = False
-selected_particle_type = 0  # Тип частицы для создания (0, 1, 2)
+selected_particle_type = 0  # Тип частицы для создания
 editing_matrix = False  # Режим редактирования матрицы
 selected_matrix_i = 0
 selected_matrix_j = 0
-boundaries_enabled = True  # Включены ли границы экрана
 
-pygame.init()
-screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-width, height = screen.get_size()
-fw = width // MAX_DIST + 1
-fh = height // MAX_DIST + 1
-
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, 28)
+# Окно создается в open_window()
+screen = None
+width = height = 0
+clock = None
+font = None
+profile_font = None
 fps = 0
 
-class LIGHT:
-    def __init__(self, size, pixel_shader):
-        self.size = size
-        self.radius = size * 0.5
-        self.render_surface = pygame.Surface((size, size))
-        self.pixel_shader_surf = pixel_shader.copy()
-        self.baked_pixel_shader_surf = pixel_shader.copy()
-        self.render_surface.set_colorkey((0,0,0))
-
-    def main(self, display, x, y):
-        self.render_surface.fill((0,0,0))
-        self.render_surface.blit(self.pixel_shader_surf, (0, 0))
-        display.blit(self.render_surface, (x - self.radius, y - self.radius), special_flags=BLEND_ADD)
-        return display
+# Профиль кадра: события, фазы logic() (все подшаги кадра вместе), этапы draw_scene()
+DRAW_STAGES = ("clear", "heatmap", "glow", "lines", "circles", "structures", "ui", "overlay", "flip")
+PROFILE_ROW = 18  # Высота строки оверлея профиля
+profiler = Profiler(("events",) + tuple(name for name, _ in physics.PHASES) + DRAW_STAGES + ("tick",),
+                    ("steps",) + physics.COUNTERS)
+show_profiler = False
+runner = None  # Где выполняется физика: InlineRunner, ThreadRunner, ProcessRunner, ReplayRunner
+recorder = None  # statefile.TrajectoryWriter при записи траектории (--record PATH)
+
+# Строка состояния собирается заново только при смене того, что в ней показано
+GLYPH_CACHE_SIZE = 512
+glyph_cache = {}
+status_bar = None
+status_key = None
+fps_x = 0
+matrix_panel = None
+matrix_key = None
+
+# Камера: левый верхний угол видимой части мира и пикселей экрана на единицу мира
+camera_x = camera_y = 0.0
+camera_zoom = 1.0
+dragging = False
+lod_enabled = True
+lod_active = False  # Последний кадр нарисован тепловой картой
+show_structures = False
+brush_shape = "circle"
+brush = None  # Перетаскивание кистью: ("spawn" или "erase", точка начала на экране)
+
+def open_window(size=None, offscreen=False, world=None):
+    """Создать окно (по умолчанию на весь экран) и мир по его размеру.
+
+    offscreen=True - вместо окна поверхность size в памяти (запись кадров);
+    world - размер мира (w, h), если он не совпадает с окном.
+    """
+    global screen, width, height, clock, font, profile_font, status_key, matrix_key
+    pygame.init()
+    if offscreen:
+        screen = pygame.Surface(size)
+    elif size is None:
+        screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    else:
+        screen = pygame.display.set_mode(size)
+    width, height = screen.get_size()
+    physics.setup(*(world or (width, height - STATUS_HEIGHT)))  # По умолчанию мир - экран без строки состояния
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, 28)
+    profile_font = pygame.font.Font(None, 20)
+    glyph_cache.clear()
+    status_key = matrix_key = None
+    set_palette(COLORS)
 
 def pixel_shader(size, color, intensity):
     final_array = np.zeros((size, size, 3), dtype=np.float64)
@@ -128,523 +209,613 @@ def pixel_shader(size, color, intensity):
 
     return pygame.surfarray.make_surface(final_array.astype(np.uint8))
 
-class Particle:
-    def __init__(self, ptype, x, y):
-        self.type = ptype
-        self.x = x
-        self.y = y
-        self.sx = 0
-        self.sy = 0
-        self.links = 0
-        self.bonds = []
-        # Создаем источник света для частицы
-        light_size = NODE_RADIUS * 8
-        light_intensity = 1
-        self.light = LIGHT(light_size, pixel_shader(light_size, COLORS[ptype], light_intensity))
-
-    @property
-    def fx(self):
-        return int(self.x // MAX_DIST)
-    @property
-    def fy(self):
-        return int(self.y // MAX_DIST)
-
-class Field:
-    def __init__(self):
-        self.particles = []
-
-def init_simulation():
-    """Инициализация/перезапуск симуляции"""
-    global fields, particles, bonds
-    
-    # Очищаем поля
-    fields = [[Field() for _ in range(fh)] for _ in range(fw)]
-    particles = []
-    bonds = []
-    
-    # Создаем новые частицы
-    for _ in range(NODE_COUNT):
-        ptype = random.randint(0, 2)
-        x = random.uniform(0, width)
-        y = random.uniform(0, height)
-        p = Particle(ptype, x, y)
-        fields[p.fx][p.fy].particles.append(p)
-        particles.append(p)
-
-def clear_screen():
-    """Очистка экрана от всех частиц"""
-    global fields, particles, bonds
-    
-    fields = [[Field() for _ in range(fh)] for _ in range(fw)]
-    particles = []
-    bonds = []
-
-def find_particle_at_position(x, y):
-    """Найти частицу в указанной позиции"""
-    for p in particles:
-        dx = p.x - x
-        dy = p.y - y
-        if dx*dx + dy*dy <= (NODE_RADIUS * 2)**2:  # Увеличиваем область клика
-            return p
-    return None
-
-def remove_particle(particle):
-    """Удалить частицу и все её связи"""
-    global particles, bonds
-    
-    # Удаляем все связи с этой частицей
-    for bond in bonds[:]:
-        a, b = bond
-        if a is particle or b is particle:
-            if a is particle:
-                b.links -= 1
-                if particle in b.bonds:
-                    b.bonds.remove(particle)
-            else:
-                a.links -= 1
-                if particle in a.bonds:
-                    a.bonds.remove(particle)
-            bonds.remove(bond)
-    
-    # Удаляем частицу из поля
-    try:
-        fields[particle.fx][particle.fy].particles.remove(particle)
-    except ValueError:
-        pass
-    
-    # Удаляем из общего списка
-    if particle in particles:
-        particles.remove(particle)
-
-def create_particle(x, y, ptype):
-    """Создать новую частицу"""
-    # Ограничиваем область создания, чтобы не создавать в строке состояния
-    if y > height - 40:
-        y = height - 40
-    
-    p = Particle(ptype, x, y)
-    fields[p.fx][p.fy].particles.append(p)
-    particles.append(p)
-
-def remove_from_list(lst, item):
-    try:
-        lst.remove(item)
-    except ValueError:
-        pass
-
-def apply_force(a, b):
-    if a is b:
-        return
-    
-    # Вычисляем расстояние с учетом границ (если они отключены)
-    dx = a.x - b.x
-    dy = a.y - b.y
-    
-    if not boundaries_enabled:
-        # Для торовой топологии находим кратчайшее расстояние
-        # Учитываем переход через границы
-        if abs(dx) > width / 2:
-            dx = dx - width if dx > 0 else dx + width
-        if abs(dy) > (height - 40) / 2:  # Учитываем высоту строки состояния
-            dy = dy - (height - 40) if dy > 0 else dy + (height - 40)
-    
-    d2 = dx * dx + dy * dy
-    if d2 > MAX_DIST ** 2:
+# Готовые поверхности свечения по цвету: палитры меняются редко, а
+# pixel_shader() дорогой, поэтому каждое свечение строится один раз
+LIGHT_SIZE = NODE_RADIUS * 8
+light_cache = {}
+scaled_lights = {}  # Размер -> свечения текущей палитры под масштаб камеры
+# Запас отсечения в единицах мира: свечение и связи, концы которых за краем окна
+CULL_MARGIN = max(LIGHT_SIZE // 2, MAX_DIST // 4) + 4
+
+def make_lights():
+    """Свечение для каждого типа частиц в текущей палитре"""
+    global lights
+    lights = []
+    for color in COLORS:
+        if color not in light_cache:
+            light_cache[color] = pixel_shader(LIGHT_SIZE, color, 1).convert(screen)
+        lights.append(light_cache[color])
+    scaled_lights.clear()
+
+def lights_for(size):
+    """Свечения палитры размером size (под масштаб камеры)"""
+    if size == LIGHT_SIZE:
+        return lights
+    if size not in scaled_lights:
+        if len(scaled_lights) >= 32:
+            scaled_lights.clear()
+        scaled_lights[size] = [pygame.transform.smoothscale(light, (size, size)) for light in lights]
+    return scaled_lights[size]
+
+def fit_zoom(view):
+    """Масштаб, при котором мир целиком помещается в окно"""
+    return min(width / view.width, (height - STATUS_HEIGHT) / view.height)
+
+def fit_camera(view):
+    """Камера на весь мир"""
+    global camera_zoom
+    camera_zoom = fit_zoom(view)
+    clamp_camera(view)
+
+def clamp_camera(view):
+    """Масштаб - от всего мира до MAX_ZOOM; на торе камера ходит по кругу, иначе - в пределах мира"""
+    global camera_x, camera_y, camera_zoom
+    camera_zoom = min(max(camera_zoom, fit_zoom(view)), MAX_ZOOM)
+    if not view.boundaries:
+        camera_x %= view.width
+        camera_y %= view.height
         return
-    dA = COUPLING[a.type][b.type] / d2 if d2 != 0 else 0
-    dB = COUPLING[b.type][a.type] / d2 if d2 != 0 else 0
-    if a.links < LINKS[a.type] and b.links < LINKS[b.type]:
-        if d2 < MAX_DIST ** 2 / 4:
-            if b not in a.bonds and a not in b.bonds:
-                typeCountA = sum(1 for p in a.bonds if p.type == b.type)
-                typeCountB = sum(1 for p in b.bonds if p.type == a.type)
-                if typeCountA < LINKS_POSSIBLE[a.type][b.type] and typeCountB < LINKS_POSSIBLE[b.type][a.type]:
-                    a.bonds.append(b)
-                    b.bonds.append(a)
-                    a.links += 1
-                    b.links += 1
-                    bonds.append((a, b))
+    camera_x = _clamp_axis(camera_x, width / camera_zoom, view.width)
+    camera_y = _clamp_axis(camera_y, (height - STATUS_HEIGHT) / camera_zoom, view.height)
+
+def _clamp_axis(pos, visible, size):
+    if visible >= size:
+        return (size - visible) / 2  # Мир уже окна - по центру
+    return min(max(pos, 0), size - visible)
+
+def zoom_camera(view, factor, pos):
+    """Масштаб в factor раз; точка мира под pos остается на месте"""
+    global camera_x, camera_y, camera_zoom
+    wx = camera_x + pos[0] / camera_zoom
+    wy = camera_y + pos[1] / camera_zoom
+    camera_zoom = min(max(camera_zoom * factor, fit_zoom(view)), MAX_ZOOM)
+    camera_x = wx - pos[0] / camera_zoom
+    camera_y = wy - pos[1] / camera_zoom
+    clamp_camera(view)
+
+def pan_camera(view, dx, dy):
+    """Сдвиг камеры на (dx, dy) пикселей экрана"""
+    global camera_x, camera_y
+    camera_x += dx / camera_zoom
+    camera_y += dy / camera_zoom
+    clamp_camera(view)
+
+def screen_to_world(view, pos):
+    x = camera_x + pos[0] / camera_zoom
+    y = camera_y + pos[1] / camera_zoom
+    if not view.boundaries:
+        x %= view.width
+        y %= view.height
+    return x, y
+
+def to_screen(view, x, y):
+    """Экранные координаты точек мира (массивы NumPy)"""
+    x = x - camera_x
+    y = y - camera_y
+    if not view.boundaries:
+        # На торе точка берется в копии мира от камеры; правее окна - в копии слева
+        x = _wrap_axis(x, view.width, width / camera_zoom)
+        y = _wrap_axis(y, view.height, (height - STATUS_HEIGHT) / camera_zoom)
+    return x * camera_zoom, y * camera_zoom
+
+def _wrap_axis(d, size, visible):
+    d = d % size
+    return np.where(d > visible + CULL_MARGIN, d - size, d)
+
+def visible_particles(view):
+    """Индексы частиц в окне с запасом CULL_MARGIN и их экранные координаты.
+
+    Кандидаты берутся из клеток сетки снимка, пересекающих окно; без сетки
+    (запись, список соседей) проверяются все частицы.
+    """
+    m = CULL_MARGIN
+    x1 = camera_x + width / camera_zoom + m
+    y1 = camera_y + (height - STATUS_HEIGHT) / camera_zoom + m
+    if view.cells is not None:
+        # По порядку индексов, чтобы частицы перекрывались так же, как без отсечения
+        index = np.sort(query_cells(view.cells, camera_x - m, camera_y - m, x1, y1))
     else:
-        if b not in a.bonds and a not in b.bonds:
-            dA = 1 / d2 if d2 != 0 else 0
-            dB = 1 / d2 if d2 != 0 else 0
-
-    angle = meth.atan2(dy, dx)
-    if d2 < 1:
-        d2 = 1
-    if d2 < NODE_RADIUS * NODE_RADIUS * 4:
-        dA = 1 / d2
-        dB = 1 / d2
-    a.sx += meth.cos(angle) * dA * SPEED
-    a.sy += meth.sin(angle) * dA * SPEED
-    b.sx -= meth.cos(angle) * dB * SPEED
-    b.sy -= meth.sin(angle) * dB * SPEED
-
-def logic():
-    if paused:
-        return
-        
-    # Движение и границы
-    for a in particles:
-        a.x += a.sx
-        a.y += a.sy
-        a.sx *= 0.98
-        a.sy *= 0.98
-        mag = meth.hypot(a.sx, a.sy)
-        if mag > 1:
-            a.sx /= mag
-            a.sy /= mag
-        
-        # Обработка границ
-        if boundaries_enabled:
-            # Обычные границы с отражением
-            if a.x < BORDER:
-                a.sx += SPEED * 0.05
-                if a.x < 0:
-                    a.x = -a.x
-                    a.sx *= -0.5
-            elif a.x > width - BORDER:
-                a.sx -= SPEED * 0.05
-                if a.x > width:
-                    a.x = width * 2 - a.x
-                    a.sx *= -0.5
-            if a.y < BORDER:
-                a.sy += SPEED * 0.05
-                if a.y < 0:
-                    a.y = -a.y
-                    a.sy *= -0.5
-            elif a.y > height - BORDER - 40:  # Поднимаем нижнюю границу на высоту строки состояния
-                a.sy -= SPEED * 0.05
-                if a.y > height - 40:
-                    a.y = (height - 40) * 2 - a.y
-                    a.sy *= -0.5
-        else:
-            # Торовые границы - переход через границы
-            if a.x < 0:
-                a.x = width + a.x
-            elif a.x > width:
-                a.x = a.x - width
-            if a.y < 0:
-                a.y = height - 40 + a.y  # Учитываем высоту строки состояния
-            elif a.y > height - 40:
-                a.y = a.y - (height - 40)
-
-    # Проверка разрывов связей
-    for bond in bonds[:]:
-        a, b = bond
-        
-        # Вычисляем расстояние с учетом границ
-        dx = a.x - b.x
-        dy = a.y - b.y
-        
-        if not boundaries_enabled:
-            # Для торовой топологии находим кратчайшее расстояние
-            if abs(dx) > width / 2:
-                dx = dx - width if dx > 0 else dx + width
-            if abs(dy) > (height - 40) / 2:  # Учитываем высоту строки состояния
-                dy = dy - (height - 40) if dy > 0 else dy + (height - 40)
-        
-        d2 = dx * dx + dy * dy
-        
-        if d2 > MAX_DIST ** 2 / 4:
-            a.links -= 1
-            b.links -= 1
-            remove_from_list(a.bonds, b)
-            remove_from_list(b.bonds, a)
-            remove_from_list(bonds, bond)
-        elif d2 > NODE_RADIUS ** 2 * 4:
-            angle = meth.atan2(dy, dx)
-            a.sx += meth.cos(angle) * LINK_FORCE * SPEED
-            a.sy += meth.sin(angle) * LINK_FORCE * SPEED
-            b.sx -= meth.cos(angle) * LINK_FORCE * SPEED
-            b.sy -= meth.sin(angle) * LINK_FORCE * SPEED
-
-    # Перемещение частиц между полями
-    for fx in range(fw):
-        for fy in range(fh):
-            field = fields[fx][fy]
-            for a in field.particles[:]:
-                if a.fx != fx or a.fy != fy:
-                    remove_from_list(field.particles, a)
-                    fields[a.fx][a.fy].particles.append(a)
-
-    # Силы между частицами (только в соседних клетках)
-    for fx in range(fw):
-        for fy in range(fh):
-            field = fields[fx][fy]
-            for i1, a in enumerate(field.particles):
-                for j1 in range(i1+1, len(field.particles)):
-                    b = field.particles[j1]
-                    apply_force(a, b)
-                if fx < fw-1:
-                    for b in fields[fx+1][fy].particles:
-                        apply_force(a, b)
-                if fy < fh-1:
-                    for b in fields[fx][fy+1].particles:
-                        apply_force(a, b)
-                if fx < fw-1 and fy < fh-1:
-                    for b in fields[fx+1][fy+1].particles:
-                        apply_force(a, b)
-                        
-                # Дополнительные проверки для торовой топологии
-                if not boundaries_enabled:
-                    # Взаимодействие с частицами на противоположных краях
-                    if fx == 0:  # Левый край
-                        for b in fields[fw-1][fy].particles:
-                            apply_force(a, b)
-                    if fy == 0:  # Верхний край
-                        for b in fields[fx][fh-1].particles:
-                            apply_force(a, b)
-                    if fx == 0 and fy == 0:  # Левый верхний угол
-                        for b in fields[fw-1][fh-1].particles:
-                            apply_force(a, b)
-
-def draw_ui():
-    """Отрисовка интерфейса"""
-    # Создаем строку состояния внизу экрана
-    status_y = height - 40
-    status_height = 40
-    
-    # Черный фон для строки состояния
-    status_bg = pygame.Surface((width, status_height))
-    status_bg.fill((0, 0, 0))
-    screen.blit(status_bg, (0, status_y))
-    
-    # Левая часть - управление и статус
-    current_x = 10
+        index = np.arange(len(view))
+    sx, sy = to_screen(view, view.x[index], view.y[index])
+    pad = m * camera_zoom
+    keep = (sx >= -pad) & (sx <= width + pad) & (sy >= -pad) & (sy <= height - STATUS_HEIGHT + pad)
+    return index[keep], sx[keep], sy[keep]
+
+def glyph(text, color):
+    """Отрисованный текст из кэша по (текст, цвет)"""
+    key = (text, color)
+    surface = glyph_cache.get(key)
+    if surface is None:
+        if len(glyph_cache) >= GLYPH_CACHE_SIZE:
+            glyph_cache.clear()
+        surface = glyph_cache[key] = font.render(text, True, color)
+    return surface
+
+def structure_count(view):
+    """Число обведенных структур; None - обводка выключена или снимок без структур"""
+    if not show_structures or view.structures is None:
+        return None
+    return int(np.sum(view.structures[0] >= STRUCTURE_MIN))
+
+def compose_status(view):
+    """Строка состояния без числа FPS; возвращает поверхность и позицию числа FPS"""
+    bar = pygame.Surface((width, STATUS_HEIGHT))
+    bar.fill((0, 0, 0))
+    x = 10
+
+    def put(text, color, gap=0):
+        nonlocal x
+        surface = glyph(text, color)
+        bar.blit(surface, (x, 0))
+        x += surface.get_width() + gap
 
-    # Количество частиц
-    count_surface = font.render(f"N:{len(particles)}", True, (200, 200, 200))
-    screen.blit(count_surface, (current_x, status_y))
-    current_x += count_surface.get_width()
-    
-    # Разделитель
-    sep_surface = font.render(" | ", True, (200, 200, 200))
-    screen.blit(sep_surface, (current_x, status_y))
-    current_x += sep_surface.get_width()
-
-    pause_surface = font.render("SPC:", True, (200, 200, 200))
-    screen.blit(pause_surface, (current_x, status_y))
-    current_x += pause_surface.get_width()
-    
-    # Показать статус паузы цветом
+    # Левая часть - управление и статус
+    put(f"N:{len(view)}", (200, 200, 200))
+    put(" | ", (200, 200, 200))
+    put("SPC:", (200, 200, 200))
+    # Статус паузы цветом
     if paused:
-        pause_color = (255, 0, 0)  # Красный
-        pause_text = "PAUSED  "
+        put("PAUSED  ", (255, 0, 0))  # Красный
     else:
-        pause_color = (0, 255, 0)  # Зеленый  
-        pause_text = "RUNNING"
-    
-    pause_surface = font.render(pause_text, True, pause_color)
-    screen.blit(pause_surface, (current_x, status_y))
-    current_x += pause_surface.get_width()
-    
-    # Разделитель
-    sep_surface = font.render(" | ", True, (200, 200, 200))
-    screen.blit(sep_surface, (current_x, status_y))
-    current_x += sep_surface.get_width()
-    
-    # Показать статус границ цветом
-    if boundaries_enabled:
-        bounds_color = (255, 0, 0)  # Красный для включенных границ
-    else:
-        bounds_color = (0, 255, 0)  # Зеленый для выключенных границ
+        put("RUNNING", (0, 255, 0))  # Зеленый
+    put(" | ", (200, 200, 200))
+
+    # Статус границ цветом: красный - включены, зеленый - выключены
+    put("B:", (200, 200, 200))
+    put("BORDERS", (255, 0, 0) if view.boundaries else (0, 255, 0))
+    if camera_zoom != 1:
+        put(f" | ZOOM:{camera_zoom:.2f}", (200, 200, 200))
+    if lod_active:
+        put(" | LOD", (255, 255, 0))
+    if structure_count(view) is not None:
+        put(f" | S:{structure_count(view)}", STRUCTURE_COLOR)
 
-    bounds_surface = font.render("B:", True, (200, 200, 200))
-    screen.blit(bounds_surface, (current_x, status_y))
-    current_x += bounds_surface.get_width()
-
-    bounds_surface = font.render("BORDERS", True, bounds_color)
-    screen.blit(bounds_surface, (current_x, status_y))
-    current_x += bounds_surface.get_width()
-    
     # Команды
-    commands_surface = font.render(" | MOUSE:draw R:reset C:clear M:matrix ESC:exit", True, (200, 200, 200))
-    screen.blit(commands_surface, (current_x, status_y))
-    current_x += commands_surface.get_width()
+    put(" | MOUSE:draw R:reset C:clear M:matrix P:profile ESC:exit", (200, 200, 200))
 
     # Выбор типа частицы цветными цифрами
-    type_text = " | T:"
-    type_surface = font.render(type_text, True, (200, 200, 200))
-    screen.blit(type_surface, (current_x, status_y))
-    current_x += type_surface.get_width()
-    
-    for i in range(3):
-        color = COLORS[i] if i == selected_particle_type else (100, 100, 100)
-        number_surface = font.render(str(i+1), True, color)
-        screen.blit(number_surface, (current_x, status_y))
-        current_x += number_surface.get_width() + 5
-
-    table_text = "| Matrix: "
-    table_surface = font.render(table_text, True, (200, 200, 200))
-    screen.blit(table_surface, (current_x, status_y))
-    current_x += table_surface.get_width()
-    
+    k = len(COUPLING)
+    put(" | T:", (200, 200, 200))
+    for i in range(k):
+        put(str(i+1), COLORS[i] if i == selected_particle_type else (100, 100, 100), 5)
+
+    if k > INLINE_MATRIX_TYPES:
+        # Большая матрица редактируется на панели (draw_matrix)
+        put(f"| Matrix: {k}x{k}", (255, 255, 0) if editing_matrix else (200, 200, 200))
+        put(" | FPS:", (200, 200, 200))
+        return bar, x
+
+    put("| Matrix: ", (200, 200, 200))
     # Матрица с цветовой схемой: скобки строки - цвет частицы строки, значения - цвет частицы столбца
-    for i in range(3):
+    for i in range(k):
         if i > 0:
-            comma_surface = font.render(", ", True, COLORS[i-1])
-            screen.blit(comma_surface, (current_x, status_y))
-            current_x += comma_surface.get_width()
-        
-        # Скобка строки в цвете частицы строки
-        bracket_surface = font.render("[", True, COLORS[i])
-        screen.blit(bracket_surface, (current_x, status_y))
-        current_x += bracket_surface.get_width()
-        
-        for j in range(3):
+            put(", ", COLORS[i-1])
+        put("[", COLORS[i])
+        for j in range(k):
             if j > 0:
-                comma_surface = font.render(", ", True, COLORS[j-1])
-                screen.blit(comma_surface, (current_x, status_y))
-                current_x += comma_surface.get_width()
-            
-            # Выбираем цвет для текущего значения
+                put(", ", COLORS[j-1])
             if editing_matrix and selected_matrix_i == i and selected_matrix_j == j:
                 color = (255, 255, 0)  # Желтый для редактируемого значения
             else:
                 color = COLORS[j]  # Цвет частицы столбца
-            
-            value_surface = font.render(f"{COUPLING[i][j]:.1f}", True, color)
-            screen.blit(value_surface, (current_x, status_y))
-            current_x += value_surface.get_width()
-        
-        # Закрывающая скобка строки в цвете частицы строки
-        bracket_surface = font.render("]", True, COLORS[i])
-        screen.blit(bracket_surface, (current_x, status_y))
-        current_x += bracket_surface.get_width()
-    
-    count_surface = font.render(f" | FPS:", True, (200, 200, 200))
-    screen.blit(count_surface, (current_x, status_y))
-    current_x += count_surface.get_width()
-    count_surface = font.render(f" {fps:.2f}", True, (150, 150, 150))
-    screen.blit(count_surface, (current_x, status_y))
-
-def draw_scene():
-    screen.fill(BG)
-    
-    # Отрисовка света от каждой частицы с аддитивным смешиванием
-    for p in particles:
-        p.light.main(screen, int(p.x), int(p.y))
-    
-    # Отрисовка связей между частицами
-    for bond in bonds:
-        a, b = bond
-        
-        # Вычисляем позиции для отрисовки с учетом границ
-        ax, ay = a.x, a.y
-        bx, by = b.x, b.y
-        
-        # Для торовой топологии находим кратчайший путь для отрисовки
-        if not boundaries_enabled:
-            dx = bx - ax
-            dy = by - ay
-            
-            # Проверяем, нужно ли рисовать через границы
-            if abs(dx) > width / 2:
-                if dx > 0:
-                    bx -= width
-                else:
-                    bx += width
-            
-            if abs(dy) > (height - 40) / 2:  # Учитываем высоту строки состояния
-                if dy > 0:
-                    by -= (height - 40)
-                else:
-                    by += (height - 40)
-        
-        # Цвет линии - смешанный цвет двух частиц
-        color_a = COLORS[a.type]
-        color_b = COLORS[b.type]
-        line_color = (
-            (color_a[0] + color_b[0]) // 2,
-            (color_a[1] + color_b[1]) // 2,
-            (color_a[2] + color_b[2]) // 2
-        )
-        
-        # Рисуем линию между частицами
-        pygame.draw.line(screen, line_color, (int(ax), int(ay)), (int(bx), int(by)), 2)
+            put(f"{COUPLING[i][j]:.1f}", color)
+        put("]", COLORS[i])
+
+    put(" | FPS:", (200, 200, 200))
+    return bar, x
+
+def draw_ui(view):
+    """Отрисовка интерфейса: готовая строка состояния и свежее число FPS"""
+    global status_bar, status_key, fps_x
+    key = (len(view), paused, view.boundaries, selected_particle_type, camera_zoom, lod_active,
+           structure_count(view),
+           editing_matrix, selected_matrix_i, selected_matrix_j,
+           tuple(map(tuple, COUPLING)), tuple(COLORS))
+    if key != status_key:
+        status_bar, fps_x = compose_status(view)
+        status_key = key
+    status_y = height - STATUS_HEIGHT
+    screen.blit(status_bar, (0, status_y))
+    screen.blit(font.render(f" {fps:.2f}", True, (150, 150, 150)), (fps_x, status_y))
+
+def draw_matrix():
+    """Панель матрицы взаимодействий для большого числа типов.
+
+    Клетка (i, j) - действие типа j на тип i: зеленая - притяжение,
+    красная - отталкивание; заголовки строк и столбцов - цвета типов.
+    Панель собирается заново только при изменении матрицы или курсора.
+    """
+    global matrix_panel, matrix_key
+    key = (tuple(map(tuple, COUPLING)), selected_matrix_i, selected_matrix_j, tuple(COLORS))
+    if key != matrix_key:
+        k = len(COUPLING)
+        side = (k + 1) * MATRIX_CELL + 10
+        matrix_panel = pygame.Surface((side, side), SRCALPHA)
+        matrix_panel.fill((0, 0, 0, 200))
+        c = MATRIX_CELL
+        for t in range(k):
+            matrix_panel.fill(COLORS[t], (5, 5 + (t + 1) * c + c // 4, c // 2, c // 2))
+            matrix_panel.fill(COLORS[t], (5 + (t + 1) * c + c // 4, 5, c // 2, c // 2))
+        for i in range(k):
+            for j in range(k):
+                value = COUPLING[i][j]
+                level = int(min(abs(value), 1) * 160)
+                rect = pygame.Rect(5 + (j + 1) * c, 5 + (i + 1) * c, c - 2, c - 2)
+                matrix_panel.fill((level, 0, 0) if value < 0 else (0, level, 0), rect)
+                if (i, j) == (selected_matrix_i, selected_matrix_j):
+                    pygame.draw.rect(matrix_panel, (255, 255, 0), rect, 2)
+                text = profile_font.render(f"{value:.1f}", True, (230, 230, 230))
+                matrix_panel.blit(text, text.get_rect(center=rect.center))
+        matrix_key = key
+    screen.blit(matrix_panel, (width - matrix_panel.get_width() - 10, 10))
+
+def draw_profiler():
+    """Оверлей профиля: среднее время фаз, гистограммы последних кадров и счетчики"""
+    names = profiler.timings
+    graph_x = 200
+    panel = pygame.Surface((graph_x + profiler.history.maxlen * 2 + 10,
+                            (len(names) + len(profiler.counters)) * PROFILE_ROW + 10), SRCALPHA)
+    panel.fill((0, 0, 0, 180))
+    y = 5
+    for name in names:
+        values = profiler.series(name)
+        top = max(values, default=0) or 1
+        panel.blit(profile_font.render(name, True, (200, 200, 200)), (5, y))
+        value = profile_font.render(f"{profiler.mean(name):.2f} ms", True, (200, 200, 200))
+        panel.blit(value, (graph_x - 10 - value.get_width(), y))
+        # Столбик на кадр, высота относительно худшего кадра в истории
+        for k, v in enumerate(values):
+            h = int(v / top * (PROFILE_ROW - 4))
+            if h:
+                panel.fill((0, 200, 255), (graph_x + 2 * k, y + PROFILE_ROW - 2 - h, 2, h))
+        y += PROFILE_ROW
+    for name in profiler.counters:
+        panel.blit(profile_font.render(name, True, (200, 200, 200)), (5, y))
+        value = profile_font.render(f"{profiler.mean(name):.0f}", True, (200, 200, 200))
+        panel.blit(value, (graph_x - 10 - value.get_width(), y))
+        y += PROFILE_ROW
+    screen.blit(panel, (10, 10))
+
+def draw_particles(view, index, sx, sy):
+    """Свечение, связи и частицы по отдельности; index, sx, sy - из visible_particles()"""
+    xs, ys, types = sx.tolist(), sy.tolist(), view.type[index].tolist()
+    
+    # Отрисовка света от всех частиц одним вызовом с аддитивным смешиванием
+    size = max(1, round(LIGHT_SIZE * camera_zoom))
+    glow = lights_for(size)
+    offset = size // 2
+    gx = sx.astype(np.int64) - offset
+    gy = sy.astype(np.int64) - offset
+    screen.blits([(glow[t], (x, y), None, BLEND_ADD)
+                  for t, x, y in zip(types, gx.tolist(), gy.tolist())], doreturn=False)
+    profiler.lap("glow")
+    
+    # Отрисовка связей, у которых видна хотя бы одна частица
+    visible = np.zeros(len(view), dtype=bool)
+    visible[index] = True
+    shown = visible[view.bond_a] | visible[view.bond_b]
+    bond_a = view.bond_a[shown]
+    bond_b = view.bond_b[shown]
+    ax, ay = to_screen(view, view.x[bond_a], view.y[bond_a])
+    dx = view.x[bond_b] - view.x[bond_a]
+    dy = view.y[bond_b] - view.y[bond_a]
+    if not view.boundaries:
+        # Для торовой топологии рисуем по кратчайшему пути через край
+        dx = min_image(dx, view.width)
+        dy = min_image(dy, view.height)
+    bx = ax + dx * camera_zoom
+    by = ay + dy * camera_zoom
+    line_width = max(1, round(2 * camera_zoom))
+    # Цвет связи - из таблицы по паре типов, концы - целые координаты
+    pair = view.type[bond_a].astype(np.int64) * len(COLORS) + view.type[bond_b]
+    colors = [BOND_COLORS[p] for p in pair.tolist()]
+    starts = np.stack((ax, ay), axis=1).astype(np.int64).tolist()
+    ends = np.stack((bx, by), axis=1).astype(np.int64).tolist()
+    line = pygame.draw.line
+    for line_color, start, end in zip(colors, starts, ends):
+        line(screen, line_color, start, end, line_width)
+    profiler.lap("lines")
     
     # Отрисовка самих частиц поверх света и связей
-    for p in particles:
-        pygame.draw.circle(screen, COLORS[p.type], (int(p.x), int(p.y)), NODE_RADIUS)
+    radius = max(1, round(NODE_RADIUS * camera_zoom))
+    for t, x, y in zip(types, xs, ys):
+        pygame.draw.circle(screen, COLORS[t], (int(x), int(y)), radius)
+    profiler.lap("circles")
+
+
+def draw_structures(view):
+    """Круг вокруг центра каждой структуры; площадь круга растет с числом частиц"""
+    sizes, cx, cy = view.structures
+    big = sizes >= STRUCTURE_MIN
+    x, y = to_screen(view, cx[big], cy[big])
+    radius = np.sqrt(sizes[big]) * NODE_RADIUS * 2 * camera_zoom
+    for px, py, r in zip(x.astype(np.int64).tolist(), y.astype(np.int64).tolist(),
+                         radius.astype(np.int64).tolist()):
+        pygame.draw.circle(screen, STRUCTURE_COLOR, (px, py), r, 1)
+
+def draw_brush():
+    """Контур кисти от точки начала до курсора"""
+    mode, start = brush
+    end = pygame.mouse.get_pos()
+    color = COLORS[selected_particle_type] if mode == "spawn" else ERASE_COLOR
+    if brush_shape == "circle":
+        radius = round(meth.dist(start, end))
+        pygame.draw.circle(screen, color, start, max(radius, 1), 1)
+    else:
+        rect = pygame.Rect(start, (end[0] - start[0], end[1] - start[1]))
+        rect.normalize()
+        pygame.draw.rect(screen, color, rect, 1)
+
+def draw_heatmap(view, index, sx, sy):
+    """Плотность частиц по типам одной картинкой.
+
+    Частицы раскладываются по клеткам LOD_CELL x LOD_CELL пикселей экрана,
+    число частиц каждого типа в клетке переводится в яркость
+    1 - exp(-LOD_GAIN * n), а цвета типов складываются.
+    """
+    bw = width // LOD_CELL
+    bh = (height - STATUS_HEIGHT) // LOD_CELL
+    k = len(COLORS)
+    bx = (sx // LOD_CELL).astype(np.int64)
+    by = (sy // LOD_CELL).astype(np.int64)
+    inside = (bx >= 0) & (bx < bw) & (by >= 0) & (by < bh)
+    cell = (view.type[index][inside].astype(np.int64) * bw + bx[inside]) * bh + by[inside]
+    counts = np.bincount(cell, minlength=k * bw * bh).reshape(k, bw, bh)
+    level = 1 - np.exp(-LOD_GAIN * counts)
+    rgb = np.einsum('tij,tc->ijc', level, np.asarray(COLORS, dtype=np.float64))
+    heat = pygame.surfarray.make_surface(np.minimum(rgb, 255).astype(np.uint8))
+    screen.blit(pygame.transform.smoothscale(heat, (bw * LOD_CELL, bh * LOD_CELL)), (0, 0))
+
+def draw_scene(view=None):
+    """Кадр по снимку состояния (по умолчанию - снимок текущего состояния)"""
+    if view is None:
+        view = Snapshot.capture()
+    profiler.lap()
+    screen.fill(BG)
+    profiler.lap("clear")
+    
+    # Только частицы в окне камеры (с запасом на свечение и связи)
+    global lod_active
+    index, sx, sy = visible_particles(view)
+    # Больше LOD_DENSITY частиц на пиксель - тепловая карта плотности вместо частиц
+    lod_active = lod_enabled and len(index) > LOD_DENSITY * width * (height - STATUS_HEIGHT)
+    if lod_active:
+        draw_heatmap(view, index, sx, sy)
+        profiler.lap("heatmap")
+    else:
+        draw_particles(view, index, sx, sy)
+    if show_structures and view.structures is not None:
+        draw_structures(view)
+    if brush is not None:
+        draw_brush()
+    profiler.lap("structures")
     
     # Отрисовка интерфейса
-    draw_ui()
-    
-    pygame.display.flip()
+    draw_ui(view)
+    if editing_matrix and len(COUPLING) > INLINE_MATRIX_TYPES:
+        draw_matrix()
+    profiler.lap("ui")
+    if show_profiler:
+        draw_profiler()
+    profiler.lap("overlay")
+    
+    if screen is pygame.display.get_surface():
+        pygame.display.flip()
+    profiler.lap("flip")
 
 def handle_mouse_click(pos):
-    """Обработка клика мыши"""
-    x, y = pos
-    
-    # Проверяем, есть ли частица в этой позиции
-    particle = find_particle_at_position(x, y)
-    
-    if particle:
-        # Удаляем частицу
-        remove_particle(particle)
+    """Обработка клика мыши: удалить частицу под курсором или создать новую"""
+    x, y = screen_to_world(runner.latest(), pos)
+    runner.call("toggle_particle", x, y, selected_particle_type)
+
+def brush_region(view, start, end):
+    """Область мира для physics.particles_in() по перетаскиванию от start до end"""
+    if brush_shape == "circle":
+        x, y = screen_to_world(view, start)
+        return ("circle", x, y, meth.dist(start, end) / camera_zoom)
+    # Прямоугольник задается центром, чтобы на торе он мог переходить через край
+    x, y = screen_to_world(view, ((start[0] + end[0]) / 2, (start[1] + end[1]) / 2))
+    w = abs(end[0] - start[0]) / camera_zoom / 2
+    h = abs(end[1] - start[1]) / camera_zoom / 2
+    return ("rect", x - w, y - h, x + w, y + h)
+
+def apply_brush(end):
+    """Создать или стереть частицы в области кисти одной командой"""
+    mode, start = brush
+    region = brush_region(runner.latest(), start, end)
+    if mode == "erase":
+        runner.call("erase_particles", region)
+        return
+    if region[0] == "circle":
+        area = meth.pi * region[3] ** 2
     else:
-        # Создаем новую частицу
-        create_particle(x, y, selected_particle_type)
-
-# Инициализация симуляции
-init_simulation()
-
-# Основной цикл
-last_time = time.time()
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
+        area = (region[3] - region[1]) * (region[4] - region[2])
+    count = min(max(round(area * BRUSH_DENSITY), 1), BRUSH_MAX)
+    runner.call("spawn_particles", region, count, selected_particle_type)
+
+def shutdown(status=None):
+    """Закрыть все и выйти; status - как у sys.exit (текст ошибки - в stderr и код 1)"""
+    runner.close()
+    if recorder is not None:
+        recorder.close()
+    profiler.close()
+    pygame.quit()
+    sys.exit(status)
+
+def main():
+    global paused, selected_particle_type, editing_matrix
+    global selected_matrix_i, selected_matrix_j, fps, show_profiler, runner, recorder
+    global dragging, lod_enabled, show_structures, brush_shape, brush
+
+    # Движок расчета сил: "python" - поштучно, "numpy" - пакетно (--numpy),
+    # "parallel" - пакетно в нескольких процессах (--parallel)
+    if "--numpy" in sys.argv:
+        physics.ENGINE = "numpy"
+    elif "--parallel" in sys.argv:
+        physics.ENGINE = "parallel"
+    # Список соседей с запасом: --skin PX (0 - пары по сетке каждый шаг)
+    if "--skin" in sys.argv:
+        physics.SKIN = float(sys.argv[sys.argv.index("--skin") + 1])
+    # Точность позиций и скоростей: --precision f4 (по умолчанию f8)
+    if "--precision" in sys.argv:
+        physics.PRECISION = sys.argv[sys.argv.index("--precision") + 1]
+    # Повторяемый запуск: --seed N
+    if "--seed" in sys.argv:
+        physics.seed(int(sys.argv[sys.argv.index("--seed") + 1]))
+    # Число типов частиц со случайными таблицами: --types K
+    if "--types" in sys.argv:
+        physics.set_types(*physics.random_types(int(sys.argv[sys.argv.index("--types") + 1])))
+    # Время фаз и счетчики каждого кадра в файл: --metrics PATH (.csv или JSONL)
+    if "--metrics" in sys.argv:
+        profiler.open_log(sys.argv[sys.argv.index("--metrics") + 1])
+
+    # Мир больше окна (смотреть через камеру): --world WxH, число частиц: --count N
+    world = None
+    if "--world" in sys.argv:
+        world = tuple(float(v) for v in sys.argv[sys.argv.index("--world") + 1].lower().split("x"))
+    if "--count" in sys.argv:
+        physics.NODE_COUNT = int(sys.argv[sys.argv.index("--count") + 1])
+
+    # Инициализация симуляции
+    open_window(world=world)
+    init_simulation()
+    # Физика: в потоке отрисовки (по умолчанию), в фоновом потоке (--thread),
+    # в отдельном процессе (--process), запись вместо расчета (--replay PATH)
+    # или кадры с сервера stream.py (--connect HOST:PORT)
+    if "--replay" in sys.argv:
+        path = sys.argv[sys.argv.index("--replay") + 1]
+        trajectory = statefile.Trajectory(path)
+        show_world(trajectory.header)
+        try:
+            runner = ReplayRunner(trajectory, STEP_RATE)
+        except ValueError as error:
             pygame.quit()
-            sys.exit()
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                pygame.quit()
-                sys.exit()
-            elif event.key == pygame.K_SPACE:
-                paused = not paused
-            elif event.key == pygame.K_r:
-                get_random_profile()
-                init_simulation()
-            elif event.key == pygame.K_c:
-                clear_screen()
-            elif event.key == pygame.K_1:
-                selected_particle_type = 0
-            elif event.key == pygame.K_2:
-                selected_particle_type = 1
-            elif event.key == pygame.K_3:
-                selected_particle_type = 2
-            elif event.key == pygame.K_b:
-                boundaries_enabled = not boundaries_enabled
-            elif event.key == pygame.K_m:
-                editing_matrix = not editing_matrix
-            elif editing_matrix:
-                if event.key == pygame.K_UP:
-                    selected_matrix_i = (selected_matrix_i - 1) % 3
-                elif event.key == pygame.K_DOWN:
-                    selected_matrix_i = (selected_matrix_i + 1) % 3
-                elif event.key == pygame.K_LEFT:
-                    selected_matrix_j = (selected_matrix_j - 1) % 3
-                elif event.key == pygame.K_RIGHT:
-                    selected_matrix_j = (selected_matrix_j + 1) % 3
-                elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
-                    COUPLING[selected_matrix_i][selected_matrix_j] += 0.1
-                elif event.key == pygame.K_MINUS:
-                    COUPLING[selected_matrix_i][selected_matrix_j] -= 0.1
-                elif event.key == pygame.K_RETURN:
-                    editing_matrix = False
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == 1:  # Левая кнопка мыши
-                handle_mouse_click(event.pos)
-
-    for _ in range(PLAYBACK_SPEED):
-        logic()
-    draw_scene()
-    clock.tick(60)
-    
-    current_time = time.time()
-    delta = current_time - last_time
-    last_time = current_time
-
-    if delta > 0:
-        fps = 0.9 * fps + 0.1 / delta 
\ No newline at end of file
+            sys.exit(f"{path}: {error}")
+    elif "--connect" in sys.argv:
+        host, port = sys.argv[sys.argv.index("--connect") + 1].rsplit(":", 1)
+        runner = StreamRunner(host, int(port))
+        show_world(runner.header)
+    elif "--thread" in sys.argv:
+        runner = ThreadRunner(STEP_RATE)
+    elif "--process" in sys.argv:
+        runner = ProcessRunner(STEP_RATE)
+    else:
+        physics.profiler = profiler  # Фазы шага замеряются только в потоке отрисовки
+        runner = InlineRunner(STEP_RATE, PHYSICS_BUDGET)
+    view = runner.frame(0)
+    # Запись траектории: кадр на каждый новый снимок физики с номером его шага
+    if "--record" in sys.argv:
+        recorder = statefile.TrajectoryWriter(sys.argv[sys.argv.index("--record") + 1], COLORS)
+    recorded = None
+    shown_header = getattr(runner, "header", None)
+
+    # Основной цикл
+    last_time = time.time()
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                shutdown()
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    shutdown()
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                    runner.set_paused(paused)
+                elif event.key == pygame.K_r:
+                    get_random_profile()
+                    runner.call("init_simulation")
+                elif event.key == pygame.K_c:
+                    runner.call("clear_screen")
+                elif event.key in TYPE_KEYS and TYPE_KEYS[event.key] < len(COUPLING):
+                    selected_particle_type = TYPE_KEYS[event.key]
+                elif event.key == pygame.K_TAB:
+                    step = -1 if event.mod & KMOD_SHIFT else 1
+                    selected_particle_type = (selected_particle_type + step) % len(COUPLING)
+                elif event.key == pygame.K_b:
+                    runner.call("set_boundaries", not view.boundaries)
+                elif event.key == pygame.K_m:
+                    editing_matrix = not editing_matrix
+                elif event.key == pygame.K_p:
+                    show_profiler = not show_profiler
+                elif event.key == pygame.K_l:
+                    lod_enabled = not lod_enabled
+                elif event.key == pygame.K_o:
+                    show_structures = not show_structures
+                elif event.key == pygame.K_g:
+                    brush_shape = "rect" if brush_shape == "circle" else "circle"
+                elif event.key == pygame.K_F5:
+                    runner.call(statefile.save, SNAPSHOT_PATH, COLORS)
+                elif event.key == pygame.K_F9 and os.path.exists(SNAPSHOT_PATH):
+                    runner.call(statefile.load, SNAPSHOT_PATH)
+                    show_world(statefile.read_header(SNAPSHOT_PATH))
+                elif isinstance(runner, ReplayRunner) and event.key in REPLAY_SEEK:
+                    runner.seek(REPLAY_SEEK[event.key])
+                elif editing_matrix:
+                    if event.key == pygame.K_UP:
+                        selected_matrix_i = (selected_matrix_i - 1) % len(COUPLING)
+                    elif event.key == pygame.K_DOWN:
+                        selected_matrix_i = (selected_matrix_i + 1) % len(COUPLING)
+                    elif event.key == pygame.K_LEFT:
+                        selected_matrix_j = (selected_matrix_j - 1) % len(COUPLING)
+                    elif event.key == pygame.K_RIGHT:
+                        selected_matrix_j = (selected_matrix_j + 1) % len(COUPLING)
+                    elif event.key == pygame.K_PLUS or event.key == pygame.K_EQUALS:
+                        COUPLING[selected_matrix_i][selected_matrix_j] += 0.1
+                        runner.call("set_coupling", [row[:] for row in COUPLING])
+                    elif event.key == pygame.K_MINUS:
+                        COUPLING[selected_matrix_i][selected_matrix_j] -= 0.1
+                        runner.call("set_coupling", [row[:] for row in COUPLING])
+                    elif event.key == pygame.K_RETURN:
+                        editing_matrix = False
+                elif event.key in PAN_KEYS:
+                    dx, dy = PAN_KEYS[event.key]
+                    pan_camera(view, dx * PAN_STEP * width, dy * PAN_STEP * (height - STATUS_HEIGHT))
+                elif event.key == pygame.K_HOME:
+                    fit_camera(view)
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1 and pygame.key.get_mods() & KMOD_SHIFT:
+                    brush = ("spawn", event.pos)
+                elif event.button == 1 and pygame.key.get_mods() & KMOD_CTRL:
+                    brush = ("erase", event.pos)
+                elif event.button == 1:  # Левая кнопка мыши
+                    handle_mouse_click(event.pos)
+                elif event.button == 3:  # Правая кнопка - перетаскивание камеры
+                    dragging = True
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                dragging = False
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and brush is not None:
+                apply_brush(event.pos)
+                brush = None
+            elif event.type == pygame.MOUSEMOTION and dragging:
+                pan_camera(view, -event.rel[0], -event.rel[1])
+            elif event.type == pygame.MOUSEWHEEL:
+                zoom_camera(view, ZOOM_STEP ** event.y, pygame.mouse.get_pos())
+        profiler.lap("events")
+
+        current_time = time.time()
+        delta = current_time - last_time
+        last_time = current_time
+
+        # Шаги физики по прошедшему времени и кадр по последним снимкам
+        try:
+            view = runner.frame(delta)
+        except ConnectionError as error:
+            shutdown(str(error))    # Сервер stream.py закрылся или связь оборвалась
+        if isinstance(runner, StreamRunner) and runner.header is not shown_header:
+            shown_header = runner.header   # Сервер сменил мир: типы и палитра
+            show_world(shown_header)
+        clamp_camera(view)  # Мир мог смениться: топология, загрузка, запись
+        if recorder is not None and runner.latest() is not recorded:
+            recorded = runner.latest()
+            recorder.append(recorded)
+        draw_scene(view)
+        clock.tick(FPS_LIMIT)
+        profiler.lap("tick")
+
+        if delta > 0:
+            fps = 0.9 * fps + 0.1 / delta 
+        profiler.end_frame()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Файлы состояния и записи траекторий.
+
+Оба формата: 8 байт сигнатуры, длина и JSON-заголовок (размер мира,
+топология, COUPLING, LINKS, LINKS_POSSIBLE, палитра), затем сырые
+массивы little-endian с выравниванием на 8 байт.
+
+Файл состояния (.pstate) хранит один полный снимок: x, y, sx, sy, type
+и список связей в порядке графа, а также точность столбцов частиц и
+состояние генератора, так что загруженный мир продолжается ровно так же,
+как продолжился бы исходный.
+
+Траектория (.ptraj) - последовательность кадров (позиции, типы, связи),
+дописываемых по одному; при закрытии в конец пишется оглавление со
+смещениями кадров. Trajectory открывает файл через mmap и читает только
+нужный кадр; если оглавления нет (запись оборвалась), кадры находятся
+по их заголовкам без чтения данных.
+"""
+import json
+import mmap
+import struct
+import numpy as np
+import physics
+from scheduler import Snapshot
+from store import ParticleStore
+
+STATE_MAGIC = b"PSTATE01"
+TRAJ_MAGIC = b"PTRAJ001"
+FRAME = struct.Struct("<4sIqqQQ")     # сигнатура, флаги, шаг, version, частиц, связей
+FRAME_MAGIC = b"FRM0"
+INDEX = struct.Struct("<4s4xQQ")      # сигнатура, кадров, смещение оглавления
+INDEX_MAGIC = b"PIDX"
+FLAG_BOUNDARIES = 1
+
+
+def _pad(size):
+    return -size % 8
+
+
+def _write_header(f, magic, header):
+    data = json.dumps(header).encode()
+    f.write(magic + struct.pack("<I", len(data)) + data + bytes(_pad(12 + len(data))))
+
+
+def _read_header(buf, magic):
+    """Заголовок и смещение данных за ним"""
+    if bytes(buf[:8]) != magic:
+        raise ValueError("неизвестный формат файла")
+    (size,) = struct.unpack_from("<I", buf, 8)
+    header = json.loads(bytes(buf[12:12 + size]))
+    return header, 12 + size + _pad(12 + size)
+
+
+def world_header(palette=None):
+    """Параметры мира из physics для заголовка файла"""
+    return {
+        "width": physics.width,
+        "height": physics.height,
+        "boundaries": physics.boundaries_enabled,
+        "coupling": [list(row) for row in physics.COUPLING],
+        "links": list(physics.LINKS),
+        "links_possible": [list(row) for row in physics.LINKS_POSSIBLE],
+        "palette": [list(color) for color in palette] if palette else None,
+    }
+
+
+def apply_world(header):
+    """Установить параметры мира из заголовка (вместе с числом типов)"""
+    physics.setup(header["width"], header["height"])
+    physics.set_boundaries(header["boundaries"])
+    physics.set_types(header["coupling"], header["links"], header["links_possible"])
+
+
+def save(path, palette=None):
+    """Записать текущее состояние physics в файл"""
+    particles = physics.particles
+    ea, eb = physics.bonds.views()
+    header = world_header(palette)
+    header["count"] = len(particles)
+    header["bonds"] = len(ea)
+    header["precision"] = particles.dtype
+    version, state, gauss = physics.rng.getstate()
+    header["rng"] = [version, list(state), gauss]
+    with open(path, "wb") as f:
+        _write_header(f, STATE_MAGIC, header)
+        for name in ("x", "y", "sx", "sy"):
+            f.write(particles.view(name).astype("<f8").tobytes())
+        f.write(particles.view("type").tobytes() + bytes(_pad(len(particles))))
+        f.write(ea.astype("<i4").tobytes())
+        f.write(eb.astype("<i4").tobytes())
+
+
+def read_header(path):
+    """Только заголовок файла состояния или траектории"""
+    with open(path, "rb") as f:
+        start = f.read(12)
+        (size,) = struct.unpack_from("<I", start, 8)
+        return _read_header(start + f.read(size), start[:8])[0]
+
+
+def load(path):
+    """Загрузить состояние из файла в physics; возвращает заголовок"""
+    with open(path, "rb") as f:
+        buf = f.read()
+    header, offset = _read_header(buf, STATE_MAGIC)
+    apply_world(header)
+    n = header["count"]
+    m = header["bonds"]
+    columns = {}
+    for name in ("x", "y", "sx", "sy"):
+        columns[name] = np.frombuffer(buf, "<f8", n, offset)
+        offset += 8 * n
+    ptype = np.frombuffer(buf, "i1", n, offset)
+    offset += n + _pad(n)
+    bond_a = np.frombuffer(buf, "<i4", m, offset).tolist()
+    bond_b = np.frombuffer(buf, "<i4", m, offset + 4 * m).tolist()
+
+    # Точность позиций и скоростей - как у сохраненного мира (старые файлы - f8)
+    physics.PRECISION = header.get("precision", "f8")
+    store = ParticleStore(len(physics.LINKS), physics.PRECISION)
+    store.add_many(ptype, columns["x"], columns["y"])
+    store.view("sx")[:] = columns["sx"]
+    store.view("sy")[:] = columns["sy"]
+    for i, j in zip(bond_a, bond_b):
+        store.bonds.add(i, j)   # Счетчики связей восстанавливаются по графу
+    physics.set_particles(store)
+    version, state, gauss = header["rng"]
+    physics.rng.setstate((version, tuple(state), gauss))
+    return header
+
+
+class TrajectoryWriter:
+    """Запись кадров траектории; dtype - точность позиций ('f4' или 'f8').
+
+    every - шагов физики между кадрами, если кадры пишутся через равное
+    число шагов (None - как придется, например по кадрам окна). Проигрывание
+    идет по номерам шагов кадров, а не по every.
+    """
+
+    def __init__(self, path, palette=None, dtype="f4", every=None):
+        self.f = open(path, "wb")
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.offsets = []
+        header = world_header(palette)
+        header["dtype"] = self.dtype.str
+        header["every"] = every     # Шагов физики между кадрами
+        _write_header(self.f, TRAJ_MAGIC, header)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, snap, step=None):
+        """Дописать кадр из Snapshot; step по умолчанию - шаг физики снимка"""
+        n = len(snap)
+        m = len(snap.bond_a)
+        flags = FLAG_BOUNDARIES if snap.boundaries else 0
+        step = snap.step if step is None else step
+        self.offsets.append(self.f.tell())
+        self.f.write(FRAME.pack(FRAME_MAGIC, flags, step, snap.version, n, m))
+        self.f.write(snap.x.astype(self.dtype).tobytes())
+        self.f.write(snap.y.astype(self.dtype).tobytes())
+        size = 2 * n * self.dtype.itemsize
+        self.f.write(snap.type.astype("i1").tobytes() + bytes(_pad(size + n)))
+        self.f.write(snap.bond_a.astype("<i4").tobytes())
+        self.f.write(snap.bond_b.astype("<i4").tobytes())
+
+    def close(self):
+        """Дописать оглавление и закрыть файл"""
+        if self.f.closed:
+            return
+        offset = self.f.tell()
+        self.f.write(np.asarray(self.offsets, dtype="<i8").tobytes())
+        self.f.write(INDEX.pack(INDEX_MAGIC, len(self.offsets), offset))
+        self.f.close()
+
+
+class Trajectory:
+    """Траектория из файла через mmap: trajectory[k] - Snapshot кадра k без копирования"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header, self.data = _read_header(self.map, TRAJ_MAGIC)
+        self.dtype = np.dtype(self.header["dtype"])
+        self.offsets = self._index()
+
+    def _index(self):
+        """Смещения кадров: из оглавления или по заголовкам кадров"""
+        size = len(self.map)
+        if size >= self.data + INDEX.size:
+            magic, count, offset = INDEX.unpack_from(self.map, size - INDEX.size)
+            if magic == INDEX_MAGIC and offset + 8 * count == size - INDEX.size:
+                return np.frombuffer(self.map, "<i8", count, offset).copy()
+        offsets = []
+        offset = self.data
+        while offset + FRAME.size <= size:
+            magic, _, _, _, n, m = FRAME.unpack_from(self.map, offset)
+            end = offset + self._frame_size(n, m)
+            if magic != FRAME_MAGIC or end > size:
+                break   # Оборванный кадр в конце файла
+            offsets.append(offset)
+            offset = end
+        return np.asarray(offsets, dtype=np.int64)
+
+    def _frame_size(self, n, m):
+        size = 2 * n * self.dtype.itemsize + n
+        return FRAME.size + size + _pad(size) + 8 * m
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def step(self, k):
+        """Номер шага физики для кадра k"""
+        return FRAME.unpack_from(self.map, int(self.offsets[k]))[2]
+
+    def steps(self):
+        """Номера шагов всех кадров"""
+        return np.fromiter((self.step(k) for k in range(len(self))), np.int64, len(self))
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        offset = int(self.offsets[k])
+        _, flags, step, version, n, m = FRAME.unpack_from(self.map, offset)
+        offset += FRAME.size
+        snap = Snapshot()
+        snap.x = np.frombuffer(self.map, self.dtype, n, offset)
+        snap.y = np.frombuffer(self.map, self.dtype, n, offset + n * self.dtype.itemsize)
+        offset += 2 * n * self.dtype.itemsize
+        snap.type = np.frombuffer(self.map, "i1", n, offset)
+        offset += n + _pad(2 * n * self.dtype.itemsize + n)
+        snap.bond_a = np.frombuffer(self.map, "<i4", m, offset)
+        snap.bond_b = np.frombuffer(self.map, "<i4", m, offset + 4 * m)
+        snap.version = version
+        snap.step = step
+        snap.boundaries = bool(flags & FLAG_BOUNDARIES)
+        snap.width = self.header["width"]
+        snap.height = self.header["height"]
+        snap.time = step
+        snap.cells = None
+        snap.structures = None
+        return snap
+
+    def close(self):
+        """Закрыть файл; отображение освободится, когда не останется кадров из него"""
+        self.offsets = None
+        try:
+            self.map.close()
+        except BufferError:
+            pass    # Еще живы массивы кадров - mmap закроется сборщиком
+        self.file.close()
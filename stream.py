@@ -0,0 +1,329 @@
+"""Раздача состояния по сети для просмотра издалека.
+
+Сервер (python stream.py) считает физику в фоновом потоке или процессе и
+раздает кадры клиентам по TCP через asyncio. Клиент - sim.py --connect
+host:port: StreamRunner принимает кадры в фоновом потоке и отдает их
+отрисовке как обычные снимки, так что камера, LOD и наложения работают
+как при локальном расчете.
+
+Сообщение - заголовок MESSAGE (вид, длина) и данные:
+    WRLD  заголовок мира в JSON (как в statefile)
+    KEYF  полный кадр: позиции, типы, связи
+    DELT  разница с предыдущим кадром этого клиента: приращения позиций
+          и связи, которые появились и исчезли
+Позиции квантуются до 16 бит на ось по размеру мира; приращения - int16
+по модулю 2^16, поэтому клиент восстанавливает квантованные позиции
+точно. Связи сравниваются по ключам min * n + max. Данные кадров сжаты
+zlib: приращения за кадр малы и хорошо сжимаются. Полный кадр идет
+первым, после добавления или удаления частиц и после смены мира.
+
+Медленный клиент не задерживает ни физику, ни других клиентов: он
+получает самый свежий кадр, как только ушел предыдущий, а промежуточные
+пропускаются. Разности считаются от последнего отправленного этому
+клиенту кадра, так что пропуски их не портят.
+
+Пример:
+    python stream.py --count 20000 --width 8000 --height 4500 --port 8765
+    python sim.py --connect 127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import json
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+import physics
+import statefile
+from kernel import bond_keys
+from scheduler import Snapshot, ThreadRunner, ProcessRunner, _between
+
+MESSAGE = struct.Struct("<4sI")       # вид, длина данных
+KEYFRAME = struct.Struct("<QqQQB")    # шаг физики, version, частиц, связей, флаги
+DELTA = struct.Struct("<QqQQQ")       # шаг физики, version, частиц, новых связей, разорванных
+QUANT = 65535                         # Наибольшая квантованная координата
+FLAG_BOUNDARIES = 1
+COMPRESS_LEVEL = 1
+
+
+def quantize(values, size):
+    return np.clip(np.rint(values * (QUANT / size)), 0, QUANT).astype(np.uint16)
+
+
+def message(kind, data):
+    return MESSAGE.pack(kind, len(data)) + data
+
+
+class FrameEncoder:
+    """Кадры для одного клиента: полный кадр или разница с прошлым отправленным"""
+
+    def __init__(self):
+        self.world = None
+        self.version = None
+        self.qx = self.qy = self.keys = None
+
+    def encode(self, snap, world):
+        """Байты сообщений для снимка snap; world - заголовок мира в JSON"""
+        out = []
+        if world != self.world:
+            out.append(message(b"WRLD", world.encode()))
+            self.world = world
+            self.version = None
+        n = len(snap)
+        qx = quantize(snap.x, snap.width)
+        qy = quantize(snap.y, snap.height)
+        keys = bond_keys(snap.bond_a, snap.bond_b, n)
+        if snap.version != self.version:
+            flags = FLAG_BOUNDARIES if snap.boundaries else 0
+            head = KEYFRAME.pack(snap.step, snap.version, n, len(keys), flags)
+            body = b"".join((qx.tobytes(), qy.tobytes(), snap.type.astype("i1").tobytes(),
+                             keys.tobytes()))
+            out.append(message(b"KEYF", head + zlib.compress(body, COMPRESS_LEVEL)))
+        else:
+            added = np.setdiff1d(keys, self.keys, assume_unique=True)
+            removed = np.setdiff1d(self.keys, keys, assume_unique=True)
+            head = DELTA.pack(snap.step, snap.version, n, len(added), len(removed))
+            body = b"".join(((qx - self.qx).tobytes(), (qy - self.qy).tobytes(),
+                             added.tobytes(), removed.tobytes()))
+            out.append(message(b"DELT", head + zlib.compress(body, COMPRESS_LEVEL)))
+        self.version = snap.version
+        self.qx, self.qy, self.keys = qx, qy, keys
+        return b"".join(out)
+
+
+class FrameDecoder:
+    """Снимки из сообщений сервера"""
+
+    def __init__(self):
+        self.header = None
+        self.version = None
+        self.step = 0
+        self.qx = self.qy = self.type = self.keys = None
+        self.boundaries = True
+
+    def feed(self, kind, data):
+        """Разобрать сообщение; возвращает Snapshot для кадров, None для WRLD"""
+        if kind == b"WRLD":
+            self.header = json.loads(data)
+            self.version = None
+            return None
+        if kind == b"KEYF":
+            step, version, n, m, flags = KEYFRAME.unpack_from(data)
+            body = zlib.decompress(data[KEYFRAME.size:])
+            self.qx = np.frombuffer(body, np.uint16, n, 0)
+            self.qy = np.frombuffer(body, np.uint16, n, 2 * n)
+            self.type = np.frombuffer(body, np.int8, n, 4 * n)
+            self.keys = np.frombuffer(body, np.int64, m, 5 * n)
+            self.boundaries = bool(flags & FLAG_BOUNDARIES)
+        elif kind == b"DELT":
+            step, version, n, added, removed = DELTA.unpack_from(data)
+            if version != self.version:
+                raise ValueError("разница к кадру, которого нет у клиента")
+            body = zlib.decompress(data[DELTA.size:])
+            self.qx = self.qx + np.frombuffer(body, np.uint16, n, 0)
+            self.qy = self.qy + np.frombuffer(body, np.uint16, n, 2 * n)
+            new = np.frombuffer(body, np.int64, added, 4 * n)
+            gone = np.frombuffer(body, np.int64, removed, 4 * n + 8 * added)
+            keys = self.keys[~np.isin(self.keys, gone, assume_unique=True)]
+            self.keys = np.union1d(keys, new)
+        else:
+            raise ValueError(f"неизвестное сообщение {kind!r}")
+        self.version = version
+        self.step = step
+        return self.snapshot(n)
+
+    def snapshot(self, n):
+        width = self.header["width"]
+        height = self.header["height"]
+        snap = Snapshot()
+        snap.x = self.qx * (width / QUANT)
+        snap.y = self.qy * (height / QUANT)
+        snap.type = self.type
+        snap.bond_a, snap.bond_b = np.divmod(self.keys, max(n, 1))
+        snap.version = self.version
+        snap.step = self.step
+        snap.boundaries = self.boundaries
+        snap.width = width
+        snap.height = height
+        snap.time = time.monotonic()
+        snap.cells = None
+        snap.structures = None
+        return snap
+
+
+async def read_message(reader):
+    kind, size = MESSAGE.unpack(await reader.readexactly(MESSAGE.size))
+    return kind, await reader.readexactly(size)
+
+
+class StreamServer:
+    """Раздача снимков runner клиентам не чаще fps кадров в секунду"""
+
+    def __init__(self, runner, fps=30, palette=None):
+        self.runner = runner
+        self.period = 1.0 / fps
+        self.palette = palette
+        self.clients = 0
+        self.sent = 0
+        self.bytes = 0
+
+    def latest(self):
+        """Свежий снимок и заголовок мира"""
+        if isinstance(self.runner, ProcessRunner):
+            self.runner.frame(0)    # Снимки из канала забираются только в frame()
+        return self.runner.latest(), json.dumps(statefile.world_header(self.palette))
+
+    async def serve_client(self, reader, writer):
+        encoder = FrameEncoder()
+        last = None
+        self.clients += 1
+        try:
+            while True:
+                start = time.perf_counter()
+                snap, world = self.latest()
+                if snap is not last:
+                    data = encoder.encode(snap, world)
+                    writer.write(data)
+                    # Ждем, пока клиент заберет кадр; физика тем временем идет дальше
+                    await writer.drain()
+                    last = snap
+                    self.sent += 1
+                    self.bytes += len(data)
+                await asyncio.sleep(max(0.0, self.period - (time.perf_counter() - start)))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.serve_client, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname())
+        async with server:
+            await server.serve_forever()
+
+
+class StreamRunner:
+    """Кадры с сервера stream.py вместо расчета; команды мира не действуют"""
+
+    def __init__(self, host, port, timeout=10.0):
+        self.address = f"{host}:{port}"
+        self.decoder = FrameDecoder()
+        self.pair = (None, None)
+        self.header = None
+        self.paused = False
+        self.error = None
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(host, port), daemon=True)
+        self.thread.start()
+        if not self.ready.wait(timeout) or self.error is not None:
+            self.close()
+            raise ConnectionError(f"нет кадров от {host}:{port}: {self.error}")
+
+    def _run(self, host, port):
+        try:
+            self.loop.run_until_complete(self._receive(host, port))
+        except asyncio.CancelledError:
+            pass
+        except Exception as error:
+            self.error = error
+            self.ready.set()
+
+    async def _receive(self, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while True:
+                snap = self.decoder.feed(*await read_message(reader))
+                if snap is None:
+                    continue
+                self.header = self.decoder.header
+                if not self.paused:
+                    self.pair = (self.pair[1], snap)
+                self.ready.set()
+        finally:
+            writer.close()
+
+    def call(self, fn, *args):
+        pass
+
+    def set_paused(self, paused):
+        self.paused = paused
+
+    def frame(self, elapsed):
+        """Кадр по последним снимкам; ConnectionError, если связь с сервером потеряна"""
+        if self.error is not None:
+            raise ConnectionError(f"связь с {self.address} потеряна: {self.error!r}")
+        prev, cur = self.pair
+        return cur.blend(prev, _between(prev, cur, time.monotonic()))
+
+    def latest(self):
+        return self.pair[1]
+
+    def close(self):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._cancel)
+            self.thread.join(1)
+
+    def _cancel(self):
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер кадров симуляции для sim.py --connect")
+    parser.add_argument("--host", default="0.0.0.0", help="адрес для подключений")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fps", type=float, default=30, help="наибольшая частота кадров клиенту")
+    parser.add_argument("--rate", type=float, default=60, help="шагов физики в секунду")
+    parser.add_argument("--width", type=float, default=1920, help="ширина мира")
+    parser.add_argument("--height", type=float, default=1040, help="высота мира")
+    parser.add_argument("--count", type=int, default=physics.NODE_COUNT, help="число частиц")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора")
+    parser.add_argument("--types", type=int, default=None,
+                        help="число типов частиц со случайными таблицами (по умолчанию - 3 заданных)")
+    parser.add_argument("--engine", choices=("python", "numpy", "parallel"), default="numpy")
+    parser.add_argument("--skin", type=float, default=0,
+                        help="запас списка соседей в пикселях (0 - пары по сетке каждый шаг)")
+    parser.add_argument("--torus", action="store_true", help="торовая топология вместо границ")
+    parser.add_argument("--precision", choices=("f8", "f4"), default="f8",
+                        help="точность позиций и скоростей (f4 - вдвое меньше памяти)")
+    parser.add_argument("--load-state", metavar="PATH", help="начать с сохраненного состояния")
+    parser.add_argument("--process", action="store_true",
+                        help="физика в отдельном процессе (по умолчанию - в фоновом потоке)")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        physics.seed(args.seed)
+    physics.PRECISION = args.precision
+    if args.types is not None:
+        physics.set_types(*physics.random_types(args.types))
+    physics.ENGINE = args.engine
+    physics.SKIN = args.skin
+    physics.NODE_COUNT = args.count
+    palette = None
+    if args.load_state:
+        palette = statefile.load(args.load_state).get("palette")
+    else:
+        physics.boundaries_enabled = not args.torus
+        physics.setup(args.width, args.height)
+        physics.init_simulation()
+
+    runner = ProcessRunner(args.rate) if args.process else ThreadRunner(args.rate)
+    server = StreamServer(runner, args.fps, palette)
+
+    def ready(address):
+        print(f"serving {len(physics.particles)} particles on {address[0]}:{address[1]}", flush=True)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from array import array
+import numpy as np
+
+
+class Structures:
+    """Связные структуры графа связей, обновляемые по ходу изменений.
+
+    label[i] - номер структуры частицы i (-1 - частица без связей), members -
+    частицы каждой структуры. Новая связь объединяет структуры сразу:
+    меньшая переходит в большую. Разрыв связи только помечает структуру,
+    а refresh() разбирает помеченные структуры обходом в ширину по adj,
+    так что несколько разрывов в одной структуре за шаг обходят ее один
+    раз, а остальные структуры не затрагиваются. Номера освободившихся
+    структур используются снова, поэтому все номера меньше числа частиц.
+    """
+
+    def __init__(self, adj):
+        self.adj = adj
+        self.label = array('q')
+        self.members = {}
+        self.dirty = set()
+        self.free = []
+        self.next_id = 0
+
+    def __len__(self):
+        """Число структур (не меньше двух частиц)"""
+        self.refresh()
+        return len(self.members)
+
+    def _new(self, nodes):
+        sid = self.free.pop() if self.free else self._take()
+        self.members[sid] = nodes
+        for i in nodes:
+            self.label[i] = sid
+        return sid
+
+    def _take(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _drop(self, sid):
+        del self.members[sid]
+        self.free.append(sid)
+
+    def add_nodes(self, k):
+        self.label.extend(array('q', [-1]) * k)
+
+    def link(self, i, j):
+        """Связь i-j: объединить структуры"""
+        si = self.label[i]
+        sj = self.label[j]
+        if si < 0 and sj < 0:
+            self._new({i, j})
+        elif si < 0 or sj < 0:
+            sid = max(si, sj)
+            node = i if si < 0 else j
+            self.members[sid].add(node)
+            self.label[node] = sid
+        elif si != sj:
+            if len(self.members[si]) < len(self.members[sj]):
+                si, sj = sj, si
+            moved = self.members[sj]
+            self.members[si] |= moved
+            for node in moved:
+                self.label[node] = si
+            self._drop(sj)
+            if sj in self.dirty:
+                self.dirty.discard(sj)
+                self.dirty.add(si)
+
+    def unlink(self, i, j):
+        """Разрыв связи i-j: структура разбирается при следующем refresh()"""
+        self.dirty.add(self.label[i])
+
+    def move(self, src, dst):
+        """Частица src переехала на место dst (связей у dst уже нет)"""
+        old = self.label[dst]
+        if old >= 0:
+            self.members[old].discard(dst)
+        sid = self.label[src]
+        if sid >= 0:
+            nodes = self.members[sid]
+            nodes.discard(src)
+            nodes.add(dst)
+        self.label[dst] = sid
+
+    def pop(self):
+        sid = self.label.pop()
+        if sid >= 0:
+            self.members[sid].discard(len(self.label))
+
+    def refresh(self):
+        """Разобрать структуры, в которых рвались связи"""
+        adj = self.adj
+        label = self.label
+        for sid in self.dirty:
+            nodes = self.members[sid]
+            self._drop(sid)
+            while nodes:
+                start = nodes.pop()
+                piece = {start}
+                frontier = [start]
+                while frontier:
+                    for j in adj[frontier.pop()]:
+                        if j not in piece:
+                            piece.add(j)
+                            frontier.append(j)
+                nodes -= piece
+                if len(piece) > 1:
+                    self._new(piece)
+                else:
+                    label[start] = -1
+        self.dirty.clear()
+
+    def labels(self):
+        """NumPy-представление номеров структур (-1 - без связей)"""
+        self.refresh()
+        return np.frombuffer(self.label, dtype=np.int64)
+
+    def summary(self, x, y, wrap=None, min_size=2):
+        """Размеры и центры структур не меньше min_size частиц.
+
+        Возвращает (sizes, cx, cy), структуры по убыванию размера. wrap -
+        размер мира на торе: центр считается как среднее по окружности,
+        чтобы структура через край не оказалась посередине мира.
+        """
+        labels = self.labels()
+        bound = labels >= 0
+        sid = labels[bound]
+        sizes = np.bincount(sid, minlength=self.next_id)
+        keep = np.flatnonzero(sizes >= min_size)
+        keep = keep[np.argsort(-sizes[keep], kind="stable")]
+        cx = _mean(sid, x[bound], sizes, wrap and wrap[0])[keep]
+        cy = _mean(sid, y[bound], sizes, wrap and wrap[1])[keep]
+        return sizes[keep], cx, cy
+
+
+def _mean(sid, values, sizes, period):
+    """Среднее values по структурам; period - среднее по окружности этой длины"""
+    count = np.maximum(sizes, 1)
+    if not period:
+        return np.bincount(sid, values, len(sizes)) / count
+    angle = values * (2 * np.pi / period)
+    s = np.bincount(sid, np.sin(angle), len(sizes))
+    c = np.bincount(sid, np.cos(angle), len(sizes))
+    return np.arctan2(s, c) % (2 * np.pi) * (period / (2 * np.pi))
@@ -0,0 +1,182 @@
+"""Перебор таблиц взаимодействий в пакетных запусках без окна.
+
+Каждый запуск - свои COUPLING, LINKS и LINKS_POSSIBLE: случайные (как
+physics.random_types()) или все сочетания значений --values в клетках
+COUPLING при текущих LINKS и LINKS_POSSIBLE (--grid). Запуски идут
+параллельно в пуле процессов. Каждые --check-every шагов запуск снимает
+physics.stats(): число связей, средние связи по типам и кинетическую
+энергию. Если средние каждой величины за два последних окна по --window
+замеров расходятся не больше чем на --tolerance (доля от величины, но не
+меньше 1), запуск останавливается досрочно. На каждый запуск пишется одна
+строка JSONL с итоговыми величинами и таблицами, по которым его можно
+повторить.
+
+Пример:
+    python sweep.py --samples 64 --count 850 --max-steps 3000 --out sweep.jsonl
+    python sweep.py --grid --values=-1,1 --jobs 8 --out grid.jsonl
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import physics
+
+
+class Plateau:
+    """Признак остановки: средние за два последних окна по window замеров совпадают.
+
+    Сравниваются средние, а не отдельные замеры: энергия устоявшейся
+    структуры колеблется от замера к замеру, а среднее почти не меняется.
+    """
+
+    def __init__(self, window, tolerance):
+        self.window = window
+        self.tolerance = tolerance
+        self.history = deque(maxlen=2 * window)
+
+    def update(self, values):
+        """Добавить замер; True - величины вышли на плато"""
+        self.history.append(np.asarray(values, dtype=np.float64))
+        if len(self.history) < self.history.maxlen:
+            return False
+        samples = np.array(self.history)
+        old = samples[:self.window].mean(axis=0)
+        new = samples[self.window:].mean(axis=0)
+        scale = np.maximum(np.abs(samples.mean(axis=0)), 1)
+        return bool(np.all(np.abs(new - old) <= self.tolerance * scale))
+
+
+def metrics():
+    """Величины для плато: связи, средние связи по типам, энергия"""
+    stats = physics.stats()
+    return [stats["bonds"]] + stats["mean_links"] + [stats["kinetic_energy"]]
+
+
+def run(task):
+    """Один запуск в рабочем процессе; возвращает строку результата"""
+    coupling, links, links_possible = task["tables"]
+    physics.ENGINE = task["engine"]
+    physics.SKIN = task["skin"]
+    physics.NODE_COUNT = task["count"]
+    physics.seed(task["seed"])
+    physics.set_types(coupling, links, links_possible)
+    physics.boundaries_enabled = not task["torus"]
+    physics.setup(task["width"], task["height"])
+    physics.init_simulation()
+
+    plateau = Plateau(task["window"], task["tolerance"])
+    start = time.perf_counter()
+    step = 0
+    stopped = "max_steps"
+    while step < task["max_steps"]:
+        physics.logic()
+        step += 1
+        if step % task["check_every"] == 0 and plateau.update(metrics()):
+            stopped = "plateau"
+            break
+    stats = physics.stats()
+    n = max(stats["particles"], 1)
+    return {
+        "run": task["run"],
+        "seed": task["seed"],
+        "steps": step,
+        "stopped": stopped,
+        "seconds": round(time.perf_counter() - start, 3),
+        "bonds": stats["bonds"],
+        "bonds_per_particle": round(stats["bonds"] / n, 4),
+        "mean_links": stats["mean_links"],
+        "kinetic_energy": round(stats["kinetic_energy"], 4),
+        "structures": stats["structures"],
+        "largest_structure": stats["largest_structure"],
+        "coupling": coupling,
+        "links": links,
+        "links_possible": links_possible,
+    }
+
+
+def random_tables(samples, types):
+    """samples случайных таблиц из physics.random_types()"""
+    return [physics.random_types(types) for _ in range(samples)]
+
+
+def grid_tables(values):
+    """Все матрицы COUPLING из значений values при текущих LINKS и LINKS_POSSIBLE"""
+    k = len(physics.LINKS)
+    links = list(physics.LINKS)
+    links_possible = [list(row) for row in physics.LINKS_POSSIBLE]
+    return [([list(cells[i * k:(i + 1) * k]) for i in range(k)], links, links_possible)
+            for cells in itertools.product(values, repeat=k * k)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перебор таблиц взаимодействий")
+    parser.add_argument("--samples", type=int, default=32, help="число случайных таблиц")
+    parser.add_argument("--types", type=int, default=None,
+                        help="число типов случайных таблиц (по умолчанию - как в physics)")
+    parser.add_argument("--grid", action="store_true",
+                        help="все матрицы COUPLING из значений --values вместо случайных")
+    parser.add_argument("--values", default="-1,0,1",
+                        help="значения клеток COUPLING для --grid через запятую; "
+                             "с минусом в начале - через =, например --values=-1,1")
+    parser.add_argument("--width", type=float, default=1920, help="ширина мира")
+    parser.add_argument("--height", type=float, default=1040, help="высота мира")
+    parser.add_argument("--count", type=int, default=physics.NODE_COUNT, help="число частиц")
+    parser.add_argument("--torus", action="store_true", help="торовая топология вместо границ")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="зерно таблиц; запуск k идет с зерном seed + k")
+    parser.add_argument("--engine", choices=("python", "numpy"), default="numpy")
+    parser.add_argument("--skin", type=float, default=0,
+                        help="запас списка соседей в пикселях (0 - пары по сетке каждый шаг)")
+    parser.add_argument("--max-steps", type=int, default=3000, help="наибольшее число шагов")
+    parser.add_argument("--check-every", type=int, default=50, help="шагов между замерами")
+    parser.add_argument("--window", type=int, default=5,
+                        help="замеров в окне; плато - два окна с одинаковыми средними")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="допустимое изменение средних между окнами (доля)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="число процессов (по умолчанию - ядра)")
+    parser.add_argument("--out", metavar="PATH", help="записать строки в JSONL (иначе - stdout)")
+    args = parser.parse_args(argv)
+
+    if args.grid and args.types is not None:
+        parser.error("--types задает только случайные таблицы")
+    physics.seed(args.seed)
+    if args.grid:
+        try:
+            values = [float(v) for v in args.values.split(",")]
+        except ValueError:
+            parser.error("--values: нужны числа через запятую")
+        tables = grid_tables(values)
+    else:
+        tables = random_tables(args.samples, args.types or len(physics.LINKS))
+    common = {
+        "engine": args.engine, "skin": args.skin, "count": args.count, "torus": args.torus,
+        "width": args.width, "height": args.height, "max_steps": args.max_steps,
+        "check_every": args.check_every, "window": args.window, "tolerance": args.tolerance,
+    }
+    tasks = [dict(common, run=k, seed=args.seed + k, tables=t) for k, t in enumerate(tables)]
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    jobs = args.jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(jobs) as pool:
+            for done, future in enumerate(as_completed(pool.submit(run, t) for t in tasks), 1):
+                row = future.result()
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+                print(f"[{done}/{len(tasks)}] run {row['run']}: {row['stopped']} at {row['steps']}, "
+                      f"bonds {row['bonds']}, energy {row['kinetic_energy']}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{len(tasks)} runs in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
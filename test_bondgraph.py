@@ -0,0 +1,150 @@
+"""Граф связей и связные структуры против пересчета с нуля"""
+import random
+import numpy as np
+from bondgraph import _key
+from store import ParticleStore
+
+NTYPES = 3
+
+
+def components(store):
+    """Связные компоненты обходом в ширину по всему графу: частица -> номер"""
+    adj = store.bonds.adj
+    label = [-1] * len(store)
+    for start in range(len(store)):
+        if label[start] >= 0 or not adj[start]:
+            continue
+        label[start] = start
+        frontier = [start]
+        while frontier:
+            for j in adj[frontier.pop()]:
+                if label[j] < 0:
+                    label[j] = start
+                    frontier.append(j)
+    return label
+
+
+def check_graph(store):
+    """slot, adj, счетчики и структуры согласованы с массивами концов связей"""
+    graph = store.bonds
+    n = len(store)
+    ea = list(graph.a)
+    eb = list(graph.b)
+    assert len(graph.slot) == len(ea)
+    for s, (i, j) in enumerate(zip(ea, eb)):
+        assert graph.slot[_key(i, j)] == s
+    neighbours = [[] for _ in range(n)]
+    counts = np.zeros((n, NTYPES), dtype=np.int64)
+    for i, j in zip(ea, eb):
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+        counts[i, store.type[j]] += 1
+        counts[j, store.type[i]] += 1
+    for i in range(n):
+        assert sorted(graph.adj[i]) == sorted(neighbours[i])
+        assert store.links[i] == len(neighbours[i])
+    assert np.array_equal(graph.type_counts(), counts)
+
+    # Структуры: те же компоненты, что и обход с нуля
+    labels = graph.structures.labels()
+    reference = components(store)
+    pairs = {}
+    for i in range(n):
+        assert (labels[i] < 0) == (reference[i] < 0)
+        if reference[i] >= 0:
+            assert pairs.setdefault(reference[i], labels[i]) == labels[i]
+    assert len(set(pairs.values())) == len(pairs) == len(graph.structures)
+    for sid, nodes in graph.structures.members.items():
+        assert all(labels[i] == sid for i in nodes)
+
+
+def make_store(n, rng):
+    store = ParticleStore(NTYPES)
+    for k in range(n):
+        store.add(rng.randrange(NTYPES), float(k), 0.0)    # x - постоянный номер частицы
+    return store
+
+
+def edge_ids(store):
+    """Связи по постоянным номерам частиц (x), не зависящим от переездов"""
+    x = store.view('x')
+    a, b = store.bonds.views()
+    return {(min(p, q), max(p, q)) for p, q in zip(x[a].tolist(), x[b].tolist())}
+
+
+def test_link_unlink():
+    rng = random.Random(1)
+    store = make_store(40, rng)
+    graph = store.bonds
+    edges = set()
+    for _ in range(400):
+        i, j = rng.sample(range(len(store)), 2)
+        if graph.linked(i, j):
+            if rng.random() < 0.5:
+                graph.remove(i, j)
+            else:
+                graph.remove_slot(graph.slot[_key(i, j)])
+            edges.discard((min(i, j), max(i, j)))
+        else:
+            graph.add(i, j)
+            edges.add((min(i, j), max(i, j)))
+        assert edge_ids(store) == {(float(i), float(j)) for i, j in edges}
+        check_graph(store)
+
+
+def test_remove_slots_keeps_remaining_bonds():
+    rng = random.Random(2)
+    store = make_store(30, rng)
+    graph = store.bonds
+    for i in range(29):
+        graph.add(i, i + 1)
+    before = edge_ids(store)
+    slots = rng.sample(range(len(graph)), 10)
+    gone = {(float(graph.a[s]), float(graph.b[s])) for s in slots}
+    graph.remove_slots(slots)
+    assert edge_ids(store) == before - {(min(p), max(p)) for p in gone}
+    check_graph(store)
+
+
+def test_particle_removal_remaps_slots():
+    """Удаление частицы: последняя переезжает на ее место вместе со связями"""
+    rng = random.Random(3)
+    store = make_store(60, rng)
+    graph = store.bonds
+    for _ in range(90):
+        i, j = rng.sample(range(len(store)), 2)
+        if not graph.linked(i, j):
+            graph.add(i, j)
+    handles = [(store[i], store.x[i]) for i in range(len(store))]
+    while len(store) > 5:
+        victim = rng.randrange(len(store))
+        x = store.x[victim]
+        edges = {e for e in edge_ids(store) if x not in e}
+        if rng.random() < 0.5:
+            store.remove(store[victim])
+        else:
+            store.remove_many([victim])
+        assert edge_ids(store) == edges
+        check_graph(store)
+        # Ссылки на частицы идут за ними при переезде
+        for p, x in handles:
+            assert p.alive == any(store.x[i] == x for i in range(len(store)))
+            if p.alive:
+                assert p.x == x
+
+
+def test_structures_split_after_unlink():
+    """Цепочки и кольца рвутся по одной связи; refresh() разбирает только помеченные"""
+    rng = random.Random(4)
+    store = make_store(80, rng)
+    graph = store.bonds
+    for start in range(0, 80, 20):
+        for i in range(start, start + 19):
+            graph.add(i, i + 1)
+        graph.add(start, start + 19)    # Кольцо: первый разрыв его не делит
+    check_graph(store)
+    while len(graph):
+        for _ in range(rng.randint(1, 4)):  # Несколько разрывов до одной проверки
+            if len(graph):
+                graph.remove_slot(rng.randrange(len(graph)))
+        check_graph(store)
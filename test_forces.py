@@ -0,0 +1,141 @@
+"""Сверка силовых формул без тригонометрии с прежними (через atan2/cos/sin).
+
+Пары покрывают совпавшие частицы, ближнее отталкивание (NODE_RADIUS),
+притяжение/отталкивание по COUPLING, насыщенные частицы и пружины связей
+(LINK_FORCE). Поштучный расчет, NumPy-ядро и пружины должны совпадать с
+прежними формулами до FORCE_TOLERANCE.
+
+Запуск:
+    python -m pytest test_forces.py
+"""
+import math as meth
+import numpy as np
+import pytest
+import physics
+
+# Допустимая относительная ошибка сил относительно прежних формул
+FORCE_TOLERANCE = 1e-12
+SAMPLES = 2000
+
+
+@pytest.fixture(autouse=True)
+def double_precision():
+    """Сверка до 1e-12 имеет смысл только во float64"""
+    physics.PRECISION = "f8"
+
+
+def reference_pair(dx, dy, d2, ca, cb, free):
+    """Прежние формулы парной силы через atan2/cos/sin: (a.sx, a.sy, -b.sx, -b.sy)"""
+    dA = ca / d2 if d2 != 0 else 0
+    dB = cb / d2 if d2 != 0 else 0
+    if not free:
+        dA = 1 / d2 if d2 != 0 else 0
+        dB = 1 / d2 if d2 != 0 else 0
+    angle = meth.atan2(dy, dx)
+    d2 = max(d2, 1)
+    if d2 < physics.NODE_RADIUS * physics.NODE_RADIUS * 4:
+        dA = 1 / d2
+        dB = 1 / d2
+    s = physics.SPEED
+    return (meth.cos(angle) * dA * s, meth.sin(angle) * dA * s,
+            meth.cos(angle) * dB * s, meth.sin(angle) * dB * s)
+
+
+def place_pairs(distances, seed):
+    """Пары частиц на заданных расстояниях под случайными углами, далеко друг от друга"""
+    rng = np.random.default_rng(seed)
+    k = len(physics.LINKS)
+    step = physics.MAX_DIST * 3
+    side = int(meth.ceil(meth.sqrt(len(distances))))
+    physics.boundaries_enabled = True
+    physics.setup(side * step + step, side * step + step)
+    physics.clear_screen()
+    angle = rng.uniform(-meth.pi, meth.pi, len(distances))
+    for n, d in enumerate(distances.tolist()):
+        x = (n % side) * step + step
+        y = (n // side) * step + step
+        physics.particles.add(int(rng.integers(k)), x, y)
+        physics.particles.add(int(rng.integers(k)), x - d * meth.cos(angle[n]),
+                              y - d * meth.sin(angle[n]))
+    return rng
+
+
+def relative_error(new, ref):
+    """Наибольшая ошибка по парам относительно величины силы пары"""
+    new = np.asarray(new)
+    ref = np.asarray(ref)
+    scale = np.maximum(np.abs(ref).max(axis=1), 1e-300)
+    return float(np.max(np.abs(new - ref).max(axis=1) / scale, initial=0))
+
+
+def pair_errors(samples=SAMPLES, seed=0):
+    """Ошибки поштучного расчета и NumPy-ядра на парах без связей"""
+    near = physics.NODE_RADIUS * 2
+    rng = np.random.default_rng(seed)
+    distances = np.concatenate((
+        np.zeros(4),
+        rng.uniform(1e-3, 1, samples // 8),
+        rng.uniform(1, near, samples // 4),
+        rng.uniform(near, physics.MAX_DIST * 0.999, samples - samples // 8 - samples // 4 - 4),
+    ))
+    rng = place_pairs(distances, seed)
+    particles = physics.particles
+    pa = np.arange(0, len(particles), 2)
+    pb = pa + 1
+    # Часть частиц насыщена связями - для них действует отталкивание
+    saturated = rng.random(len(pa)) < 0.3
+    for i in pa[saturated].tolist():
+        particles.links[i] = physics.LINKS[particles.type[i]]
+
+    x = particles.view('x').copy()
+    y = particles.view('y').copy()
+    ptype = particles.view('type').astype(np.int64)
+    links = particles.view('links').astype(np.int64)
+    ref = []
+    for i, j in zip(pa.tolist(), pb.tolist()):
+        dx = x[i] - x[j]
+        dy = y[i] - y[j]
+        ta, tb = ptype[i], ptype[j]
+        free = links[i] < physics.LINKS[ta] and links[j] < physics.LINKS[tb]
+        ref.append(reference_pair(dx, dy, dx * dx + dy * dy, physics.COUPLING[ta][tb],
+                                  physics.COUPLING[tb][ta], free))
+
+    dsx, dsy, _ = physics.kernel.run(x, y, ptype, links.copy(), physics.bonds.type_counts(),
+                                     [], [], [(pa, pb)])
+    batched = np.stack((dsx[pa], dsy[pa], -dsx[pb], -dsy[pb]), axis=1)
+
+    for i, j in zip(pa.tolist(), pb.tolist()):
+        physics.pair_force(i, j)
+    sx = particles.view('sx')
+    sy = particles.view('sy')
+    scalar = np.stack((sx[pa], sy[pa], -sx[pb], -sy[pb]), axis=1)
+    return relative_error(scalar, ref), relative_error(batched, ref)
+
+
+def spring_error(samples=SAMPLES, seed=1):
+    """Ошибка пружин связей на расстояниях, где связь тянет и не рвется"""
+    rng = np.random.default_rng(seed)
+    distances = rng.uniform(physics.NODE_RADIUS * 2 * 1.0001, physics.MAX_DIST / 2, samples)
+    place_pairs(distances, seed)
+    particles = physics.particles
+    for i in range(0, len(particles), 2):
+        physics.bonds.add(i, i + 1)
+    x = particles.view('x').copy()
+    y = particles.view('y').copy()
+    physics.update_bonds()
+    pa = np.arange(0, len(particles), 2)
+    angle = np.array([meth.atan2(y[i] - y[i + 1], x[i] - x[i + 1]) for i in pa.tolist()])
+    k = physics.LINK_FORCE * physics.SPEED
+    ref = np.stack((np.cos(angle) * k, np.sin(angle) * k), axis=1)
+    spring = np.stack((particles.view('sx')[pa], particles.view('sy')[pa]), axis=1)
+    return relative_error(spring, ref)
+
+
+def test_pair_forces():
+    scalar, batched = pair_errors()
+    assert scalar < FORCE_TOLERANCE
+    assert batched < FORCE_TOLERANCE
+
+
+def test_bond_springs():
+    assert spring_error() < FORCE_TOLERANCE
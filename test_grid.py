@@ -0,0 +1,79 @@
+"""Пары-кандидаты сетки и списка соседей против перебора всех пар"""
+import numpy as np
+import pytest
+from grid import SpatialHash
+from kernel import min_image
+from neighbours import NeighbourList
+
+WIDTH, HEIGHT, CUTOFF = 700.0, 430.0, 60.0
+
+
+def close_pairs(x, y, reach, toroidal):
+    """Все пары ближе reach перебором"""
+    dx = x[:, None] - x[None, :]
+    dy = y[:, None] - y[None, :]
+    if toroidal:
+        dx = min_image(dx, WIDTH)
+        dy = min_image(dy, HEIGHT)
+    i, j = np.nonzero(np.triu(dx * dx + dy * dy < reach * reach, 1))
+    return set(zip(i.tolist(), j.tolist()))
+
+
+def candidates(chunks):
+    """Пары из пакетов без учета порядка концов; повторов быть не должно"""
+    found = []
+    for a, b in chunks:
+        found.extend(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+    assert len(found) == len(set(found))
+    assert all(i != j for i, j in found)
+    return set(found)
+
+
+def points(n, seed):
+    rng = np.random.default_rng(seed)
+    # Часть точек на самых краях мира - там сшиваются клетки тора
+    x = np.concatenate((rng.uniform(0, WIDTH, n), [0.0, WIDTH - 1e-9, 1.0, WIDTH - 1.0]))
+    y = np.concatenate((rng.uniform(0, HEIGHT, n), [0.0, HEIGHT - 1e-9, HEIGHT - 1.0, 1.0]))
+    return x, y
+
+
+@pytest.mark.parametrize("toroidal", [False, True])
+@pytest.mark.parametrize("chunk", [7, 1 << 16])
+def test_spatial_hash_pairs(toroidal, chunk):
+    x, y = points(600, 1)
+    grid = SpatialHash(WIDTH, HEIGHT, CUTOFF)
+    grid.build(x, y, toroidal)
+    found = candidates(grid.pairs(chunk))
+    assert close_pairs(x, y, CUTOFF, toroidal) <= found
+    assert len(found) == grid.pair_count()
+
+
+@pytest.mark.parametrize("toroidal", [False, True])
+def test_small_torus_grid(toroidal):
+    """Сетка 2x2 на торе: соседние клетки повторяются, пары - нет"""
+    x, y = points(50, 2)
+    grid = SpatialHash(WIDTH, HEIGHT, WIDTH / 2.5)
+    grid.build(x, y, toroidal)
+    assert close_pairs(x, y, WIDTH / 2.5, toroidal) <= candidates(grid.pairs())
+
+
+@pytest.mark.parametrize("toroidal", [False, True])
+def test_neighbour_list_covers_pairs_until_rebuild(toroidal):
+    skin = 20.0
+    x, y = points(500, 3)
+    rng = np.random.default_rng(4)
+    neighbours = NeighbourList(CUTOFF, skin)
+    assert neighbours.update(x, y, 1, WIDTH, HEIGHT, toroidal)
+    assert candidates(neighbours.pairs()) == close_pairs(x, y, CUTOFF + skin, toroidal)
+    rebuilds = 0
+    for _ in range(30):
+        x = x + rng.uniform(-2, 2, len(x))
+        y = y + rng.uniform(-2, 2, len(y))
+        if toroidal:
+            x %= WIDTH
+            y %= HEIGHT
+        rebuilds += neighbours.update(x, y, 1, WIDTH, HEIGHT, toroidal)
+        # Пары ближе cutoff в списке и без пересборки
+        assert close_pairs(x, y, CUTOFF, toroidal) <= candidates(neighbours.pairs(97))
+    assert 0 < rebuilds < 30
+    assert neighbours.update(x, y, 2, WIDTH, HEIGHT, toroidal)     # Другой набор частиц
@@ -0,0 +1,33 @@
+"""Сверка с эталонными отпечатками в headless.py"""
+import pytest
+import headless
+
+
+def check(golden, *args):
+    """Код выхода headless.py --check-hashes golden"""
+    try:
+        headless.main(["--seed", "1", "--count", "200", "--check-hashes", str(golden), *args])
+    except SystemExit as exit:
+        return exit.code
+    return 0
+
+
+@pytest.fixture
+def golden(tmp_path):
+    path = tmp_path / "golden.jsonl"
+    headless.main(["--seed", "1", "--count", "200", "--steps", "20", "--hash-every", "10",
+                   "--record-hashes", str(path)])
+    return path
+
+
+def test_golden_steps_checked_without_hash_every(golden):
+    assert check(golden, "--steps", "20") == 0
+    assert check(golden, "--steps", "20", "--seed", "2") == 1
+
+
+def test_unreached_golden_step_fails(golden):
+    assert check(golden, "--steps", "15") == 1
+
+
+def test_step_missing_from_golden_fails(golden):
+    assert check(golden, "--steps", "20", "--hash-every", "5") == 1
@@ -0,0 +1,27 @@
+"""Движок "parallel": результат шага не зависит от числа процессов"""
+import pytest
+import physics
+
+
+def run_hash(workers, toroidal, steps=25):
+    physics.seed(1)
+    physics.ENGINE = "parallel"
+    physics.WORKERS = workers
+    physics.parallel_forces = None
+    physics.NODE_COUNT = 1500
+    physics.boundaries_enabled = not toroidal
+    physics.setup(1600, 900)
+    physics.init_simulation()
+    try:
+        for _ in range(steps):
+            physics.logic()
+    finally:
+        physics.parallel_forces.close()
+    return physics.state_hash(), len(physics.bonds)
+
+
+@pytest.mark.parametrize("toroidal", [False, True])
+def test_same_hash_for_one_and_two_workers(toroidal):
+    single = run_hash(1, toroidal)
+    assert single[1] > 0
+    assert run_hash(2, toroidal) == single
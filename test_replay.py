@@ -0,0 +1,44 @@
+"""Проигрывание траекторий: темп по номерам шагов кадров"""
+import pytest
+import physics
+import statefile
+from scheduler import ReplayRunner, Snapshot
+
+
+@pytest.fixture
+def world():
+    physics.seed(1)
+    physics.ENGINE = "numpy"
+    physics.NODE_COUNT = 100
+    physics.setup(400, 300)
+    physics.init_simulation()
+
+
+def record(path, frames, every):
+    writer = statefile.TrajectoryWriter(path)
+    for _ in range(frames):
+        for _ in range(every):
+            physics.logic()
+        writer.append(Snapshot.capture())
+    writer.close()
+    return statefile.Trajectory(path)
+
+
+def test_replay_paced_by_steps(world, tmp_path):
+    trajectory = record(tmp_path / "run.ptraj", 10, 3)
+    runner = ReplayRunner(trajectory, 60)
+    start = runner.position
+    runner.frame(0.25)     # 15 шагов - 5 кадров по 3 шага
+    assert runner.position == start + 15
+    assert runner.index() == 5
+    runner.seek(-2)
+    assert runner.index() == 3
+    runner.frame(10)
+    assert runner.index() == len(trajectory) - 1
+
+
+def test_empty_trajectory_is_rejected(world, tmp_path):
+    trajectory = record(tmp_path / "empty.ptraj", 0, 1)
+    assert len(trajectory) == 0
+    with pytest.raises(ValueError, match="нет кадров"):
+        ReplayRunner(trajectory, 60)
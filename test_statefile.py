@@ -0,0 +1,51 @@
+"""Сохранение и загрузка состояния: продолжение совпадает с непрерывным запуском"""
+import pytest
+import physics
+import statefile
+
+
+def start(precision, seed=1, count=300):
+    physics.seed(seed)
+    physics.PRECISION = precision
+    physics.ENGINE = "numpy"
+    physics.NODE_COUNT = count
+    physics.boundaries_enabled = True
+    physics.setup(800, 600)
+    physics.init_simulation()
+
+
+def run(steps):
+    for _ in range(steps):
+        physics.logic()
+
+
+@pytest.mark.parametrize("precision", ["f8", "f4"])
+def test_resume_matches_continuous_run(tmp_path, precision):
+    start(precision)
+    run(60)
+    expected = physics.state_hash()
+
+    start(precision)
+    run(30)
+    path = tmp_path / "run.pstate"
+    statefile.save(path)
+    physics.PRECISION = "f8" if precision == "f4" else "f4"    # Точность берется из файла
+    physics.clear_screen()
+    statefile.load(path)
+    assert physics.particles.dtype == precision
+    run(30)
+    assert physics.state_hash() == expected
+
+
+def test_old_file_without_precision_loads_as_f8(tmp_path):
+    start("f4")
+    path = tmp_path / "old.pstate"
+    statefile.save(path)
+    data = path.read_bytes()
+    header, offset = statefile._read_header(data, statefile.STATE_MAGIC)
+    del header["precision"]
+    with open(path, "wb") as f:
+        statefile._write_header(f, statefile.STATE_MAGIC, header)
+        f.write(data[offset:])
+    statefile.load(path)
+    assert physics.particles.dtype == "f8"
@@ -0,0 +1,135 @@
+"""Раздача кадров stream.py: сервер на свободном порту и StreamRunner в том же процессе"""
+import asyncio
+import threading
+import time
+import numpy as np
+import pytest
+import physics
+from scheduler import Snapshot
+from stream import QUANT, StreamServer, StreamRunner
+
+
+class Feed:
+    """Вместо runner физики: сервер раздает снимок, который задал тест"""
+
+    def __init__(self):
+        self.snap = Snapshot.capture()
+
+    def latest(self):
+        return self.snap
+
+
+class Server:
+    """StreamServer на 127.0.0.1 с портом от системы в фоновом потоке"""
+
+    def __init__(self, feed):
+        self.server = StreamServer(feed, fps=200)
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        assert self.ready.wait(5)
+
+    def _run(self):
+        try:
+            self.loop.run_until_complete(self.server.serve("127.0.0.1", 0, self._ready))
+        except asyncio.CancelledError:
+            pass
+
+    def _ready(self, address):
+        self.port = address[1]
+        self.ready.set()
+
+    def stop(self):
+        def cancel():
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+        self.loop.call_soon_threadsafe(cancel)
+        self.thread.join(5)
+
+
+def wait_for(runner, step, timeout=5):
+    """Снимок клиента с шагом step"""
+    deadline = time.monotonic() + timeout
+    while runner.latest().step != step:
+        assert time.monotonic() < deadline, f"нет кадра шага {step}"
+        time.sleep(0.005)
+    return runner.latest()
+
+
+def bond_set(a, b):
+    return {(min(i, j), max(i, j)) for i, j in zip(np.asarray(a).tolist(), np.asarray(b).tolist())}
+
+
+def check(snap, sent):
+    """Позиции - с точностью квантования, связи - точно"""
+    assert len(snap) == len(sent)
+    assert np.abs(snap.x - sent.x).max() <= sent.width / QUANT
+    assert np.abs(snap.y - sent.y).max() <= sent.height / QUANT
+    assert np.array_equal(snap.type, sent.type)
+    assert bond_set(snap.bond_a, snap.bond_b) == bond_set(sent.bond_a, sent.bond_b)
+
+
+@pytest.fixture
+def stream():
+    physics.seed(1)
+    physics.ENGINE = "numpy"
+    physics.NODE_COUNT = 300
+    physics.boundaries_enabled = True
+    physics.setup(800, 600)
+    physics.init_simulation()
+    for _ in range(20):
+        physics.logic()
+    feed = Feed()
+    server = Server(feed)
+    runner = StreamRunner("127.0.0.1", server.port)
+    yield feed, server, runner
+    runner.close()
+    server.stop()
+
+
+def test_keyframe_then_deltas(stream):
+    feed, _, runner = stream
+    check(wait_for(runner, feed.snap.step), feed.snap)
+    assert runner.decoder.version == feed.snap.version
+
+    bonds = physics.bonds
+    removed = bond_set(*(view[:5].tolist() for view in bonds.views()))
+    for _ in range(3):
+        physics.logic()
+        for i, j in removed:
+            if bonds.linked(i, j):
+                bonds.remove(i, j)
+        # Новые связи между несвязанными частицами
+        added = [(i, i + 1) for i in range(0, 40, 2) if not bonds.linked(i, i + 1)][:3]
+        for i, j in added:
+            bonds.add(i, j)
+        version = physics.particles.version
+        feed.snap = Snapshot.capture()
+        assert feed.snap.version == version     # Тот же набор частиц - разница, а не полный кадр
+        snap = wait_for(runner, feed.snap.step)
+        check(snap, feed.snap)
+        got = bond_set(snap.bond_a, snap.bond_b)
+        assert set(added) <= got
+        assert not removed & got
+
+
+def test_keyframe_after_particles_change(stream):
+    feed, _, runner = stream
+    wait_for(runner, feed.snap.step)
+    physics.particles.add(0, 10.0, 10.0)
+    physics.logic()
+    feed.snap = Snapshot.capture()
+    check(wait_for(runner, feed.snap.step), feed.snap)
+    assert runner.decoder.version == feed.snap.version
+
+
+def test_lost_connection_is_reported(stream):
+    feed, server, runner = stream
+    wait_for(runner, feed.snap.step)
+    server.stop()
+    deadline = time.monotonic() + 5
+    with pytest.raises(ConnectionError):
+        while time.monotonic() < deadline:
+            runner.frame(0)
+            time.sleep(0.01)